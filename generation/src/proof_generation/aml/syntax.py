@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any, TypeVar
 
 from frozendict import frozendict
 
@@ -71,6 +71,31 @@ class Pattern(ABC):
             pattern = pattern.apply_esubst(evar_name, plug)
         return pattern
 
+    def __getstate__(self) -> dict[str, Any]:
+        # Hashes of strings differ between processes, so cached hashes must not be pickled
+        state = dict(self.__dict__)
+        state.pop('_hash', None)
+        return state
+
+
+PatternType = TypeVar('PatternType', bound=type[Pattern])
+
+
+def cached_hash(cls: PatternType) -> PatternType:
+    """Cache the hash generated by the dataclass, as patterns are immutable and often deeply nested."""
+    fields_hash = cls.__hash__
+
+    def _cached_hash(self: Pattern) -> int:
+        try:
+            return self.__dict__['_hash']
+        except KeyError:
+            value = fields_hash(self)
+            object.__setattr__(self, '_hash', value)
+            return value
+
+    cls.__hash__ = _cached_hash  # type: ignore
+    return cls
+
 
 @dataclass(frozen=True)
 class EVar(Pattern):
@@ -187,6 +212,7 @@ class Symbol(Pattern):
         return None
 
 
+@cached_hash
 @dataclass(frozen=True)
 class Implies(Pattern):
     left: Pattern
@@ -206,7 +232,10 @@ class Implies(Pattern):
     def instantiate(self, delta: Mapping[int, Pattern]) -> Pattern:
         if not delta:
             return self
-        return Implies(self.left.instantiate(delta), self.right.instantiate(delta))
+        left, right = self.left.instantiate(delta), self.right.instantiate(delta)
+        if left is self.left and right is self.right:
+            return self
+        return Implies(left, right)
 
     def apply_esubst(self, evar_id: int, plug: Pattern) -> Pattern:
         return Implies(self.left.apply_esubst(evar_id, plug), self.right.apply_esubst(evar_id, plug))
@@ -225,6 +254,7 @@ def imp(p1: Pattern, p2: Pattern) -> Pattern:
     return Implies(p1, p2)
 
 
+@cached_hash
 @dataclass(frozen=True)
 class App(Pattern):
     left: Pattern
@@ -244,7 +274,10 @@ class App(Pattern):
     def instantiate(self, delta: Mapping[int, Pattern]) -> Pattern:
         if not delta:
             return self
-        return App(self.left.instantiate(delta), self.right.instantiate(delta))
+        left, right = self.left.instantiate(delta), self.right.instantiate(delta)
+        if left is self.left and right is self.right:
+            return self
+        return App(left, right)
 
     def apply_esubst(self, evar_id: int, plug: Pattern) -> Pattern:
         return App(self.left.apply_esubst(evar_id, plug), self.right.apply_esubst(evar_id, plug))
@@ -259,6 +292,7 @@ class App(Pattern):
         return self.pretty(PrettyOptions())
 
 
+@cached_hash
 @dataclass(frozen=True)
 class Exists(Pattern):
     var: int
@@ -276,7 +310,10 @@ class Exists(Pattern):
     def instantiate(self, delta: Mapping[int, Pattern]) -> Pattern:
         if not delta:
             return self
-        return Exists(self.var, self.subpattern.instantiate(delta))
+        subpattern = self.subpattern.instantiate(delta)
+        if subpattern is self.subpattern:
+            return self
+        return Exists(self.var, subpattern)
 
     def apply_esubst(self, evar_id: int, plug: Pattern) -> Pattern:
         if evar_id == self.var:
@@ -301,6 +338,7 @@ class Exists(Pattern):
         return None
 
 
+@cached_hash
 @dataclass(frozen=True)
 class Mu(Pattern):
     var: int
@@ -323,7 +361,10 @@ class Mu(Pattern):
     def instantiate(self, delta: Mapping[int, Pattern]) -> Pattern:
         if not delta:
             return self
-        return Mu(self.var, self.subpattern.instantiate(delta))
+        subpattern = self.subpattern.instantiate(delta)
+        if subpattern is self.subpattern:
+            return self
+        return Mu(self.var, subpattern)
 
     def apply_esubst(self, evar_id: int, plug: Pattern) -> Pattern:
         return Mu(self.var, self.subpattern.apply_esubst(evar_id, plug))
@@ -406,6 +447,7 @@ phi3 = MetaVar(3)
 phi4 = MetaVar(4)
 
 
+@cached_hash
 @dataclass(frozen=True)
 class ESubst(Pattern):
     """
@@ -459,6 +501,7 @@ class ESubst(Pattern):
         return self.pretty(PrettyOptions())
 
 
+@cached_hash
 @dataclass(frozen=True)
 class SSubst(Pattern):
     """
@@ -509,6 +552,7 @@ class SSubst(Pattern):
 InstantiationDict = frozendict[int, Pattern]
 
 
+@cached_hash
 @dataclass(frozen=True)
 class Instantiate(Pattern):
     """Constructor for an unsimplified Instantiated Pattern.
@@ -549,7 +593,11 @@ class Instantiate(Pattern):
     def instantiate(self, delta: Mapping[int, Pattern]) -> Pattern:
         instantiated_subst = frozendict({k: v.instantiate(delta) for k, v in self.inst.items()})
         unshadowed_delta = {k: v for k, v in delta.items() if k not in self.inst}
-        return Instantiate(self.pattern.instantiate(unshadowed_delta), instantiated_subst)
+        pattern = self.pattern.instantiate(unshadowed_delta)
+        if pattern is self.pattern and all(instantiated_subst[k] is v for k, v in self.inst.items()):
+            # Unchanged subpatterns are shared with the original pattern
+            return self
+        return Instantiate(pattern, instantiated_subst)
 
     def apply_esubst(self, evar_id: int, plug: Pattern) -> Pattern:
         if not self.pattern.evar_is_fresh_ignoring_metavars(evar_id, frozenset(self.inst.keys())):
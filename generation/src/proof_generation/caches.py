@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import TYPE_CHECKING, ParamSpec, TypeVar
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+    from functools import _lru_cache_wrapper
+
+T = TypeVar('T')
+P = ParamSpec('P')
+
+DEFAULT_MAXSIZE = 1 << 14
+
+
+@dataclass(frozen=True)
+class CacheStats:
+    name: str
+    hits: int
+    misses: int
+    size: int
+    maxsize: int | None
+    pinned: bool
+
+
+@dataclass
+class _RegisteredCache:
+    function: _lru_cache_wrapper
+    pinned: bool
+
+
+_registry: dict[str, _RegisteredCache] = {}
+
+
+def registered_cache(
+    maxsize: int | None = DEFAULT_MAXSIZE, pinned: bool = False
+) -> Callable[[Callable[P, T]], Callable[P, T]]:
+    """
+    Memoize the function with a LRU cache of the given size and register it for statistics and resetting.
+    Pinned caches are unbounded and never reset, use them for functions whose results are compared by identity.
+    """
+
+    def decorator(func: Callable[P, T]) -> Callable[P, T]:
+        wrapped = lru_cache(maxsize=None if pinned else maxsize)(func)
+        # Decorating a function of the same name again, e.g. on a module reload, replaces its cache
+        _registry[f'{func.__module__}.{func.__qualname__}'] = _RegisteredCache(wrapped, pinned)
+        return wrapped  # type: ignore
+
+    return decorator
+
+
+def cache_stats() -> list[CacheStats]:
+    stats = []
+    for name, cache in _registry.items():
+        info = cache.function.cache_info()
+        stats.append(CacheStats(name, info.hits, info.misses, info.currsize, info.maxsize, cache.pinned))
+    return stats
+
+
+def reset_caches() -> None:
+    """Drop the entries of all caches which are not pinned, e.g. between two proofs."""
+    for cache in _registry.values():
+        if not cache.pinned:
+            cache.function.cache_clear()
+
+
+def print_cache_stats() -> None:
+    for stats in cache_stats():
+        limit = 'pinned' if stats.pinned else f'max {stats.maxsize}'
+        print(f'{stats.name}: {stats.size} entries ({limit}), {stats.hits} hits, {stats.misses} misses')
@@ -0,0 +1,319 @@
+from __future__ import annotations
+
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+from proof_generation.aml import App, ESubst, EVar, Exists, Implies, MetaVar, Mu, SSubst, SVar, Symbol, bot
+from proof_generation.instruction import Instruction
+from proof_generation.interpreter import ExecutionPhase
+from proof_generation.proved import Proved
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator, Mapping
+
+    from proof_generation.aml import Pattern
+
+
+@dataclass
+class CostFeatures:
+    """What the checker does while executing some instructions, as far as its running time is concerned."""
+
+    opcodes: Counter[Instruction] = field(default_factory=Counter)
+    # Nodes of the patterns compared for equality by modus ponens and by publishing a proof
+    compared_nodes: int = 0
+    # Nodes of the terms traversed by instantiations
+    instantiated_nodes: int = 0
+    # Memory locations read by the instructions
+    loaded: set[int] = field(default_factory=set)
+
+    @property
+    def instructions(self) -> int:
+        return sum(self.opcodes.values())
+
+    def __iadd__(self, other: CostFeatures) -> CostFeatures:
+        self.opcodes.update(other.opcodes)
+        self.compared_nodes += other.compared_nodes
+        self.instantiated_nodes += other.instantiated_nodes
+        self.loaded |= other.loaded
+        return self
+
+
+@dataclass
+class CostProfile:
+    """Features of a (gamma, claims, proof) triple, split by the item published by each part of the buffers."""
+
+    # One entry per axiom, claim and proof, in the order they are published
+    axioms: list[CostFeatures]
+    claims: list[CostFeatures]
+    proofs: list[CostFeatures]
+    # Axioms, by their position in the gamma phase, loaded by every proof
+    loaded_axioms: list[set[int]]
+    # Instructions which do not end with a publication, e.g. a trailing pop
+    rest: CostFeatures = field(default_factory=CostFeatures)
+
+    def total(self) -> CostFeatures:
+        total = CostFeatures()
+        for features in (*self.axioms, *self.claims, *self.proofs, self.rest):
+            total += features
+        return total
+
+
+class _Simulator:
+    """Replays serialized instructions with the semantics of the checker to measure what they cost."""
+
+    def __init__(self) -> None:
+        self.stack: list[Pattern | Proved] = []
+        self.memory: list[Pattern | Proved] = []
+        self.claims: list[Pattern] = []
+        # Memory locations of the axioms published in the gamma phase
+        self.axiom_locations: list[int] = []
+        # Pattern sizes by identity, the patterns are kept alive to keep their identifiers unique
+        self._sizes: dict[int, tuple[Pattern, int]] = {}
+
+    def size(self, p: Pattern) -> int:
+        cached = self._sizes.get(id(p))
+        if cached is not None:
+            return cached[1]
+        match p:
+            case Implies(left, right) | App(left, right):
+                ret = 1 + self.size(left) + self.size(right)
+            case Exists(_, subpattern) | Mu(_, subpattern):
+                ret = 1 + self.size(subpattern)
+            case ESubst(pattern, _, plug) | SSubst(pattern, _, plug):
+                ret = 1 + self.size(pattern) + self.size(plug)
+            case _:
+                ret = 1
+        self._sizes[id(p)] = (p, ret)
+        return ret
+
+    def pop_pattern(self) -> Pattern:
+        term = self.stack.pop()
+        assert not isinstance(term, Proved), 'Expected a pattern on the stack'
+        return term
+
+    def pop_proved(self) -> Proved:
+        term = self.stack.pop()
+        assert isinstance(term, Proved), 'Expected a proved pattern on the stack'
+        return term
+
+    def run(self, buffer: bytes, phase: ExecutionPhase) -> Iterator[CostFeatures]:
+        """Execute the buffer and yield the features of every publication and then of the remaining instructions."""
+        phi0, phi1, phi2 = MetaVar(0), MetaVar(1), MetaVar(2)
+        operands = iter(buffer)
+        features = CostFeatures()
+        self.stack = []
+
+        def read_list() -> tuple[int, ...]:
+            return tuple(next(operands) for _ in range(next(operands)))
+
+        for byte in operands:
+            instruction = Instruction(byte)
+            features.opcodes[instruction] += 1
+            match instruction:
+                case Instruction.EVar:
+                    self.stack.append(EVar(next(operands)))
+                case Instruction.SVar:
+                    self.stack.append(SVar(next(operands)))
+                case Instruction.Symbol:
+                    self.stack.append(Symbol(str(next(operands))))
+                case Instruction.CleanMetaVar:
+                    self.stack.append(MetaVar(next(operands)))
+                case Instruction.MetaVar:
+                    name = next(operands)
+                    e_fresh, s_fresh, positive, negative, app_ctx_holes = (read_list() for _ in range(5))
+                    self.stack.append(
+                        MetaVar(
+                            name,
+                            tuple(map(EVar, e_fresh)),
+                            tuple(map(SVar, s_fresh)),
+                            tuple(map(SVar, positive)),
+                            tuple(map(SVar, negative)),
+                            tuple(map(EVar, app_ctx_holes)),
+                        )
+                    )
+                case Instruction.Implies | Instruction.App:
+                    right = self.pop_pattern()
+                    left = self.pop_pattern()
+                    self.stack.append(Implies(left, right) if instruction == Instruction.Implies else App(left, right))
+                case Instruction.Exists:
+                    self.stack.append(Exists(next(operands), self.pop_pattern()))
+                case Instruction.Mu:
+                    self.stack.append(Mu(next(operands), self.pop_pattern()))
+                case Instruction.ESubst | Instruction.SSubst:
+                    var = next(operands)
+                    pattern = self.pop_pattern()
+                    plug = self.pop_pattern()
+                    assert isinstance(pattern, MetaVar | ESubst | SSubst)
+                    if instruction == Instruction.ESubst:
+                        self.stack.append(ESubst(pattern, EVar(var), plug))
+                    else:
+                        self.stack.append(SSubst(pattern, SVar(var), plug))
+                case Instruction.Prop1:
+                    self.stack.append(Proved(Implies(phi0, Implies(phi1, phi0))))
+                case Instruction.Prop2:
+                    self.stack.append(
+                        Proved(
+                            Implies(
+                                Implies(phi0, Implies(phi1, phi2)), Implies(Implies(phi0, phi1), Implies(phi0, phi2))
+                            )
+                        )
+                    )
+                case Instruction.Prop3:
+                    self.stack.append(Proved(Implies(Implies(Implies(phi0, bot()), bot()), phi0)))
+                case Instruction.Quantifier:
+                    self.stack.append(Proved(Implies(ESubst(phi0, EVar(0), EVar(1)), Exists(0, phi0))))
+                case Instruction.ModusPonens:
+                    premise = self.pop_proved()
+                    implication = self.pop_proved()
+                    left, right = Implies.extract(implication.conclusion)
+                    features.compared_nodes += self.size(premise.conclusion)
+                    self.stack.append(Proved(right))
+                case Instruction.Generalization:
+                    left, right = Implies.extract(self.pop_proved().conclusion)
+                    self.stack.append(Proved(Implies(Exists(next(operands), left), right)))
+                case Instruction.Instantiate:
+                    ids = read_list()
+                    term = self.stack.pop()
+                    delta = {id: self.pop_pattern() for id in ids}
+                    if isinstance(term, Proved):
+                        features.instantiated_nodes += self.size(term.conclusion)
+                        self.stack.append(Proved(term.conclusion.instantiate(delta)))
+                    else:
+                        features.instantiated_nodes += self.size(term)
+                        self.stack.append(term.instantiate(delta))
+                case Instruction.Pop:
+                    self.stack.pop()
+                case Instruction.Save:
+                    self.memory.append(self.stack[-1])
+                case Instruction.Load:
+                    location = next(operands)
+                    features.loaded.add(location)
+                    self.stack.append(self.memory[location])
+                case Instruction.Publish:
+                    match phase:
+                        case ExecutionPhase.Gamma:
+                            self.axiom_locations.append(len(self.memory))
+                            self.memory.append(Proved(self.pop_pattern()))
+                        case ExecutionPhase.Claim:
+                            self.claims.append(self.pop_pattern())
+                        case ExecutionPhase.Proof:
+                            claim = self.claims.pop()
+                            assert self.pop_proved().conclusion == claim, 'The proof does not prove its claim'
+                            features.compared_nodes += self.size(claim)
+                    yield features
+                    features = CostFeatures()
+                case _:
+                    raise NotImplementedError(f'Cost of {instruction.name} is not modelled')
+        yield features
+
+
+def profile_proof(gamma: bytes, claims: bytes, proof: bytes) -> CostProfile:
+    """Replay a serialized (gamma, claims, proof) triple and measure the features of everything it publishes."""
+    simulator = _Simulator()
+    *axioms, rest = simulator.run(gamma, ExecutionPhase.Gamma)
+    *claim_features, claims_rest = simulator.run(claims, ExecutionPhase.Claim)
+    *proofs, proofs_rest = simulator.run(proof, ExecutionPhase.Proof)
+    rest += claims_rest
+    rest += proofs_rest
+
+    axiom_indices = {location: i for i, location in enumerate(simulator.axiom_locations)}
+    loaded_axioms = [
+        {axiom_indices[location] for location in features.loaded if location in axiom_indices} for features in proofs
+    ]
+    # Claims are published in reverse order, but proved in order
+    return CostProfile(axioms, list(reversed(claim_features)), proofs, loaded_axioms, rest)
+
+
+@dataclass(frozen=True)
+class CostModel:
+    """Linear model of the checker cycles: a fixed cost, a cost per opcode and costs per traversed pattern node."""
+
+    base: float
+    instruction_costs: Mapping[Instruction, float]
+    compared_node: float
+    instantiated_node: float
+
+    def estimate(self, features: CostFeatures, with_base: bool = True) -> float:
+        cycles = self.base if with_base else 0.0
+        for instruction, count in features.opcodes.items():
+            cycles += count * self.instruction_costs[instruction]
+        return (
+            cycles + self.compared_node * features.compared_nodes + self.instantiated_node * features.instantiated_nodes
+        )
+
+
+def calibrate(samples: list[tuple[CostFeatures, int]], instruction_cost: bool = False) -> CostModel:
+    """
+    Fit the model to measured cycle counts, minimizing the relative error.
+    Measurements are too few to tell opcodes apart. With instruction_cost all of them get the same fitted cost,
+    otherwise the instructions cost nothing beyond the pattern nodes they traverse.
+    """
+    rows = [
+        (
+            [
+                1.0,
+                *((float(features.instructions),) if instruction_cost else ()),
+                float(features.compared_nodes),
+                float(features.instantiated_nodes),
+            ],
+            cycles,
+        )
+        for features, cycles in samples
+    ]
+    n = len(rows[0][0])
+    assert len(rows) >= n, 'At least as many samples as parameters are needed'
+    # Normal equations of the least squares problem weighted by the inverse of the measurements
+    matrix = [[sum(x[i] * x[j] / (y * y) for x, y in rows) for j in range(n)] for i in range(n)]
+    vector = [sum(x[i] / y for x, y in rows) for i in range(n)]
+    base, *per_instruction, compared_node, instantiated_node = _solve(matrix, vector)
+    instruction_costs = dict.fromkeys(Instruction, per_instruction[0] if instruction_cost else 0.0)
+    return CostModel(base, instruction_costs, compared_node, instantiated_node)
+
+
+def leave_one_out_errors(samples: list[tuple[CostFeatures, int]], instruction_cost: bool = False) -> list[float]:
+    """
+    The relative error of the estimate of each sample by the model calibrated on the other samples.
+    Samples with the same features as the left out one are left out as well, as they would give its answer away.
+    """
+    errors = []
+    for features, cycles in samples:
+        model = calibrate([sample for sample in samples if sample[0] != features], instruction_cost)
+        errors.append((model.estimate(features) - cycles) / cycles)
+    return errors
+
+
+def _solve(matrix: list[list[float]], vector: list[float]) -> list[float]:
+    """Gaussian elimination with partial pivoting."""
+    n = len(vector)
+    rows = [row[:] + [value] for row, value in zip(matrix, vector, strict=True)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(rows[r][col]))
+        rows[col], rows[pivot] = rows[pivot], rows[col]
+        assert rows[col][col] != 0, 'The samples do not determine the model'
+        for r in range(n):
+            if r != col:
+                factor = rows[r][col] / rows[col][col]
+                rows[r] = [a - factor * b for a, b in zip(rows[r], rows[col], strict=True)]
+    return [rows[i][n] / rows[i][i] for i in range(n)]
+
+
+# Risc0 v0.16.1 cycles of the checker in Performance.md, measured on the proofs in proofs/translated
+PUBLISHED_CYCLES = {
+    'impreflex-compressed-goal': 67460,
+    'perceptron-goal': 3212385,
+    'svm5-goal': 3212385,
+    'transfer-batch-1k-goal': 6722986,
+    'transfer-simple-compressed-goal': 1142529,
+    'transfer-task-specific': 89319,
+}
+
+# Result of calibrate on PUBLISHED_CYCLES. Their five distinct proofs leave few degrees of freedom, so the accuracy is
+# that of leave_one_out_errors: within 18% of every measurement, at worst 17.5% for transfer-batch-1k-goal.
+# A cost per instruction fits the samples as well, but is off by 228% on transfer-batch-1k-goal when left out.
+DEFAULT_COST_MODEL = CostModel(
+    base=61237.86,
+    instruction_costs=dict.fromkeys(Instruction, 0.0),
+    compared_node=81.09,
+    instantiated_node=334.46,
+)
@@ -0,0 +1,315 @@
+from __future__ import annotations
+
+import asyncio
+import base64
+import io
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import tempfile
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import redirect_stdout
+from pathlib import Path
+from time import perf_counter
+from typing import TYPE_CHECKING, Any
+
+from proof_generation.k.proof_gen import generate_proofs, get_language_semantics
+from proof_generation.metamath.converter.converter import MetamathConverter
+from proof_generation.metamath.parser import load_database
+from proof_generation.metamath.translate import TranslatedProofSkeleton
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+    from proof_generation.k.kore_convertion.language_semantics import LanguageSemantics
+
+DEFAULT_SOCKET = Path(tempfile.gettempdir()) / f'proof-generation-{os.getuid()}.sock'
+# Inlined proofs are sent as a single line, so the default limit of asyncio streams is far too small
+MAX_MESSAGE_SIZE = 1 << 30
+
+BINARY_SUFFIXES = ('.ml-gamma', '.ml-claim', '.ml-proof')
+PRETTY_SUFFIXES = ('.pretty-gamma', '.pretty-claim', '.pretty-proof')
+
+Request = dict[str, Any]
+Response = dict[str, Any]
+
+
+class WarmState:
+    """
+    Metamath databases and language semantics kept loaded between requests.
+    Entries are reloaded when the modification time of their source file changes.
+    """
+
+    def __init__(self) -> None:
+        self._converters: dict[str, tuple[int, MetamathConverter]] = {}
+        self._semantics: dict[str, tuple[int, LanguageSemantics]] = {}
+
+    def converter(self, database: str) -> MetamathConverter:
+        path = os.path.realpath(database)
+        mtime = os.stat(path).st_mtime_ns
+        cached = self._converters.get(path)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, MetamathConverter(load_database(path, include_proof=True)))
+            self._converters[path] = cached
+        return cached[1]
+
+    def semantics(self, kompiled: str) -> LanguageSemantics:
+        kompiled_dir = Path(kompiled).resolve()
+        mtime = (kompiled_dir / 'definition.kore').stat().st_mtime_ns
+        cached = self._semantics.get(str(kompiled_dir))
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, get_language_semantics(kompiled_dir))
+            self._semantics[str(kompiled_dir)] = cached
+        return cached[1]
+
+    def loaded(self) -> dict[str, list[str]]:
+        return {'databases': list(self._converters), 'kompiled': list(self._semantics)}
+
+
+# The state of the current process. The daemon preloads it before forking the workers, so they inherit it,
+# while whatever a worker loads later stays warm for the next requests handled by the same worker
+_state = WarmState()
+
+
+def _translate(request: Request, output_dir: Path) -> list[Path]:
+    converter = _state.converter(request['database'])
+    module = request.get('module') or Path(request['database']).stem
+    TranslatedProofSkeleton(converter, request['target']).main(['', '--optimize', 'binary', str(output_dir), module])
+    return [(output_dir / module).with_suffix(suffix) for suffix in BINARY_SUFFIXES]
+
+
+def _prove(request: Request, output_dir: Path) -> list[Path]:
+    kompiled = request['kompiled']
+    semantics = _state.semantics(kompiled)
+    module = request.get('module') or Path(kompiled).resolve().name.removesuffix('-kompiled')
+    pretty = bool(request.get('pretty', False))
+    generate_proofs(semantics, module, request['hints'], str(output_dir), pretty)
+    slice_name = Path(request['hints']).stem + '.' + module
+    return [
+        (output_dir / slice_name).with_suffix(suffix) for suffix in (PRETTY_SUFFIXES if pretty else BINARY_SUFFIXES)
+    ]
+
+
+def _run(request: Request, output_dir: Path) -> list[Path]:
+    match request.get('command'):
+        case 'translate':
+            return _translate(request, output_dir)
+        case 'prove':
+            return _prove(request, output_dir)
+        case command:
+            raise ValueError(f'Unknown command {command}')
+
+
+def handle_request(request: Request) -> Response:
+    """
+    Process a translation or proof generation request and report the outcome instead of raising.
+    Without an output directory in the request the proof files are returned inline, base64 encoded.
+    """
+    log = io.StringIO()
+    start = perf_counter()
+    response: Response
+    try:
+        with redirect_stdout(log):
+            if request.get('output_dir') is not None:
+                output_dir = Path(request['output_dir'])
+                output_dir.mkdir(parents=True, exist_ok=True)
+                outputs = _run(request, output_dir)
+                response = {'ok': True, 'outputs': [str(output) for output in outputs]}
+            else:
+                with tempfile.TemporaryDirectory() as tmp_dir:
+                    outputs = _run(request, Path(tmp_dir))
+                    files = {output.name: base64.b64encode(output.read_bytes()).decode() for output in outputs}
+                response = {'ok': True, 'files': files}
+    except Exception as e:
+        response = {'ok': False, 'error': f'{type(e).__name__}: {e}'}
+    response['time'] = perf_counter() - start
+    response['log'] = log.getvalue()
+    return response
+
+
+class ProofGenerationDaemon:
+    def __init__(self, socket_path: Path = DEFAULT_SOCKET, workers: int = 1) -> None:
+        assert workers > 0
+        self.socket_path = socket_path
+        self.workers = workers
+        self.served = 0
+        self.failed = 0
+        self._executor: ProcessPoolExecutor | None = None
+        self._stopped: asyncio.Event | None = None
+
+    def preload(self, databases: Iterable[str] = (), kompiled: Iterable[str] = ()) -> None:
+        """Load the given databases and semantics before the workers are forked, so that all of them start warm."""
+        assert self._executor is None, 'Workers have been already started'
+        for database in databases:
+            _state.converter(database)
+        for kompiled_dir in kompiled:
+            _state.semantics(kompiled_dir)
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        # Forked workers inherit the imports and the preloaded state of the daemon
+        return ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('fork'))
+
+    async def serve(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self._stopped.set)
+
+        self._executor = self._new_executor()
+        self.socket_path.unlink(missing_ok=True)
+        server = await asyncio.start_unix_server(
+            self._handle_connection, path=str(self.socket_path), limit=MAX_MESSAGE_SIZE
+        )
+        try:
+            async with server:
+                await self._stopped.wait()
+        finally:
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.remove_signal_handler(sig)
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+            self.socket_path.unlink(missing_ok=True)
+
+    def stop(self) -> None:
+        assert self._stopped is not None
+        self._stopped.set()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Answer the requests of the connection in order, one JSON object per line."""
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                    assert isinstance(request, dict), 'A request must be a JSON object'
+                except (ValueError, AssertionError) as e:
+                    response: Response = {'ok': False, 'error': f'Malformed request: {e}'}
+                else:
+                    response = await self.dispatch(request)
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, request: Request) -> Response:
+        match request.get('command'):
+            case 'stats':
+                return {
+                    'ok': True,
+                    'workers': self.workers,
+                    'served': self.served,
+                    'failed': self.failed,
+                    'preloaded': _state.loaded(),
+                }
+            case 'shutdown':
+                self.stop()
+                return {'ok': True}
+
+        assert self._executor is not None
+        try:
+            response = await asyncio.get_running_loop().run_in_executor(self._executor, handle_request, request)
+        except BrokenProcessPool:
+            # A worker died, e.g. on a crash in a native library, replace the pool for the next requests
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = self._new_executor()
+            response = {'ok': False, 'error': 'The worker processing the request terminated abruptly'}
+        self.served += 1
+        if not response['ok']:
+            self.failed += 1
+        return response
+
+
+async def send_request(request: Request, socket_path: Path = DEFAULT_SOCKET) -> Response:
+    reader, writer = await asyncio.open_unix_connection(str(socket_path), limit=MAX_MESSAGE_SIZE)
+    try:
+        writer.write(json.dumps(request).encode() + b'\n')
+        await writer.drain()
+        line = await reader.readline()
+    finally:
+        writer.close()
+        await writer.wait_closed()
+    if not line:
+        raise ConnectionError(f'The daemon at {socket_path} closed the connection without answering')
+    response = json.loads(line)
+    assert isinstance(response, dict)
+    return response
+
+
+def main(argv: list[str]) -> int:
+    argparser = ArgumentParser(prog='proof_generation.daemon', description='Proof generation daemon and its client')
+    argparser.add_argument('--socket', type=Path, default=DEFAULT_SOCKET, help='Path to the Unix socket of the daemon')
+    commands = argparser.add_subparsers(dest='command', required=True)
+
+    serve = commands.add_parser('serve', help='Start the daemon')
+    serve.add_argument('-j', '--workers', type=int, default=os.cpu_count() or 1, help='Number of worker processes')
+    serve.add_argument('--preload-database', action='append', default=[], help='Metamath database to load at start')
+    serve.add_argument('--preload-kompiled', action='append', default=[], help='Kompiled directory to load at start')
+
+    translate = commands.add_parser('translate', help='Translate the proof of a lemma from a Metamath database')
+    translate.add_argument('database', type=str, help='Path to the Metamath database')
+    translate.add_argument('target', type=str, help='Lemma whose proof is to be translated')
+    translate.add_argument('--output-dir', type=str, default=str(Path.cwd()), help='Output directory')
+    translate.add_argument('--module', type=str, default=None, help='Name of the output files')
+
+    prove = commands.add_parser('prove', help='Generate the proof of the execution recorded in a hints file')
+    prove.add_argument('kompiled', type=str, help='Path to the kompiled directory')
+    prove.add_argument('hints', type=str, help='Path to the binary hints file')
+    prove.add_argument('--proof-dir', type=str, default=str(Path.cwd()), help='Output directory for saving proofs')
+    prove.add_argument('--module', type=str, default=None, help='The module name')
+    prove.add_argument('--pretty', action='store_true', default=False, help='Print the pretty-printed proofs')
+
+    commands.add_parser('stats', help='Print the statistics of the daemon')
+    commands.add_parser('shutdown', help='Stop the daemon')
+
+    for command in (translate, prove):
+        command.add_argument('-v', '--verbose', action='store_true', default=False, help='Print the log of the worker')
+
+    args = argparser.parse_args(argv)
+
+    if args.command == 'serve':
+        daemon = ProofGenerationDaemon(args.socket, args.workers)
+        daemon.preload(args.preload_database, args.preload_kompiled)
+        print(f'Listening on {args.socket} with {args.workers} workers')
+        asyncio.run(daemon.serve())
+        return 0
+
+    request: Request = {'command': args.command}
+    # The daemon does not share the working directory of the client
+    if args.command == 'translate':
+        request |= {
+            'database': os.path.abspath(args.database),
+            'target': args.target,
+            'output_dir': os.path.abspath(args.output_dir),
+            'module': args.module,
+        }
+    elif args.command == 'prove':
+        request |= {
+            'kompiled': os.path.abspath(args.kompiled),
+            'hints': os.path.abspath(args.hints),
+            'output_dir': os.path.abspath(args.proof_dir),
+            'module': args.module,
+            'pretty': args.pretty,
+        }
+
+    response = asyncio.run(send_request(request, args.socket))
+    if getattr(args, 'verbose', False):
+        print(response.get('log', ''), end='')
+    if not response['ok']:
+        print(f'Failed: {response["error"]}', file=sys.stderr)
+        return 1
+    if args.command == 'stats':
+        print(json.dumps({key: value for key, value in response.items() if key != 'ok'}, indent=2))
+    for output in response.get('outputs', []):
+        print(output)
+    if 'time' in response:
+        print(f'Done in {response["time"]:.3f}s')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
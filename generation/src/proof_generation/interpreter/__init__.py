@@ -1,3 +1,4 @@
+from .axiom_usage_interpreter import AxiomUsageInterpreter
 from .basic_interpreter import BasicInterpreter
 from .counting_interpreter import CountingInterpreter
 from .interpreter import ExecutionPhase, Interpreter
@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from ..proved import Proved
+from .stateful_interpreter import StatefulInterpreter
+
+if TYPE_CHECKING:
+    from ..aml import Pattern
+    from ..claim import Claim
+    from .interpreter import ExecutionPhase
+
+
+class AxiomUsageInterpreter(StatefulInterpreter):
+    """Records the proved patterns loaded from the memory, which includes every axiom a proof relies on."""
+
+    def __init__(
+        self,
+        phase: ExecutionPhase,
+        claims: list[Claim] | None = None,
+    ) -> None:
+        super().__init__(phase=phase, claims=claims)
+        self.loaded: set[Pattern] = set()
+
+    def load(self, id: str, term: Pattern | Proved) -> None:
+        super().load(id, term)
+        if isinstance(term, Proved):
+            self.loaded.add(term.conclusion)
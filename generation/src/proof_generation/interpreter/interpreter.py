@@ -5,7 +5,7 @@ from enum import Enum
 from typing import TYPE_CHECKING
 
 if TYPE_CHECKING:
-    from collections.abc import Mapping
+    from collections.abc import Iterable, Mapping
 
     from ..proved import Proved
     from ..aml import Pattern
@@ -33,6 +33,10 @@ class Interpreter(ABC):
     def interpreting_warnings(self) -> list[str]:
         return list(self._interpreting_warnings)
 
+    def add_interpreting_warnings(self, warnings: Iterable[str]) -> None:
+        """Record the warnings of proofs interpreted elsewhere, e.g. by the workers of a parallel proof phase."""
+        self._interpreting_warnings.update(warnings)
+
     def into_claim_phase(self) -> None:
         assert self.phase == ExecutionPhase.Gamma
         self.phase = ExecutionPhase.Claim
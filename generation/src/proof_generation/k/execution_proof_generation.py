@@ -1,11 +1,13 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from functools import cached_property
 from typing import TYPE_CHECKING
 
 import proof_generation.proof as proof
 import proof_generation.proofs.kore as kl
-from proof_generation.aml import Pattern, Symbol
+from proof_generation.aml import Instantiate, Pattern, Symbol
+from proof_generation.caches import registered_cache
 from proof_generation.k.kore_convertion.language_semantics import (
     AxiomType,
     ConvertedAxiom,
@@ -20,6 +22,7 @@ from proof_generation.proofs.definedness import functional
 from proof_generation.proofs.substitution import HOLE, Substitution
 
 if TYPE_CHECKING:
+    from proof_generation.aml import Notation
     from proof_generation.k.kore_convertion.language_semantics import LanguageSemantics
     from proof_generation.k.kore_convertion.rewrite_steps import EventTrace
 
@@ -27,6 +30,57 @@ if TYPE_CHECKING:
 Location = tuple[int, ...]
 
 
+def is_same_configuration(left: Pattern, right: Pattern) -> bool:
+    """Compare patterns that share most of their subpatterns, only the differing subpatterns are compared deeply."""
+    if left is right:
+        return True
+    if (
+        isinstance(left, Instantiate)
+        and isinstance(right, Instantiate)
+        and left.pattern is right.pattern
+        and left.inst.keys() == right.inst.keys()
+        and all(is_same_configuration(value, right.inst[key]) for key, value in left.inst.items())
+    ):
+        return True
+    return left == right
+
+
+@dataclass(frozen=True)
+class ZipperFrame:
+    """A step from an application down to one of its arguments."""
+
+    app: Notation
+    args: tuple[Pattern, ...]
+    index: int
+    parent: ZipperFrame | None
+
+    def plug(self, pattern: Pattern) -> Pattern:
+        return self.app(*self.args[: self.index], pattern, *self.args[self.index + 1 :])
+
+
+@dataclass(frozen=True)
+class PatternZipper:
+    """A subpattern in focus together with the path to plug it back into the whole pattern."""
+
+    focus: Pattern
+    frame: ZipperFrame | None = None
+
+    def down(self, app: Notation, args: tuple[Pattern, ...], index: int) -> PatternZipper:
+        return PatternZipper(args[index], ZipperFrame(app, args, index, self.frame))
+
+    def plug(self, pattern: Pattern) -> Pattern:
+        """Replace the focus with the given pattern, only the applications on the path are rebuilt."""
+        frame = self.frame
+        while frame is not None:
+            pattern = frame.plug(pattern)
+            frame = frame.parent
+        return pattern
+
+    @cached_property
+    def ctx(self) -> Pattern:
+        return self.plug(HOLE)
+
+
 @dataclass
 class SimplificationInfo:
     location: Location
@@ -34,6 +88,8 @@ class SimplificationInfo:
     simplification_result: Pattern
     simplifications_remaining: int
     proof: proof.ProofThunk
+    # Location of the initial pattern in the simplification result of the previous in stack
+    zipper: PatternZipper | None = field(default=None)
 
     def __eq__(self, __value: object) -> bool:
         return (
@@ -50,8 +106,8 @@ class SimplificationProver(proof.ProofExp):
     def __init__(self, language_semantics: LanguageSemantics):
         self.language_semantics = language_semantics
         super().__init__(notations=list(language_semantics.notations))
-        self.subst_proofexp = self.import_module(Substitution())
-        self.kore_lemmas = self.import_module(kl.KoreLemmas())
+        self.subst_proofexp = self.import_module(Substitution.shared())
+        self.kore_lemmas = self.import_module(kl.KoreLemmas.shared())
 
     def apply_framing_lemma(self, equality_proof: proof.ProofThunk, context: Pattern) -> proof.ProofThunk:
         return self.kore_lemmas.equality_with_subst(context, equality_proof)
@@ -137,8 +193,13 @@ class SimplificationProver(proof.ProofExp):
 class SimplificationPerformer:
     def __init__(self, language_semantics: LanguageSemantics, prover: SimplificationProver, init_config: Pattern):
         self._language_semantics = language_semantics
-        self._simplification_stack: list[SimplificationInfo] = []
         self.prover = prover
+        self._simplification_stack: list[SimplificationInfo] = []
+        self.reset(init_config)
+
+    def reset(self, init_config: Pattern) -> None:
+        """Prepare the performer for the next batch of simplifications, the prover is kept."""
+        assert not self.in_simplification, 'Simplification is in progress'
         self.proof: proof.ProofThunk | None = None  # If None, the batch has not been proved yet
         self._current_config = init_config
         # _current_ctx is known only after first location
@@ -168,18 +229,17 @@ class SimplificationPerformer:
 
         # Check that whether it is the first simplification or not
         if not self._simplification_stack:
-            config_with_hole, sub_pattern, location_remained = self._subpattern_search_rec(
-                location, self._current_config, HOLE
-            )
-            assert not location_remained, f'Location {location} is invalid for pattern {str(self._current_config)}'
-            self._curr_subterm = sub_pattern
-            self._current_ctx = config_with_hole
+            zipper = self.zipper(location, self._current_config)
+            self._current_ctx = zipper.ctx
         else:
-            sub_pattern = self.get_subterm(location, self._simplification_stack[-1].simplification_result)
-            self._curr_subterm = sub_pattern
+            zipper = self.zipper(location, self._simplification_stack[-1].simplification_result)
+        sub_pattern = zipper.focus
+        self._curr_subterm = sub_pattern
 
         # Create the new info object and put it on top of the stack
-        new_info = SimplificationInfo(location, sub_pattern, sub_pattern, 0, self.prover.trivial_proof(sub_pattern))
+        new_info = SimplificationInfo(
+            location, sub_pattern, sub_pattern, 0, self.prover.trivial_proof(sub_pattern), zipper
+        )
         self._simplification_stack.append(new_info)
 
     def apply_simplification(self, ordinal: int, substitution: dict[int, Pattern]) -> None:
@@ -219,15 +279,15 @@ class SimplificationPerformer:
     def exit_context(self) -> None:
         while self._simplification_stack and self._simplification_stack[-1].simplifications_remaining == 0:
             child_info = self._simplification_stack.pop()
+            # The simplification result of the parent has not changed since the child was entered
+            assert child_info.zipper is not None
             if self._simplification_stack:
                 # If the stack is non-empty, then we need to update the simplification on top of the stack
                 parent_info = self._simplification_stack[-1]
 
-                parent_config_with_hole = self.make_ctx_pattern(parent_info, child_info.location)
+                parent_config_with_hole = child_info.zipper.ctx
                 parent_info.simplifications_remaining -= 1
-                parent_info.simplification_result = parent_config_with_hole.apply_esubst(
-                    0, child_info.simplification_result
-                )
+                parent_info.simplification_result = child_info.zipper.plug(child_info.simplification_result)
                 parent_info.proof = self.prover.equality_transitivity(
                     parent_info.proof,
                     self.prover.apply_framing_lemma(child_info.proof, parent_config_with_hole),
@@ -235,49 +295,45 @@ class SimplificationPerformer:
             else:
                 # If the stack is empty, then we need to update the current configuration as we processed the batch
                 assert self._current_ctx
-                self._current_config = self._current_ctx.apply_esubst(HOLE.name, child_info.simplification_result)
+                self._current_config = child_info.zipper.plug(child_info.simplification_result)
                 self.proof = child_info.proof
 
     def get_subterm(self, location: Location, pattern: Pattern) -> Pattern:
-        _, found, location_remaining = self._subpattern_search_rec(list(location), pattern, None)
-        assert not location_remaining, f'Location {location} is invalid for pattern {str(pattern)}'
-        return found
+        return self.zipper(location, pattern).focus
 
     def update_subterm(self, location: Location, pattern: Pattern, plug: Pattern) -> Pattern:
-        updated, _, location_remaining = self._subpattern_search_rec(list(location), pattern, plug)
-        assert not location_remaining, f'Location {location} is invalid for pattern {str(pattern)}'
-        return updated
+        return self.zipper(location, pattern).plug(plug)
 
     def make_ctx_pattern(self, info: SimplificationInfo, location: Location) -> Pattern:
-        return self.update_subterm(location, info.simplification_result, HOLE)
-
-    def _subpattern_search_rec(
-        self, loc: list[int], pattern: Pattern, plug: Pattern | None = None
-    ) -> tuple[Pattern, Pattern, list[int]]:
-        """Search for the subpattern at the given location and replace it with the plug."""
-        if not loc:
-            return pattern if not plug else plug, pattern, loc
-
-        next_turn, *loc_remaining = loc
-        symbol, args_tuple = kl.deconstruct_nary_application(pattern)
-        args_list = list(args_tuple)
-        assert isinstance(symbol, Symbol)
-        ksymbol = self._language_semantics.resolve_to_ksymbol(symbol)
-        if ksymbol:
-            next_turn += len(ksymbol.sort_params)
-        assert len(args_list) > next_turn, f'Location {str(loc)} is invalid for pattern {str(pattern)}'
-
-        # Replace the argument and return the application
-        arg_with_plug_at_loc, orig_subpat_at_loc, loc_remaining = self._subpattern_search_rec(
-            loc_remaining, args_list[next_turn], plug
-        )
-        args_list[next_turn] = arg_with_plug_at_loc
+        return self.zipper(location, info.simplification_result).ctx
+
+    def zipper(self, location: Location, pattern: Pattern) -> PatternZipper:
+        """Focus on the subpattern at the given location, the arguments for sort parameters are skipped."""
+        zipper = PatternZipper(pattern)
+        for next_turn in location:
+            symbol, args = kl.deconstruct_nary_application(zipper.focus)
+            assert isinstance(symbol, Symbol), f'Location {location} is invalid for pattern {str(pattern)}'
+            ksymbol = self._language_semantics.resolve_to_ksymbol(symbol)
+            app: Notation
+            if ksymbol:
+                next_turn += len(ksymbol.sort_params)
+                app = ksymbol.app
+            else:
+                app = kl.nary_app(symbol, len(args))
+            assert len(args) > next_turn, f'Location {location} is invalid for pattern {str(pattern)}'
+            zipper = zipper.down(app, args, next_turn)
+        return zipper
 
-        if ksymbol:
-            new_pattern_with_plug_at_loc = ksymbol.app(*args_list)
-        else:
-            new_pattern_with_plug_at_loc = kl.nary_app(symbol, len(args_list))(*args_list)
-        return new_pattern_with_plug_at_loc, orig_subpat_at_loc, loc_remaining
+
+@registered_cache()
+def functional_axiom(language_semantics: LanguageSemantics, pattern: Pattern) -> ConvertedAxiom:
+    # Double-check that the pattern is a functional symbol and it is valid to generate the axiom
+    sym, _ = kl.deconstruct_nary_application(pattern)
+    assert isinstance(sym, Symbol), f'Pattern {pattern} is not supported'
+    k_sym = language_semantics.resolve_to_ksymbol(sym)
+    assert k_sym is not None
+    assert k_sym.is_functional
+    return ConvertedAxiom(AxiomType.FunctionalSymbol, functional(pattern))
 
 
 class ExecutionProofExp(proof.ProofExp):
@@ -286,9 +342,10 @@ class ExecutionProofExp(proof.ProofExp):
 
         self._init_config = init_config
         self._curr_config = init_config
+        self._added_assumptions: set[Pattern] = set()
         self.language_semantics = language_semantics
-        self.subst_proofexp = self.import_module(Substitution())
-        self.kore_lemmas = self.import_module(kl.KoreLemmas())
+        self.subst_proofexp = self.import_module(Substitution.shared())
+        self.kore_lemmas = self.import_module(kl.KoreLemmas.shared())
         self._simplification_performer = SimplificationPerformer(
             self.language_semantics, SimplificationProver(language_semantics), self.current_configuration
         )
@@ -302,23 +359,16 @@ class ExecutionProofExp(proof.ProofExp):
     def collect_functional_axioms(
         language_semantics: LanguageSemantics, substitutions: dict[int, Pattern]
     ) -> list[ConvertedAxiom]:
-        subst_axioms = []
-        for pattern in substitutions.values():
-            # Double-check that the pattern is a functional symbol and it is valid to generate the axiom
-            sym, _ = kl.deconstruct_nary_application(pattern)
-            assert isinstance(sym, Symbol), f'Pattern {pattern} is not supported'
-            k_sym = language_semantics.resolve_to_ksymbol(sym)
-            assert k_sym is not None
-            assert k_sym.is_functional
-            converted_pattern = functional(pattern)
-            subst_axioms.append(ConvertedAxiom(AxiomType.FunctionalSymbol, converted_pattern))
-        return subst_axioms
+        # The same terms occur in the substitutions of many rewrite steps
+        return [functional_axiom(language_semantics, pattern) for pattern in dict.fromkeys(substitutions.values())]
 
     def add_assumptions_for_rewrite_step(self, rule: KRewritingRule, substitutions: dict[int, Pattern]) -> None:
         """Add axioms to the definition."""
         # TODO: We don't use them until the substitutions are implemented
         func_axioms = ExecutionProofExp.collect_functional_axioms(self.language_semantics, substitutions)
-        self.add_assumptions([axiom.pattern for axiom in func_axioms])
+        new_assumptions = [axiom.pattern for axiom in func_axioms if axiom.pattern not in self._added_assumptions]
+        self._added_assumptions.update(new_assumptions)
+        self.add_assumptions(new_assumptions)
         self.add_axiom(rule.pattern)
 
     @property
@@ -328,15 +378,19 @@ class ExecutionProofExp(proof.ProofExp):
 
     def rewrite_event(self, rule: KRewritingRule, substitution: dict[int, Pattern]) -> proof.ProofThunk:
         """Extends the proof with an additional rewrite step."""
-        # Check that the rule is krewrites
+        # Subpatterns of the rule without metavariables are shared with the rule itself
         instantiated_axiom = rule.pattern.instantiate(substitution)
-        match = kl.kore_rewrites.assert_matches(instantiated_axiom)
-        lhs = match[1]
-        rhs = match[2]
+        if isinstance(instantiated_axiom, Instantiate) and kl.kore_rewrites.correctly_instantiates(instantiated_axiom):
+            # No need for matching if the rule is built with the notation
+            lhs = instantiated_axiom.inst[1]
+            rhs = instantiated_axiom.inst[2]
+        else:
+            # Check that the rule is krewrites
+            _, lhs, rhs = kl.kore_rewrites.assert_matches(instantiated_axiom)
 
         # Check that the lhs matches the current configuration
-        assert (
-            lhs == self.current_configuration
+        assert is_same_configuration(
+            lhs, self.current_configuration
         ), f'The current configuration {lhs.pretty(self.pretty_options())} does not match the lhs of the rule {rule.pattern.pretty(self.pretty_options())}'
 
         # Add the axioms
@@ -373,10 +427,7 @@ class ExecutionProofExp(proof.ProofExp):
             )
             # TODO: Use self._simplification_performer.simplified_configuration instead to update the claim
             self._claims[-1] = self._proof_expressions[-1].conc
-            # TODO: Add SimplificationPerformer.reset() ?
-            self._simplification_performer = SimplificationPerformer(
-                self.language_semantics, SimplificationProver(self.language_semantics), self.current_configuration
-            )
+            self._simplification_performer.reset(self.current_configuration)
 
     def prove_equality_from_rule(self, rule: proof.ProofThunk) -> proof.ProofThunk:
         def reduce_requirement_rec(exp: proof.ProofThunk, cached_requires: Pattern) -> tuple[proof.ProofThunk, Pattern]:
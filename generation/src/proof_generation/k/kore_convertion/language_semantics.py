@@ -3,6 +3,7 @@ from __future__ import annotations
 from dataclasses import dataclass, field
 from enum import Enum
 from itertools import count
+from time import perf_counter
 from typing import TYPE_CHECKING, NamedTuple, ParamSpec, TypeVar
 
 import pyk.kore.syntax as kore
@@ -122,6 +123,16 @@ class KEquationalRule:
         return kl.matching_requires_substitution(self.requires)
 
 
+@dataclass
+class ConversionStats:
+    # Time spent in converting kore patterns, in seconds
+    time: float = 0.0
+    # Number of AML patterns built during the conversion
+    allocations: int = 0
+    # Number of subpatterns that have been reused from the memo tables
+    memo_hits: int = 0
+
+
 class BuilderScope:
     def __init__(self) -> None:
         self._parsing = False
@@ -317,15 +328,21 @@ class ConvertionScope:
         self._svars: dict[str, SVar] = {}
         self._metavars: dict[str, MetaVar] = {}
         self._sort_param_metavars: dict[str, MetaVar] = {}
+        # Converted patterns depending on the variables of the scope
+        self._memo: dict[kore.Pattern, Pattern] = {}
+        # Grows every time a conversion result depends on the scope
+        self.variable_lookups = 0
 
     def resolve_evar(self, name: str) -> EVar:
         """Resolve the evar in the given pattern."""
+        self.variable_lookups += 1
         if name not in self._evars:
             self._evars[name] = EVar(name=len(self._evars))
         return self._evars[name]
 
     def resolve_metavar(self, name: str) -> MetaVar:
         """Resolve the metavar in the given pattern."""
+        self.variable_lookups += 1
         if name not in self._metavars:
             self._metavars[name] = MetaVar(name=len(self._metavars))
         return self._metavars[name]
@@ -337,6 +354,7 @@ class ConvertionScope:
 
     def resolve_sort_param_metavar(self, name: str) -> MetaVar:
         """Resolve the metavar in the given pattern."""
+        self.variable_lookups += 1
         if name not in self._sort_param_metavars:
             self._sort_param_metavars[name] = MetaVar(name=self.SORT_PARAM_METAVAR + len(self._sort_param_metavars))
         return self._sort_param_metavars[name]
@@ -349,10 +367,20 @@ class ConvertionScope:
 
 
 class LanguageSemantics(BuilderScope):
+    SIMPLIFICATION_COUNTS_LIMIT = 1 << 16
+    # Maximal number of memoized conversions per table, a full table is cleared
+    CONVERSION_MEMO_LIMIT = 1 << 16
+
     def __init__(self) -> None:
         self._imported_modules: tuple[KModule, ...] = ()
         self._cached_axiom_scopes: dict[int, ConvertionScope] = {}
         self._inferred_notations: set[Notation] = set()
+        # Converted patterns without variables, shared between all scopes
+        self._ground_patterns: dict[kore.Pattern, Pattern] = {}
+        self._sort_symbols: dict[str, Symbol] = {}
+        self._function_symbols: dict[str, bool] = {}
+        self._simplification_counts: dict[int, tuple[Pattern, int]] = {}
+        self.conversion_stats = ConversionStats()
 
     @property
     def modules(self) -> tuple[KModule, ...]:
@@ -547,34 +575,49 @@ class LanguageSemantics(BuilderScope):
 
     def convert_pattern(self, pattern: kore.Pattern) -> Pattern:
         """Convert the given pattern to the pattern in the new format."""
+        start = perf_counter()
         scope = ConvertionScope()
-        return self._convert_pattern(scope, pattern)
+        converted = self._convert_pattern(scope, pattern)
+        self.conversion_stats.time += perf_counter() - start
+        return converted
 
     def convert_substitutions(self, subst: dict[str, kore.Pattern], axiom_ordinal: int) -> dict[int, Pattern]:
+        start = perf_counter()
         substitutions = {}
         scope = self._cached_axiom_scopes[axiom_ordinal]
         for var_name, kore_pattern in subst.items():
             # TODO: Replace it with the EVar later
             name = scope.lookup_metavar(var_name).name
             substitutions[name] = self._convert_pattern(scope, kore_pattern)
+        self.conversion_stats.time += perf_counter() - start
         return substitutions
 
+    def is_function_symbol(self, symbol: Symbol) -> bool:
+        """Check that the symbol is functional, but neither a constructor nor a cell."""
+        if symbol.name in self._function_symbols:
+            return self._function_symbols[symbol.name]
+        ksymbol = self.resolve_to_ksymbol(symbol)
+        is_function = ksymbol is not None and ksymbol.is_functional and not ksymbol.is_cell and not ksymbol.is_ctor
+        # Symbols can still be added while parsing
+        if not self._parsing:
+            self._function_symbols[symbol.name] = is_function
+        return is_function
+
     def count_simplifications(self, pattern: Pattern) -> int:
         """Count the number of function symbols in the given pattern (functional, not ctr, not cell)."""
-        functional_symbols = 0
-
-        def count_function_symbol(symbol: Symbol) -> None:
-            ksymbol = self.resolve_to_ksymbol(symbol)
-            if ksymbol is not None and ksymbol.is_functional and not ksymbol.is_cell and not ksymbol.is_ctor:
-                nonlocal functional_symbols
-                functional_symbols += 1
+        # Patterns are immutable and subpatterns are shared between consecutive configurations,
+        # so the counts are memoized by identity to visit only the subpatterns that have changed
+        cached = self._simplification_counts.get(id(pattern))
+        if cached is not None:
+            return cached[1]
 
+        functional_symbols = 0
         if isinstance(pattern, Symbol):
-            count_function_symbol(pattern)
+            functional_symbols += self.is_function_symbol(pattern)
         elif isinstance(pattern, App):
             symbol_pattern, args = kl.deconstruct_nary_application(pattern)
             if isinstance(symbol_pattern, Symbol):
-                count_function_symbol(symbol_pattern)
+                functional_symbols += self.is_function_symbol(symbol_pattern)
             else:
                 functional_symbols += self.count_simplifications(symbol_pattern)
             for arg in args:
@@ -588,15 +631,49 @@ class LanguageSemantics(BuilderScope):
             if children:
                 for child in children:
                     functional_symbols += self.count_simplifications(child)
+
+        if len(self._simplification_counts) >= self.SIMPLIFICATION_COUNTS_LIMIT:
+            self._simplification_counts.clear()
+        # Keep a reference to the pattern so that its id cannot be reused
+        self._simplification_counts[id(pattern)] = (pattern, functional_symbols)
         return functional_symbols
 
     def _convert_sort(self, scope: ConvertionScope, sort: kore.Sort | kore.SortVar) -> Pattern:
         if isinstance(sort, kore.SortVar):
             return scope.resolve_sort_param_metavar(sort.name)
-        else:
-            return self.get_sort(sort.name).aml_symbol
+        if sort.name not in self._sort_symbols:
+            self._sort_symbols[sort.name] = self.get_sort(sort.name).aml_symbol
+        return self._sort_symbols[sort.name]
 
     def _convert_pattern(self, scope: ConvertionScope, pattern: kore.Pattern) -> Pattern:
+        """Convert the given pattern reusing the results of converting equal subpatterns."""
+        converted = self._ground_patterns.get(pattern)
+        if converted is not None:
+            self.conversion_stats.memo_hits += 1
+            return converted
+        converted = scope._memo.get(pattern)
+        if converted is not None:
+            # The enclosing pattern depends on the scope as well
+            scope.variable_lookups += 1
+            self.conversion_stats.memo_hits += 1
+            return converted
+
+        lookups = scope.variable_lookups
+        converted = self._convert_new_pattern(scope, pattern)
+        self.conversion_stats.allocations += 1
+        memo = self._ground_patterns if scope.variable_lookups == lookups else scope._memo
+        if len(memo) >= self.CONVERSION_MEMO_LIMIT:
+            memo.clear()
+        memo[pattern] = converted
+        return converted
+
+    def clear_conversion_memo(self) -> None:
+        """Drop the memoized conversions, e.g. of the configurations of a finished proof."""
+        self._ground_patterns.clear()
+        for scope in self._cached_axiom_scopes.values():
+            scope._memo.clear()
+
+    def _convert_new_pattern(self, scope: ConvertionScope, pattern: kore.Pattern) -> Pattern:
         """Convert the given pattern to the pattern in the new format."""
         match pattern:
             case kore.Rewrites(sort, left, right):
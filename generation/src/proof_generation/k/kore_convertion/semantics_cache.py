@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import pickle
+from hashlib import sha256
+from typing import TYPE_CHECKING
+
+from proof_generation.k.kore_convertion.language_semantics import LanguageSemantics
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+# Bump whenever the layout of LanguageSemantics or of the AML patterns changes,
+# so that stale caches written by an older version are ignored
+CACHE_FORMAT_VERSION = 2
+CACHE_FILE_NAME = 'language-semantics.cache'
+
+
+def definition_key(kore_file: Path) -> str:
+    """Compute the cache key of the given definition.kore file from its content."""
+    digest = sha256()
+    digest.update(f'v{CACHE_FORMAT_VERSION}:'.encode())
+    digest.update(kore_file.read_bytes())
+    return digest.hexdigest()
+
+
+def save_semantics(cache_file: Path, key: str, semantics: LanguageSemantics) -> None:
+    """Store the converted semantics together with the key of the definition it was converted from."""
+    assert not semantics._parsing, 'Cannot cache a semantics that is still being built'
+    state = {
+        'modules': semantics._imported_modules,
+        'axiom_scopes': semantics._cached_axiom_scopes,
+        'inferred_notations': semantics._inferred_notations,
+    }
+    # Write to a temporary file first to never leave a truncated cache behind
+    tmp_file = cache_file.with_suffix(cache_file.suffix + '.tmp')
+    with open(tmp_file, 'wb') as out:
+        pickle.dump((CACHE_FORMAT_VERSION, key, state), out, protocol=pickle.HIGHEST_PROTOCOL)
+    tmp_file.replace(cache_file)
+
+
+def load_semantics(cache_file: Path, key: str) -> LanguageSemantics | None:
+    """Load the cached semantics, or return None if the cache is missing, stale or unreadable."""
+    if not cache_file.exists():
+        return None
+    try:
+        with open(cache_file, 'rb') as inp:
+            version, cached_key, state = pickle.load(inp)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, ValueError):
+        return None
+    if version != CACHE_FORMAT_VERSION or cached_key != key:
+        return None
+
+    semantics = LanguageSemantics()
+    semantics._imported_modules = state['modules']
+    semantics._cached_axiom_scopes = state['axiom_scopes']
+    semantics._inferred_notations = state['inferred_notations']
+    return semantics
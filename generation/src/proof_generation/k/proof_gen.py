@@ -1,7 +1,12 @@
 from __future__ import annotations
 
+import multiprocessing
+import os
+import sys
 from argparse import ArgumentParser
+from dataclasses import dataclass
 from pathlib import Path
+from time import perf_counter
 from typing import TYPE_CHECKING
 
 import pyk.kllvm.load  # noqa: F401
@@ -9,12 +14,21 @@ import pyk.kore.syntax as kore
 from pyk.kore.parser import KoreParser
 from pyk.utils import check_file_path
 
+from proof_generation.caches import print_cache_stats, reset_caches
 from proof_generation.k.execution_proof_generation import ExecutionProofExp
-from proof_generation.k.kore_convertion.language_semantics import LanguageSemantics
+from proof_generation.k.kore_convertion.language_semantics import ConversionStats, LanguageSemantics
 from proof_generation.k.kore_convertion.rewrite_steps import get_proof_hints
+from proof_generation.k.kore_convertion.semantics_cache import (
+    CACHE_FILE_NAME,
+    definition_key,
+    load_semantics,
+    save_semantics,
+)
 from proof_generation.llvm_proof_hint import LLVMRewriteTrace
 
 if TYPE_CHECKING:
+    from collections.abc import Iterator
+
     from proof_generation.proof import ProofExp
 
 
@@ -26,6 +40,31 @@ def get_kompiled_definition(output_dir: Path) -> kore.Definition:
     return KoreParser(kore_text).definition()
 
 
+def get_language_semantics(kompiled_dir: Path, use_cache: bool = True) -> LanguageSemantics:
+    """Load the converted semantics from the cache in the kompiled directory or convert the definition."""
+    kore_file = kompiled_dir / 'definition.kore'
+    check_file_path(kore_file)
+    cache_file = kompiled_dir / CACHE_FILE_NAME
+    key = definition_key(kore_file)
+
+    if use_cache:
+        semantics = load_semantics(cache_file, key)
+        if semantics is not None:
+            print(f'Using cached language semantics from {cache_file}')
+            return semantics
+
+    kore_definition = get_kompiled_definition(kompiled_dir)
+    print('Begin converting ... ')
+    semantics = LanguageSemantics.from_kore_definition(kore_definition)
+
+    if use_cache:
+        try:
+            save_semantics(cache_file, key, semantics)
+        except (OSError, RecursionError) as e:
+            print(f'Failed to cache the language semantics in {cache_file}: {e}')
+    return semantics
+
+
 def get_kompiled_dir(output_dir: str) -> Path:
     """Check that the K definition exists and return path to the kompiled directory."""
 
@@ -37,12 +76,22 @@ def get_kompiled_dir(output_dir: str) -> Path:
         raise AssertionError(f'Kompiled directory {path} does not exist.')
 
 
-def generate_proof_file(proof_gen: ProofExp, output_dir: Path, slice_name: str, pretty_no_stack: bool = False) -> None:
+def generate_proof_file(
+    proof_gen: ProofExp,
+    output_dir: Path,
+    slice_name: str,
+    pretty_no_stack: bool = False,
+    jobs: int = 1,
+    prune_axioms: bool = False,
+) -> None:
     """Generate the proof files."""
     if not output_dir.exists():
         output_dir.mkdir(parents=True)
     mode = 'pretty-no-stack' if pretty_no_stack else 'binary'
-    proof_gen.main(['', mode, str(output_dir), slice_name])
+    argv = ['', mode, str(output_dir), slice_name, '--jobs', str(jobs)]
+    if prune_axioms:
+        argv.append('--prune-axioms')
+    proof_gen.main(argv)
 
 
 def read_proof_hint(filepath: str) -> LLVMRewriteTrace:
@@ -65,31 +114,205 @@ def get_axiom_label(attrs: tuple[kore.App, ...]) -> str:
     return 'N/A'
 
 
+def generate_proofs(
+    language_semantics: LanguageSemantics,
+    module: str,
+    hints_file: str,
+    proof_dir: str,
+    pretty_no_stack: bool = False,
+    jobs: int = 1,
+    prune_axioms: bool = False,
+) -> None:
+    """Generate the proof of the execution recorded in the hints file using already converted semantics."""
+    language_semantics.conversion_stats = ConversionStats()
+    try:
+        initial_config, hints_iterator = get_proof_hints(read_proof_hint(hints_file), language_semantics)
+
+        print('Begin generating proofs ... ')
+        kore_def = ExecutionProofExp.from_proof_hints(initial_config, hints_iterator, language_semantics)
+        stats = language_semantics.conversion_stats
+        print(
+            f'Converted patterns from {hints_file} in {stats.time:.3f}s: '
+            f'{stats.allocations} patterns built, {stats.memo_hits} reused'
+        )
+        slice_name = Path(hints_file).stem + '.' + module
+        generate_proof_file(kore_def, Path(proof_dir), slice_name, pretty_no_stack, jobs, prune_axioms)
+    finally:
+        # The conversions memoized for this proof are dropped, even if it failed
+        language_semantics.clear_conversion_memo()
+    print_cache_stats()
+    # Cached configurations are not needed for the next proof
+    reset_caches()
+
+
 def main(
     module: str,
     hints_file: str,
     kompiled: str,
     proof_dir: str,
     pretty_no_stack: bool = False,
+    use_cache: bool = True,
+    jobs: int = 1,
+    prune_axioms: bool = False,
 ) -> None:
     # Kompile sources
     kompiled_dir: Path = get_kompiled_dir(kompiled)
-    kore_definition = get_kompiled_definition(kompiled_dir)
+    language_semantics = get_language_semantics(kompiled_dir, use_cache)
+    generate_proofs(language_semantics, module, hints_file, proof_dir, pretty_no_stack, jobs, prune_axioms)
+    print('Done!')
 
-    print('Begin converting ... ')
-    language_semantics = LanguageSemantics.from_kore_definition(kore_definition)
 
-    # print('Intialize hint stream ... ')
-    initial_config, hints_iterator = get_proof_hints(read_proof_hint(hints_file), language_semantics)
+@dataclass(frozen=True)
+class BatchResult:
+    hints_file: str
+    time: float
+    error: str | None = None
 
-    print('Begin generating proofs ... ')
-    kore_def = ExecutionProofExp.from_proof_hints(initial_config, hints_iterator, language_semantics)
-    slice_name = Path(hints_file).stem + '.' + module
-    generate_proof_file(kore_def, Path(proof_dir), slice_name, pretty_no_stack)
-    print('Done!')
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+# The semantics shared by the batch workers, set before forking them so that they inherit it
+_batch_semantics: LanguageSemantics | None = None
+
+
+def _generate_batch_proof(job: tuple[str, str, str, bool, bool]) -> BatchResult:
+    module, hints_file, proof_dir, pretty_no_stack, prune_axioms = job
+    assert _batch_semantics is not None
+    start = perf_counter()
+    try:
+        generate_proofs(_batch_semantics, module, hints_file, proof_dir, pretty_no_stack, prune_axioms=prune_axioms)
+    except Exception as e:
+        # Clear whatever the failed proof left in the caches before the next one
+        reset_caches()
+        return BatchResult(hints_file, perf_counter() - start, f'{type(e).__name__}: {e}')
+    return BatchResult(hints_file, perf_counter() - start)
+
+
+def run_batch(
+    language_semantics: LanguageSemantics,
+    module: str,
+    hints_files: list[str],
+    proof_dir: str,
+    pretty_no_stack: bool = False,
+    jobs: int = 1,
+    prune_axioms: bool = False,
+) -> list[BatchResult]:
+    """
+    Generate the proofs of all hints files with the same semantics and return the results in the order of the files.
+    With more than one job the files are handed out to forked workers, so the semantics is converted only once.
+    """
+    global _batch_semantics
+    _batch_semantics = language_semantics
+    batch = [(module, hints_file, proof_dir, pretty_no_stack, prune_axioms) for hints_file in hints_files]
+
+    results: Iterator[BatchResult]
+    try:
+        if jobs > 1 and len(batch) > 1 and 'fork' in multiprocessing.get_all_start_methods():
+            with multiprocessing.get_context('fork').Pool(min(jobs, len(batch))) as pool:
+                results = pool.imap(_generate_batch_proof, batch, chunksize=1)
+                return list(_report_batch_results(results))
+        results = map(_generate_batch_proof, batch)
+        return list(_report_batch_results(results))
+    finally:
+        _batch_semantics = None
+
+
+def _report_batch_results(results: Iterator[BatchResult]) -> Iterator[BatchResult]:
+    for result in results:
+        status = 'ok' if result.ok else f'FAILED ({result.error})'
+        print(f'{result.hints_file}: {result.time:.3f}s {status}')
+        yield result
+
+
+def print_batch_summary(results: list[BatchResult], total_time: float) -> None:
+    width = max((len(result.hints_file) for result in results), default=0)
+    print(f'{"hints file":<{width}}  {"time (s)":>10}  status')
+    for result in results:
+        print(f'{result.hints_file:<{width}}  {result.time:>10.3f}  {"ok" if result.ok else "FAILED"}')
+    failed = [result for result in results if not result.ok]
+    print(f'{len(results) - len(failed)} of {len(results)} proofs generated in {total_time:.3f}s')
+    for result in failed:
+        print(f'Failed {result.hints_file}: {result.error}')
+
+
+def batch_main(
+    kompiled: str,
+    hints_files: list[str],
+    proof_dir: str,
+    module: str | None = None,
+    pretty_no_stack: bool = False,
+    use_cache: bool = True,
+    jobs: int | None = None,
+    prune_axioms: bool = False,
+) -> bool:
+    """Generate the proofs of many hints files of the same definition. Returns whether all proofs were generated."""
+    start = perf_counter()
+    kompiled_dir: Path = get_kompiled_dir(kompiled)
+    if module is None:
+        module = kompiled_dir.name.removesuffix('-kompiled')
+    language_semantics = get_language_semantics(kompiled_dir, use_cache)
+    results = run_batch(
+        language_semantics,
+        module,
+        hints_files,
+        proof_dir,
+        pretty_no_stack,
+        jobs if jobs else os.cpu_count() or 1,
+        prune_axioms,
+    )
+    print_batch_summary(results, perf_counter() - start)
+    return all(result.ok for result in results)
+
+
+def batch_argparser() -> ArgumentParser:
+    argparser = ArgumentParser(prog='proof_gen.py batch')
+    argparser.add_argument('kompiled', type=str, help='Path to the kompiled directory')
+    argparser.add_argument('hints', type=str, nargs='+', help='Paths to the binary hints files')
+    argparser.add_argument(
+        '--module', type=str, default=None, help='The module name, by default the name of the kompiled directory'
+    )
+    argparser.add_argument('--proof-dir', type=str, default=str(Path.cwd()), help='Output directory for saving proofs')
+    argparser.add_argument(
+        '-j', '--jobs', type=int, default=None, help='Number of worker processes, by default the number of CPUs'
+    )
+    argparser.add_argument(
+        '--pretty',
+        action='store_true',
+        default=False,
+        help='Print the pretty-printed version of proofs instead of the binary ones',
+    )
+    argparser.add_argument(
+        '--no-cache',
+        action='store_true',
+        default=False,
+        help='Always convert the definition instead of using the cached language semantics',
+    )
+    argparser.add_argument(
+        '--prune-axioms',
+        action='store_true',
+        default=False,
+        help='Only publish the rules and assumptions loaded by the proofs',
+    )
+    return argparser
 
 
 if __name__ == '__main__':
+    if sys.argv[1:2] == ['batch']:
+        batch_args = batch_argparser().parse_args(sys.argv[2:])
+        success = batch_main(
+            batch_args.kompiled,
+            batch_args.hints,
+            batch_args.proof_dir,
+            batch_args.module,
+            batch_args.pretty,
+            not batch_args.no_cache,
+            batch_args.jobs,
+            batch_args.prune_axioms,
+        )
+        sys.exit(0 if success else 1)
+
     argparser = ArgumentParser()
     argparser.add_argument('module', type=str, help='The module name')
     argparser.add_argument('hints', type=str, help='Path to the binary hints file')
@@ -101,6 +324,30 @@ if __name__ == '__main__':
         default=False,
         help='Print the pretty-printed version of proofs instead of the binary ones',
     )
+    argparser.add_argument(
+        '--no-cache',
+        action='store_true',
+        default=False,
+        help='Always convert the definition instead of using the cached language semantics',
+    )
+    argparser.add_argument(
+        '-j', '--jobs', type=int, default=1, help='Number of processes serializing the proofs of the rewrite steps'
+    )
+    argparser.add_argument(
+        '--prune-axioms',
+        action='store_true',
+        default=False,
+        help='Only publish the rules and assumptions loaded by the proofs',
+    )
 
     args = argparser.parse_args()
-    main(args.module, args.hints, args.kompiled, args.proof_dir, args.pretty)
+    main(
+        args.module,
+        args.hints,
+        args.kompiled,
+        args.proof_dir,
+        args.pretty,
+        not args.no_cache,
+        args.jobs,
+        args.prune_axioms,
+    )
@@ -0,0 +1,296 @@
+from __future__ import annotations
+
+import inspect
+import pickle
+from contextlib import contextmanager
+from dataclasses import dataclass
+from hashlib import sha256
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import proof_generation
+from proof_generation.aml import EVar
+from proof_generation.interpreter import ExecutionPhase, InterpreterTransformer, StatefulInterpreter
+from proof_generation.proved import Proved
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterator, Mapping
+
+    from proof_generation.aml import Pattern
+    from proof_generation.interpreter import Interpreter
+
+# Bump whenever the layout of CompiledLemma changes, so that lemmas written by an older version are recompiled
+LIBRARY_FORMAT_VERSION = 1
+LEMMA_FILE_SUFFIX = '.lemma'
+
+
+@dataclass(frozen=True)
+class LemmaStep:
+    """An interpreter call of a compiled lemma, whose other arguments are the topmost terms of the stack."""
+
+    method: str
+    # The pattern built by a pattern step
+    pattern: Pattern | None = None
+    # Instantiated metavariables, or the variable of a generalization
+    ids: tuple[int, ...] = ()
+
+
+@dataclass(frozen=True)
+class CompiledLemma:
+    """The proof of a schematic lemma, which proves its conclusion on top of any stack and memory."""
+
+    conclusion: Pattern
+    steps: tuple[LemmaStep, ...]
+
+
+class _LemmaRecorder(StatefulInterpreter):
+    """Records the proof rules applied by a lemma, and the patterns it builds as a whole."""
+
+    def __init__(self) -> None:
+        super().__init__(ExecutionPhase.Proof)
+        self.steps: list[LemmaStep] = []
+        self._depth = 0
+
+    def _record(self, step: LemmaStep) -> None:
+        # Notations are built with instantiations inside of the pattern being recorded
+        if self._depth == 0:
+            self.steps.append(step)
+
+    def pattern(self, p: Pattern) -> Pattern:
+        self._record(LemmaStep('pattern', p))
+        self._depth += 1
+        try:
+            return super().pattern(p)
+        finally:
+            self._depth -= 1
+
+    def prop1(self) -> Proved:
+        self._record(LemmaStep('prop1'))
+        return super().prop1()
+
+    def prop2(self) -> Proved:
+        self._record(LemmaStep('prop2'))
+        return super().prop2()
+
+    def prop3(self) -> Proved:
+        self._record(LemmaStep('prop3'))
+        return super().prop3()
+
+    def modus_ponens(self, left: Proved, right: Proved) -> Proved:
+        self._record(LemmaStep('modus_ponens'))
+        return super().modus_ponens(left, right)
+
+    def exists_quantifier(self) -> Proved:
+        self._record(LemmaStep('exists_quantifier'))
+        return super().exists_quantifier()
+
+    def exists_generalization(self, proved: Proved, var: EVar) -> Proved:
+        self._record(LemmaStep('exists_generalization', ids=(var.name,)))
+        return super().exists_generalization(proved, var)
+
+    def instantiate(self, proved: Proved, delta: dict[int, Pattern]) -> Proved:
+        self._record(LemmaStep('instantiate', ids=tuple(delta)))
+        return super().instantiate(proved, delta)
+
+    def instantiate_pattern(self, pattern: Pattern, delta: Mapping[int, Pattern]) -> Pattern:
+        self._record(LemmaStep('instantiate_pattern', ids=tuple(delta)))
+        return super().instantiate_pattern(pattern, delta)
+
+    def pop(self, term: Pattern | Proved) -> None:
+        self._record(LemmaStep('pop'))
+        super().pop(term)
+
+    def save(self, id: str, term: Pattern | Proved) -> None:
+        raise AssertionError('A lemma must not use the memory')
+
+    def load(self, id: str, term: Pattern | Proved) -> None:
+        raise AssertionError('A lemma must not use the memory')
+
+
+def compile_lemma(proof: Callable[[Interpreter], Proved]) -> CompiledLemma:
+    """Record a proof which does not use the memory, so that it can be replayed on top of any interpreter state."""
+    recorder = _LemmaRecorder()
+    proved = proof(recorder)
+    assert recorder.stack == [proved], 'A lemma must leave exactly its conclusion on the stack'
+    lemma = CompiledLemma(proved.conclusion, tuple(recorder.steps))
+    # Pattern constructors called outside of Interpreter.pattern are not recorded
+    assert replay_lemma(lemma, StatefulInterpreter(ExecutionPhase.Proof)) == proved
+    return lemma
+
+
+def replay_lemma(lemma: CompiledLemma, interpreter: Interpreter) -> Proved:
+    """Apply the steps of the lemma to any interpreter, transformers included."""
+    stack: list[Pattern | Proved] = []
+
+    def pop_pattern() -> Pattern:
+        term = stack.pop()
+        assert not isinstance(term, Proved)
+        return term
+
+    def pop_proved() -> Proved:
+        term = stack.pop()
+        assert isinstance(term, Proved)
+        return term
+
+    for step in lemma.steps:
+        match step.method:
+            case 'pattern':
+                assert step.pattern is not None
+                stack.append(interpreter.pattern(step.pattern))
+            case 'prop1':
+                stack.append(interpreter.prop1())
+            case 'prop2':
+                stack.append(interpreter.prop2())
+            case 'prop3':
+                stack.append(interpreter.prop3())
+            case 'modus_ponens':
+                premise = pop_proved()
+                stack.append(interpreter.modus_ponens(pop_proved(), premise))
+            case 'exists_quantifier':
+                stack.append(interpreter.exists_quantifier())
+            case 'exists_generalization':
+                stack.append(interpreter.exists_generalization(pop_proved(), EVar(step.ids[0])))
+            case 'instantiate' | 'instantiate_pattern':
+                target = stack.pop()
+                # The plugs are on the stack in the order of the instantiated metavariables
+                plugs = [pop_pattern() for _ in step.ids][::-1]
+                delta = dict(zip(step.ids, plugs, strict=True))
+                if isinstance(target, Proved):
+                    stack.append(interpreter.instantiate(target, delta))
+                else:
+                    stack.append(interpreter.instantiate_pattern(target, delta))
+            case 'pop':
+                interpreter.pop(stack.pop())
+            case method:
+                raise NotImplementedError(f'Unknown lemma step {method}')
+
+    (proved,) = stack
+    assert isinstance(proved, Proved) and proved.conclusion == lemma.conclusion
+    return proved
+
+
+_package_digest: bytes | None = None
+_source_digests: dict[type, bytes] = {}
+
+
+def _hash_files(source_files: list[Path]) -> bytes:
+    hasher = sha256()
+    for source_file in source_files:
+        hasher.update(str(source_file).encode())
+        hasher.update(source_file.read_bytes())
+    return hasher.digest()
+
+
+def source_key(cls: type, name: str, arity: int) -> str:
+    """
+    The cache key of a lemma of the given proof expression class, which changes with the source of the
+    proof_generation package, as lemmas may call any of its modules, and of the bases of the class outside of it.
+    """
+    global _package_digest
+    package_dir = Path(proof_generation.__file__).parent
+    if _package_digest is None:
+        _package_digest = _hash_files(sorted(package_dir.rglob('*.py')))
+
+    digest = _source_digests.get(cls)
+    if digest is None:
+        source_files = []
+        for base in cls.__mro__:
+            if base.__module__ == 'builtins':
+                continue
+            source_file = Path(inspect.getfile(base))
+            if not source_file.is_relative_to(package_dir):
+                source_files.append(source_file)
+        digest = _source_digests[cls] = _hash_files(source_files)
+
+    key = sha256(f'v{LIBRARY_FORMAT_VERSION}:{name}/{arity}:'.encode())
+    key.update(_package_digest)
+    key.update(digest)
+    return key.hexdigest()
+
+
+class LemmaLibrary:
+    """
+    Compiled schematic lemmas stored in a directory, one file per lemma keyed by the source of its proof.
+    Emitted lemmas are saved to the memory, so that every later use of the same lemma is a single load.
+    """
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+        self._lemmas: dict[str, CompiledLemma] = {}
+        self.compiled = 0
+        self.loaded = 0
+
+    def _path(self, name: str, key: str) -> Path:
+        return self.directory / f'{name}-{key[:32]}{LEMMA_FILE_SUFFIX}'
+
+    def _read(self, path: Path, key: str) -> CompiledLemma | None:
+        if not path.exists():
+            return None
+        try:
+            with open(path, 'rb') as inp:
+                version, cached_key, lemma = pickle.load(inp)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, ValueError):
+            return None
+        if version != LIBRARY_FORMAT_VERSION or cached_key != key or not isinstance(lemma, CompiledLemma):
+            return None
+        return lemma
+
+    def _write(self, path: Path, key: str, lemma: CompiledLemma) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first to never leave a truncated lemma behind
+        tmp_file = path.with_suffix(path.suffix + '.tmp')
+        with open(tmp_file, 'wb') as out:
+            pickle.dump((LIBRARY_FORMAT_VERSION, key, lemma), out, protocol=pickle.HIGHEST_PROTOCOL)
+        tmp_file.replace(path)
+
+    def get(self, name: str, key: str, proof: Callable[[], Callable[[Interpreter], Proved]]) -> CompiledLemma:
+        """Return the compiled lemma with the given key, compiling the proof built by the callback on a miss."""
+        lemma = self._lemmas.get(key)
+        if lemma is not None:
+            return lemma
+
+        path = self._path(name, key)
+        lemma = self._read(path, key)
+        if lemma is None:
+            # The proof is built from scratch, as precompiled lemmas would use the memory
+            with use_lemma_library(None):
+                lemma = compile_lemma(proof())
+            self.compiled += 1
+            try:
+                self._write(path, key, lemma)
+            except OSError as e:
+                print(f'Failed to store the compiled lemma {name} in {path}: {e}')
+        else:
+            self.loaded += 1
+        self._lemmas[key] = lemma
+        return lemma
+
+    def emit(self, name: str, lemma: CompiledLemma, interpreter: Interpreter) -> Proved:
+        core = interpreter.core_interpreter if isinstance(interpreter, InterpreterTransformer) else interpreter
+        proved = Proved(lemma.conclusion)
+        if isinstance(core, StatefulInterpreter) and proved in core.memory:
+            interpreter.load(name, proved)
+            return proved
+
+        proved = replay_lemma(lemma, interpreter)
+        if isinstance(core, StatefulInterpreter):
+            interpreter.save(name, proved)
+        return proved
+
+
+_library: LemmaLibrary | None = None
+
+
+@contextmanager
+def use_lemma_library(library: LemmaLibrary | None) -> Iterator[None]:
+    """Make the proofs run in this block use the given library, or none, and restore the previous one afterwards."""
+    global _library
+    previous, _library = _library, library
+    try:
+        yield
+    finally:
+        _library = previous
+
+
+def lemma_library() -> LemmaLibrary | None:
+    return _library
@@ -2,17 +2,23 @@ from __future__ import annotations
 
 from dataclasses import dataclass, field
 from io import StringIO
-from typing import TYPE_CHECKING, TypeVar
+from typing import TYPE_CHECKING, TypeVar, cast
 
 from proof_generation.metamath.utils.printer import Printer
 from proof_generation.metamath.utils.visitor import ResultT, Visitor
 
 if TYPE_CHECKING:
-    from collections.abc import Callable, Mapping
+    from collections.abc import Callable, Iterator, Mapping
     from typing import Any, TextIO
 
     StatementType = TypeVar('StatementType', bound='Statement')
     TermType = TypeVar('TermType', bound='Term')
+    T = TypeVar('T')
+
+
+def _unchanged(new: tuple[T, ...], old: tuple[T, ...]) -> bool:
+    """Whether the rebuilt children are the original objects, so that the parent can be reused."""
+    return all(new_child is old_child for new_child, old_child in zip(new, old, strict=True))
 
 
 class MetamathVisitor(Visitor['BaseAST', ResultT]):
@@ -129,13 +135,15 @@ class Application(Term):
         return metavars
 
     def substitute(self, substitution: Mapping[str, Term]) -> Application:
-        return Application(self.symbol, tuple(subterm.substitute(substitution) for subterm in self.subterms))
+        subterms = tuple(subterm.substitute(substitution) for subterm in self.subterms)
+        return self if _unchanged(subterms, self.subterms) else Application(self.symbol, subterms)
 
     def visit(self, visitor: MetamathVisitor[ResultT]) -> ResultT:
         return visitor.proxy_visit_application(self)  # type: ignore
 
     def map_inner(self, f: Callable[[Term], Term]) -> Application:
-        return Application(self.symbol, tuple(map(f, self.subterms)))
+        subterms = tuple(map(f, self.subterms))
+        return self if _unchanged(subterms, self.subterms) else Application(self.symbol, subterms)
 
     def get_size(self) -> int:
         return 1 + sum(term.get_size() for term in self.subterms)
@@ -144,12 +152,9 @@ class Application(Term):
         if self.hash_cache is not None:
             return self.hash_cache
 
-        final_hash = hash(self.symbol)
-        for subterm in self.subterms:
-            final_hash ^= hash(subterm)
-
-        self.hash_cache = final_hash
-        return final_hash
+        # Tuple hashes depend on the order of the subterms and do not cancel out repeated ones
+        self.hash_cache = hash((self.symbol, self.subterms))
+        return self.hash_cache
 
 
 class Statement(BaseAST):
@@ -224,7 +229,8 @@ class StructuredStatement(Statement):
         return metavars
 
     def substitute(self: StmtT, substitution: Mapping[str, Term]) -> StmtT:
-        return type(self)(self.label, tuple(term.substitute(substitution) for term in self.terms))
+        terms = tuple(term.substitute(substitution) for term in self.terms)
+        return self if _unchanged(terms, self.terms) else type(self)(self.label, terms)
 
     def visit(self, visitor: MetamathVisitor[ResultT]) -> ResultT:
         return visitor.proxy_visit_structured_statement(self)  # type: ignore
@@ -304,7 +310,8 @@ class Block(Statement):
         return metavars
 
     def map_inner(self, f: Callable[[Statement], Statement]) -> Block:
-        return Block(tuple(f(statement) for statement in self.statements))
+        statements = tuple(f(statement) for statement in self.statements)
+        return self if _unchanged(statements, self.statements) else Block(statements)
 
 
 @dataclass
@@ -321,10 +328,72 @@ class Database(BaseAST):
         return visitor.proxy_visit_database(self)  # type: ignore
 
     def top_down(self, f: Callable[[Statement], Statement]) -> Database:
-        return Database(tuple(statement.top_down(f) for statement in self.statements))
+        statements = tuple(statement.top_down(f) for statement in self.statements)
+        return self if _unchanged(statements, self.statements) else Database(statements)
 
     def bottom_up(self, f: Callable[[Statement], Statement]) -> Database:
-        return Database(tuple(statement.bottom_up(f) for statement in self.statements))
+        statements = tuple(statement.bottom_up(f) for statement in self.statements)
+        return self if _unchanged(statements, self.statements) else Database(statements)
+
+
+class TermTable:
+    """
+    Hash-consing of terms: the terms built or interned through the same table are shared, so that equal terms are
+    the same object, are stored once, and compare by identity.
+    """
+
+    def __init__(self) -> None:
+        self._terms: dict[Term, Term] = {}
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+    def __iter__(self) -> Iterator[Term]:
+        return iter(self._terms)
+
+    def metavariable(self, name: str) -> Metavariable:
+        term = Metavariable(name)
+        return cast('Metavariable', self._terms.setdefault(term, term))
+
+    def application(self, symbol: str, subterms: tuple[Term, ...] = ()) -> Application:
+        """The shared application, whose subterms have to be interned already."""
+        term = Application(symbol, subterms)
+        return cast('Application', self._terms.setdefault(term, term))
+
+    def intern(self, term: TermType) -> TermType:
+        """The shared term equal to the given one, which is reused if its subterms are shared already."""
+        interned = self._terms.get(term)
+        if interned is None:
+            interned = term.map_inner(self.intern)
+            self._terms[interned] = interned
+        return cast('TermType', interned)
+
+
+# Number of characters the encoder renders in memory before writing them to its output
+ENCODER_CHUNK_SIZE = 1 << 16
+
+
+class _ChunkedOutput:
+    """Joins the many small writes of a printer and passes them on to the output in large chunks."""
+
+    def __init__(self, output: TextIO, chunk_size: int = ENCODER_CHUNK_SIZE) -> None:
+        self.output = output
+        self.chunk_size = chunk_size
+        self.chunks: list[str] = []
+        self.size = 0
+
+    def write(self, s: str) -> int:
+        self.chunks.append(s)
+        self.size += len(s)
+        if self.size >= self.chunk_size:
+            self.flush()
+        return len(s)
+
+    def flush(self) -> None:
+        if self.chunks:
+            self.output.write(''.join(self.chunks))
+        self.chunks = []
+        self.size = 0
 
 
 class Encoder(Printer, Visitor[BaseAST, None]):
@@ -335,12 +404,16 @@ class Encoder(Printer, Visitor[BaseAST, None]):
     def __init__(self, output: TextIO, tab: str = '   ', omit_proof: bool = False):
         super().__init__(output, tab)
         self.omit_proof = omit_proof
+        # Rendered terms by identifier, the terms are kept alive to keep their identifiers unique
+        self._rendered_terms: dict[int, tuple[Term, str]] = {}
 
     @staticmethod
     def encode(output: TextIO, ast: BaseAST, *args: Any, **kwargs: Any) -> None:
-        encoder = Encoder(output, *args, **kwargs)
+        chunked_output = _ChunkedOutput(output)
+        encoder = Encoder(cast('TextIO', chunked_output), *args, **kwargs)
         encoder.visit(ast)
         encoder.flush()
+        chunked_output.flush()
 
     @staticmethod
     def encode_string(ast: BaseAST, *args: Any, **kwargs: Any) -> str:
@@ -348,43 +421,39 @@ class Encoder(Printer, Visitor[BaseAST, None]):
         Encoder.encode(stream, ast, *args, **kwargs)
         return stream.getvalue()
 
+    def render_term(self, term: Term) -> str:
+        """Render the term in one string, each shared subterm once."""
+        rendered = self._rendered_terms.get(id(term))
+        if rendered is not None:
+            return rendered[1]
+
+        if isinstance(term, Metavariable):
+            text = term.name
+        elif isinstance(term, Application):
+            if len(term.subterms) == 0:
+                text = term.symbol
+            else:
+                subterms = ' '.join(map(self.render_term, term.subterms))
+                text = f'( {term.symbol} {subterms} )'
+        else:
+            raise AssertionError(f'not a term: {term}')
+        self._rendered_terms[id(term)] = (term, text)
+        return text
+
     def postvisit_metavariable(self, metavar: Metavariable) -> None:
         self.write(metavar.name)
 
     def postvisit_application(self, application: Application) -> None:
-        if len(application.subterms) == 0:
-            self.write(application.symbol)
-        else:
-            self.write('( ')
-            self.write(application.symbol)
-
-            for subterm in application.subterms:
-                self.write(' ')
-                assert isinstance(subterm, Term), f'not a term: {subterm}'
-                self.visit(subterm)
-
-            self.write(' )')
+        self.write(self.render_term(application))
 
     def postvisit_constant_statement(self, constant_statement: ConstantStatement) -> None:
-        self.write('$c')
-        for constant in constant_statement.constants:
-            self.write(' ')
-            self.write(constant)
-        self.write(' $.')
+        self.write(''.join(('$c', *(' ' + constant for constant in constant_statement.constants), ' $.')))
 
     def postvisit_variable_statement(self, variable_statement: VariableStatement) -> None:
-        self.write('$v')
-        for metavar in variable_statement.metavariables:
-            self.write(' ')
-            self.visit(metavar)
-        self.write(' $.')
+        self.write(''.join(('$v', *(' ' + metavar.name for metavar in variable_statement.metavariables), ' $.')))
 
     def postvisit_disjoint_statement(self, disjoint_statement: DisjointStatement) -> None:
-        self.write('$d')
-        for metavar in disjoint_statement.metavariables:
-            self.write(' ')
-            self.visit(metavar)
-        self.write(' $.')
+        self.write(''.join(('$d', *(' ' + metavar.name for metavar in disjoint_statement.metavariables), ' $.')))
 
     def postvisit_comment(self, comment: Comment) -> None:
         self.write('\n$(')
@@ -416,28 +485,24 @@ class Encoder(Printer, Visitor[BaseAST, None]):
             return '?'
 
     def postvisit_structured_statement(self, stmt: StructuredStatement) -> None:
-        if stmt.label:
-            self.write(stmt.label)
-            self.write(' ')
-
-        self.write('$')
-        self.write(self.get_statement_type(stmt))
+        # The statement is written at once, which is much faster than writing it token by token
+        parts = [stmt.label, ' '] if stmt.label else []
+        parts += ('$', self.get_statement_type(stmt))
 
         for term in stmt.terms:
-            self.write(' ')
-            self.visit(term)
+            parts += (' ', self.render_term(term))
 
         if isinstance(stmt, ProvableStatement):
             if stmt.proof is not None:
                 if self.omit_proof:
-                    self.write(' $= <omitted>')
+                    parts.append(' $= <omitted>')
                 else:
-                    self.write(' $= ')
-                    self.write(stmt.proof)
+                    parts += (' $= ', stmt.proof)
             else:
-                self.write(' $= ?')
+                parts.append(' $= ?')
 
-        self.write(' $.')
+        parts.append(' $.')
+        self.write(''.join(parts))
 
     def postvisit_block(self, block: Block) -> None:
         self.write('${ ')
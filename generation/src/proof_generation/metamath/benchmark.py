@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import argparse
+from time import perf_counter
+
+from proof_generation.claim import Claim
+from proof_generation.interpreter import ExecutionPhase, StatefulInterpreter
+from proof_generation.metamath.converter.converter import MetamathConverter
+from proof_generation.metamath.parser import load_database
+from proof_generation.metamath.translate import TranslatedProofSkeleton, run_proof
+
+
+def benchmark_proof(skeleton: TranslatedProofSkeleton, repeat: int) -> list[float]:
+    """Time the proofs phase of the translated target on a stateful interpreter, once per repetition."""
+    times = []
+    for _ in range(repeat):
+        interpreter = StatefulInterpreter(ExecutionPhase.Gamma, [Claim(claim) for claim in skeleton._claims])
+        skeleton.execute_gamma_phase(interpreter)
+        skeleton.execute_claims_phase(interpreter)
+        start = perf_counter()
+        run_proof(skeleton.proof, skeleton, interpreter)
+        times.append(perf_counter() - start)
+    return times
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Measure the Metamath proof steps translated per second')
+    parser.add_argument('input', help='Input Metamath database path')
+    parser.add_argument('target', help='Lemma whose proof is to be translated')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of timed executions of the proof')
+    args = parser.parse_args()
+
+    start = perf_counter()
+    converter = MetamathConverter(load_database(args.input, include_proof=True))
+    converted = perf_counter()
+    skeleton = TranslatedProofSkeleton(converter, args.target)
+    compiled = perf_counter()
+
+    times = benchmark_proof(skeleton, args.repeat)
+    steps = len(skeleton.proof.steps)
+    best = min(times)
+    print(f'Parsing and conversion: {converted - start:.3f}s')
+    print(f'Compilation of {steps} proof steps: {compiled - converted:.3f}s')
+    print(f'Execution: best {best:.3f}s, mean {sum(times) / len(times):.3f}s over {len(times)} runs')
+    print(f'{steps / best:.0f} steps/s')
+
+
+if __name__ == '__main__':
+    main()
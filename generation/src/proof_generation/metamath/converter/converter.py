@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import re
 from enum import Enum
+from hashlib import sha256
 from typing import TYPE_CHECKING
 
 from mypy_extensions import VarArg
@@ -13,10 +14,12 @@ from proof_generation.metamath.ast import (
     Block,
     ConstantStatement,
     DisjointStatement,
+    Encoder,
     EssentialStatement,
     FloatingStatement,
     Metavariable,
     ProvableStatement,
+    StructuredStatement,
     Term,
     VariableStatement,
 )
@@ -48,12 +51,20 @@ class AxiomType(Enum):
     Substitution = 6
 
 
+# Statements converted in the second sweep, in this order
+_NOTATION = 0
+_AXIOM = 1
+_LEMMA = 2
+
+
 class MetamathConverter:
     """
-    Get the parsed object and try to convert it making as few iterations as possible
+    Get the parsed object and try to convert it making as few iterations as possible.
+    In lazy mode only constants, variables and floatings are imported upfront, and notations, axioms and lemmas
+    are converted on demand together with everything they depend on.
     """
 
-    def __init__(self, parsed: Database) -> None:
+    def __init__(self, parsed: Database, lazy: bool = False) -> None:
         self.parsed = parsed
         self._scope: GlobalScope = GlobalScope()
         self._declared_constants: set[str] = set()
@@ -69,12 +80,19 @@ class MetamathConverter:
         self._missing_declarations: set[str] = set()
         self._floating_patterns: list[str] = []
         self._fp_label_to_pattern: dict[str, tuple[Pattern, ...]] = {}
+        # Statements left for the second sweep by label, with their kind and position to convert them in order
+        self._unconverted: dict[str, tuple[int, int, AxiomaticStatement | ProvableStatement | Block]] = {}
+        # Labels of the notations for each notation symbol
+        self._notation_labels: dict[str, list[str]] = {}
+        # Digests of the unconverted statements by label, and of the statements converted upfront
+        self._statement_digests: dict[str, bytes] = {}
+        self._upfront_digest: bytes | None = None
 
         # Add special cases that formalized in the new format differently
         self._add_builtin_notations()
 
         # Go over all statements 1 by 1
-        self._top_down()
+        self._top_down(lazy)
 
     @property
     def lemmas(self) -> tuple[str, ...]:
@@ -105,9 +123,11 @@ class MetamathConverter:
         return set(self._missing_declarations)
 
     def is_lemma(self, name: str) -> bool:
+        self._convert_on_demand(name)
         return name in self._lemmas
 
     def is_axiom(self, name: str) -> bool:
+        self._convert_on_demand(name)
         return name in self._axioms
 
     def is_pattern_constructor(self, name: str) -> bool:
@@ -129,6 +149,79 @@ class MetamathConverter:
         assert self.is_lemma(name)
         return self._lemmas[name][0]
 
+    def convert(self, *labels: str) -> None:
+        """Convert the given notations, axioms and lemmas and their dependencies, if they are not converted yet."""
+        cone = self._dependency_cone(labels)
+        for kind, _, statement in sorted((self._unconverted.pop(label) for label in cone), key=lambda entry: entry[:2]):
+            if kind == _LEMMA:
+                assert isinstance(statement, ProvableStatement | Block)
+                self._import_lemma(statement)
+            else:
+                assert isinstance(statement, AxiomaticStatement | Block)
+                self._import_axiom(statement)
+
+    def _convert_on_demand(self, name: str) -> None:
+        if name in self._unconverted:
+            self.convert(name)
+
+    def _dependency_cone(self, labels: tuple[str, ...]) -> set[str]:
+        """Labels of the unconverted statements the given ones depend on through notations and proofs, included."""
+        cone: set[str] = set()
+        todo = list(labels)
+        while todo:
+            label = todo.pop()
+            if label in cone or label not in self._unconverted:
+                continue
+            cone.add(label)
+            kind, _, statement = self._unconverted[label]
+
+            statements = statement.statements if isinstance(statement, Block) else (statement,)
+            terms = [term for st in statements if isinstance(st, StructuredStatement) for term in st.terms]
+            # Notations are resolved while converting a term, so they have to be converted first
+            while terms:
+                term = terms.pop()
+                if isinstance(term, Application):
+                    todo += self._notation_labels.get(term.symbol, ())
+                    terms.extend(term.subterms)
+
+            last_statement = statements[-1]
+            if kind == _LEMMA and isinstance(last_statement, ProvableStatement):
+                todo += self._proof_labels(last_statement.proof)
+        return cone
+
+    def dependency_digest(self, label: str) -> str:
+        """
+        Digest of everything a lazy translation of the given unconverted statement depends on: the statements
+        converted upfront and the statements of its dependency cone, in the order they would be converted.
+        """
+        assert label in self._unconverted, f'Not an unconverted statement: {label}'
+        if self._upfront_digest is None:
+            unconverted = {id(statement) for _, _, statement in self._unconverted.values()}
+            upfront = (statement for statement in self.parsed.statements if id(statement) not in unconverted)
+            self._upfront_digest = sha256(''.join(map(Encoder.encode_string, upfront)).encode()).digest()
+
+        digest = sha256(self._upfront_digest)
+        cone = sorted(self._dependency_cone((label,)), key=lambda name: self._unconverted[name][:2])
+        for name in cone:
+            statement_digest = self._statement_digests.get(name)
+            if statement_digest is None:
+                statement = self._unconverted[name][2]
+                statement_digest = self._statement_digests[name] = sha256(
+                    Encoder.encode_string(statement).encode()
+                ).digest()
+            digest.update(statement_digest)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _proof_labels(proof: str | None) -> list[str]:
+        if proof is None:
+            return []
+        steps = proof.split()
+        if steps[:1] == ['(']:
+            # Compressed proofs list their labels in parentheses
+            return steps[1 : steps.index(')')] if ')' in steps else steps[1:]
+        return steps
+
     def publish_axioms(self, interpreter: Interpreter) -> None:
         for axiom in self.exported_axioms_as_objects:
             interpreter.publish_axiom(interpreter.pattern(axiom.pattern))
@@ -178,7 +271,7 @@ class MetamathConverter:
     def _is_symbol(self, name: str) -> bool:
         return name in self._symbols
 
-    def _top_down(self) -> None:
+    def _top_down(self, lazy: bool) -> None:
         """
         Convert the database from top to bottom
         """
@@ -217,6 +310,16 @@ class MetamathConverter:
             else:
                 raise NotImplementedError(f'Unknown statement: {repr(statement)}')
 
+        if lazy:
+            # The second sweep is left to convert
+            for kind, statements in ((_NOTATION, notations), (_AXIOM, axioms), (_LEMMA, lemmas)):
+                for position, statement in enumerate(statements):
+                    self._unconverted[self._get_axiom_name(statement)] = (kind, position, statement)
+            for notation in notations:
+                assert isinstance(notation.terms[1], Application)
+                self._notation_labels.setdefault(notation.terms[1].symbol, []).append(notation.label)
+            return
+
         # Second sweep
         for notation in notations:
             self._import_axiom(notation)
@@ -0,0 +1,284 @@
+from __future__ import annotations
+
+import marshal
+import os
+import sys
+from array import array
+from hashlib import sha256
+from typing import TYPE_CHECKING
+
+from proof_generation.metamath.ast import (
+    Application,
+    AxiomaticStatement,
+    Block,
+    Comment,
+    ConstantStatement,
+    Database,
+    DisjointStatement,
+    EssentialStatement,
+    FloatingStatement,
+    IncludeStatement,
+    Metavariable,
+    ProvableStatement,
+    VariableStatement,
+)
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterable
+    from pathlib import Path
+
+    from proof_generation.metamath.ast import Statement, Term, TermTable
+
+# Bump whenever the encoding or the layout of the AST changes, so that stale caches written by an older version are ignored
+CACHE_FORMAT_VERSION = 1
+CACHE_MAGIC = b'MMDB'
+CACHE_SUFFIX = '.mmdb'
+
+# Tags of the terms in the term table
+_METAVARIABLE = 0
+_APPLICATION = 1
+
+# Tags of the statements
+_CONSTANT = 0
+_VARIABLE = 1
+_DISJOINT = 2
+_FLOATING = 3
+_ESSENTIAL = 4
+_AXIOM = 5
+_PROVABLE = 6
+_BLOCK = 7
+_COMMENT = 8
+_INCLUDE = 9
+
+_STRUCTURED_TAGS: dict[type, int] = {
+    EssentialStatement: _ESSENTIAL,
+    AxiomaticStatement: _AXIOM,
+    ProvableStatement: _PROVABLE,
+}
+
+
+class _DatabaseEncoder:
+    """
+    Flattens a database into a string table and a sequence of integers.
+    Equal terms are stored once in a term table, every term after its subterms, and statements refer to them by index.
+    """
+
+    def __init__(self) -> None:
+        self.strings: dict[str, int] = {}
+        self.term_codes: list[int] = []
+        self.codes: list[int] = []
+        self._terms: dict[tuple[int, ...], int] = {}
+        # Indices of the terms already encoded, the terms are kept alive to keep their identifiers unique
+        self._encoded: dict[int, tuple[Term, int]] = {}
+
+    def string(self, s: str) -> int:
+        index = self.strings.get(s)
+        if index is None:
+            assert '\0' not in s, f'Cannot encode {s!r}'
+            index = self.strings[s] = len(self.strings)
+        return index
+
+    def term(self, term: Term) -> int:
+        encoded = self._encoded.get(id(term))
+        if encoded is not None:
+            return encoded[1]
+
+        if isinstance(term, Metavariable):
+            key: tuple[int, ...] = (_METAVARIABLE, self.string(term.name))
+        elif isinstance(term, Application):
+            subterms = [self.term(subterm) for subterm in term.subterms]
+            key = (_APPLICATION, self.string(term.symbol), len(subterms), *subterms)
+        else:
+            raise NotImplementedError(f'Cannot encode the term {term}')
+
+        index = self._terms.get(key)
+        if index is None:
+            index = self._terms[key] = len(self._terms)
+            self.term_codes += key
+        self._encoded[id(term)] = (term, index)
+        return index
+
+    def statements(self, statements: tuple[Statement, ...]) -> None:
+        self.codes.append(len(statements))
+        for statement in statements:
+            self.statement(statement)
+
+    def statement(self, statement: Statement) -> None:
+        codes = self.codes
+        if isinstance(statement, ConstantStatement):
+            codes += (_CONSTANT, len(statement.constants), *map(self.string, statement.constants))
+        elif isinstance(statement, VariableStatement | DisjointStatement):
+            tag = _VARIABLE if isinstance(statement, VariableStatement) else _DISJOINT
+            codes += (tag, len(statement.metavariables), *(self.string(var.name) for var in statement.metavariables))
+        elif isinstance(statement, FloatingStatement):
+            codes += (_FLOATING, self.string(statement.label), *map(self.term, statement.terms))
+        elif type(statement) in _STRUCTURED_TAGS:
+            assert isinstance(statement, EssentialStatement | AxiomaticStatement | ProvableStatement)
+            terms = [self.term(term) for term in statement.terms]
+            codes += (_STRUCTURED_TAGS[type(statement)], self.string(statement.label), len(terms), *terms)
+            if isinstance(statement, ProvableStatement):
+                # 0 stands for a missing proof
+                codes.append(0 if statement.proof is None else self.string(statement.proof) + 1)
+        elif isinstance(statement, Block):
+            codes.append(_BLOCK)
+            self.statements(statement.statements)
+        elif isinstance(statement, Comment):
+            codes += (_COMMENT, self.string(statement.text))
+        elif isinstance(statement, IncludeStatement):
+            codes += (_INCLUDE, self.string(statement.path))
+        else:
+            raise NotImplementedError(f'Cannot encode the statement {statement}')
+
+
+def _to_bytes(codes: Iterable[int]) -> bytes:
+    encoded = array('I', codes)
+    assert encoded.itemsize == 4
+    if sys.byteorder == 'big':
+        encoded.byteswap()
+    return encoded.tobytes()
+
+
+def _from_bytes(data: bytes) -> list[int]:
+    decoded = array('I')
+    assert decoded.itemsize == 4
+    decoded.frombytes(data)
+    if sys.byteorder == 'big':
+        decoded.byteswap()
+    return decoded.tolist()
+
+
+def encode_database(database: Database) -> tuple[bytes, bytes, bytes]:
+    """Encode the database as its string table, its term table and its statements."""
+    encoder = _DatabaseEncoder()
+    encoder.statements(database.statements)
+    strings = '\0'.join(encoder.strings).encode()
+    return strings, _to_bytes(encoder.term_codes), _to_bytes(encoder.codes)
+
+
+def decode_database(
+    strings_data: bytes, term_data: bytes, statement_data: bytes, term_table: TermTable | None = None
+) -> Database:
+    """Rebuild the database encoded by encode_database, equal terms are shared, through the term table if given."""
+    strings = strings_data.decode().split('\0')
+    application: Callable[[str, tuple[Term, ...]], Application] = Application
+    metavariable: Callable[[str], Metavariable] = Metavariable
+    if term_table is not None:
+        application = term_table.application
+        metavariable = term_table.metavariable
+
+    term_codes = _from_bytes(term_data)
+    terms: list[Term] = []
+    i = 0
+    while i < len(term_codes):
+        if term_codes[i] == _METAVARIABLE:
+            terms.append(metavariable(strings[term_codes[i + 1]]))
+            i += 2
+        else:
+            arity = term_codes[i + 2]
+            start = i + 3
+            subterms = tuple([terms[index] for index in term_codes[start : start + arity]])
+            terms.append(application(strings[term_codes[i + 1]], subterms))
+            i = start + arity
+
+    codes = _from_bytes(statement_data)
+    position = 0
+
+    def read_statements() -> tuple[Statement, ...]:
+        nonlocal position
+        count = codes[position]
+        position += 1
+        statements: list[Statement] = []
+        for _ in range(count):
+            tag = codes[position]
+            position += 1
+            if tag == _CONSTANT or tag == _VARIABLE or tag == _DISJOINT:
+                size = codes[position]
+                names = [strings[index] for index in codes[position + 1 : position + 1 + size]]
+                position += 1 + size
+                if tag == _CONSTANT:
+                    statements.append(ConstantStatement(tuple(names)))
+                elif tag == _VARIABLE:
+                    statements.append(VariableStatement(tuple(map(Metavariable, names))))
+                else:
+                    statements.append(DisjointStatement(tuple(map(Metavariable, names))))
+            elif tag == _FLOATING:
+                label_index, typecode, variable = codes[position : position + 3]
+                position += 3
+                statements.append(FloatingStatement(strings[label_index], (terms[typecode], terms[variable])))
+            elif tag == _ESSENTIAL or tag == _AXIOM or tag == _PROVABLE:
+                label = strings[codes[position]]
+                size = codes[position + 1]
+                statement_terms = tuple([terms[index] for index in codes[position + 2 : position + 2 + size]])
+                position += 2 + size
+                if tag == _ESSENTIAL:
+                    statements.append(EssentialStatement(label, statement_terms))
+                elif tag == _AXIOM:
+                    statements.append(AxiomaticStatement(label, statement_terms))
+                else:
+                    proof = codes[position]
+                    position += 1
+                    statements.append(
+                        ProvableStatement(label, statement_terms, None if proof == 0 else strings[proof - 1])
+                    )
+            elif tag == _BLOCK:
+                statements.append(Block(read_statements()))
+            elif tag == _COMMENT:
+                statements.append(Comment(strings[codes[position]]))
+                position += 1
+            elif tag == _INCLUDE:
+                statements.append(IncludeStatement(strings[codes[position]]))
+                position += 1
+            else:
+                raise ValueError(f'Unknown statement tag {tag}')
+        return tuple(statements)
+
+    database = Database(read_statements())
+    if position != len(codes):
+        raise ValueError('Trailing data after the encoded database')
+    return database
+
+
+def _file_digest(path: str) -> bytes:
+    with open(path, 'rb') as source:
+        return sha256(source.read()).digest()
+
+
+def database_cache_file(cache_dir: Path, path: str, include_proof: bool) -> Path:
+    """The cache file of a database, named after the content of its main file."""
+    digest = sha256(f'v{CACHE_FORMAT_VERSION}:{int(include_proof)}:'.encode())
+    digest.update(_file_digest(path))
+    return cache_dir / f'{digest.hexdigest()}{CACHE_SUFFIX}'
+
+
+def save_database(cache_file: Path, database: Database, included: Iterable[str]) -> None:
+    """Store the parsed database together with the digests of the files it includes."""
+    # Includes are resolved relative to the working directory
+    sources = tuple((path, _file_digest(path)) for path in sorted(included))
+    header = (CACHE_FORMAT_VERSION, os.getcwd() if sources else '', sources)
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    # Write to a temporary file first to never leave a truncated cache behind
+    tmp_file = cache_file.with_suffix(cache_file.suffix + '.tmp')
+    with open(tmp_file, 'wb') as out:
+        out.write(CACHE_MAGIC)
+        out.write(marshal.dumps((header, *encode_database(database))))
+    tmp_file.replace(cache_file)
+
+
+def load_database(cache_file: Path, term_table: TermTable | None = None) -> Database | None:
+    """Load the cached database, or return None if the cache is missing, unreadable or an included file changed."""
+    if not cache_file.exists():
+        return None
+    try:
+        data = cache_file.read_bytes()
+        if not data.startswith(CACHE_MAGIC):
+            return None
+        (version, cwd, sources), strings_data, term_data, statement_data = marshal.loads(data[len(CACHE_MAGIC) :])
+    except (OSError, EOFError, ValueError, TypeError):
+        # Unreadable, truncated or not written by save_database
+        return None
+    if version != CACHE_FORMAT_VERSION or (sources and cwd != os.getcwd()):
+        return None
+    for path, digest in sources:
+        if not os.path.exists(path) or _file_digest(path) != digest:
+            return None
+    return decode_database(strings_data, term_data, statement_data, term_table=term_table)
@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+from collections import deque
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Container, Iterable
+
+
+class LabelGraph:
+    """
+    Directed graph over Metamath labels, e.g. from lemmas to the statements their proofs use.
+    Labels are interned to consecutive indices, and the successors of each node are kept in an adjacency list.
+    """
+
+    def __init__(self) -> None:
+        self.labels: list[str] = []
+        self.indices: dict[str, int] = {}
+        self.successors: list[list[int]] = []
+        # Memoized closures by node
+        self._closures: dict[int, frozenset[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def __contains__(self, label: str) -> bool:
+        return label in self.indices
+
+    def intern(self, label: str) -> int:
+        index = self.indices.get(label)
+        if index is None:
+            index = self.indices[label] = len(self.labels)
+            self.labels.append(label)
+            self.successors.append([])
+        return index
+
+    def add_edges(self, label: str, successors: Iterable[str]) -> None:
+        node = self.intern(label)
+        self.successors[node].extend(map(self.intern, successors))
+        self._closures.clear()
+
+    def get_successors(self, label: str) -> list[str]:
+        return [self.labels[successor] for successor in self.successors[self.indices[label]]]
+
+    def reachable(self, roots: Iterable[str]) -> set[str]:
+        """The labels reachable from the roots, the roots included."""
+        visited = bytearray(len(self.labels))
+        todo: deque[int] = deque()
+        # Roots which are not in the graph have no successors
+        result = set()
+        for root in roots:
+            node = self.indices.get(root)
+            if node is None:
+                result.add(root)
+            elif not visited[node]:
+                visited[node] = 1
+                todo.append(node)
+
+        successors = self.successors
+        while todo:
+            for successor in successors[todo.popleft()]:
+                if not visited[successor]:
+                    visited[successor] = 1
+                    todo.append(successor)
+        result.update(label for label, seen in zip(self.labels, visited, strict=True) if seen)
+        return result
+
+    def _postorder(self, roots: Iterable[int], done: Container[int] = ()) -> list[int]:
+        """The nodes reachable from the roots and not done, each after its successors."""
+        visited = bytearray(len(self.labels))
+        order: list[int] = []
+        successors = self.successors
+        for root in roots:
+            if visited[root] or root in done:
+                continue
+            visited[root] = 1
+            # Nodes on the current path with the position of their next successor to visit
+            path = [(root, 0)]
+            while path:
+                node, position = path[-1]
+                if position == len(successors[node]):
+                    path.pop()
+                    order.append(node)
+                    continue
+                path[-1] = (node, position + 1)
+                successor = successors[node][position]
+                if not visited[successor] and successor not in done:
+                    visited[successor] = 1
+                    path.append((successor, 0))
+        return order
+
+    def topological_order(self, roots: Iterable[str] | None = None) -> list[str]:
+        """
+        The labels reachable from the roots, or all labels, each after its successors.
+        Cycles are broken at the edge that closes them.
+        """
+        nodes = range(len(self.labels)) if roots is None else [self.indices[root] for root in roots if root in self]
+        return [self.labels[node] for node in self._postorder(nodes)]
+
+    def closure(self, label: str) -> frozenset[str]:
+        """The labels reachable from the label through at least one edge, memoized across calls."""
+        node = self.indices.get(label)
+        if node is None:
+            return frozenset()
+        closures, labels, successors = self._closures, self.labels, self.successors
+        for current in self._postorder((node,), closures):
+            closure: set[str] = set()
+            for successor in successors[current]:
+                closure.add(labels[successor])
+                # The successors closing a cycle have no closure yet
+                closure.update(closures.get(successor, ()))
+            closures[current] = frozenset(closure)
+        return closures[node]
@@ -1,6 +1,11 @@
 from __future__ import annotations
 
 import argparse
+import hashlib
+import multiprocessing
+import os
+from collections import deque
+from dataclasses import dataclass, field
 from pathlib import Path
 from typing import TYPE_CHECKING, cast
 
@@ -19,6 +24,7 @@ from proof_generation.metamath.ast import (
     StructuredStatement,
     VariableStatement,
 )
+from proof_generation.metamath.graph import LabelGraph
 from proof_generation.metamath.parser import load_database
 
 if TYPE_CHECKING:
@@ -30,9 +36,12 @@ if TYPE_CHECKING:
 
 def get_constants(terms: Terms) -> set[str]:
     ret: set[str] = {'(', ')', '#Variable', '#ElementVariable', '#SetVariable', '#Pattern', '#Symbol'}
-    for term in terms:
+    todo = list(terms)
+    while todo:
+        term = todo.pop()
         if isinstance(term, Application):
-            ret = ret.union({term.symbol}, get_constants(term.subterms))
+            ret.add(term.symbol)
+            todo.extend(term.subterms)
     return ret
 
 
@@ -59,45 +68,95 @@ def deconstruct_compressed_proof(provable: ProvableStatement) -> tuple[tuple[str
     return (tuple(proof[lemmas_begin:lemmas_end].split()), proof[lemmas_end + 1 :])
 
 
+@dataclass
+class CutAntecedents:
+    """
+    The statements preceding a lemma by label, in the order they are declared, with the lemmas cut to axioms.
+    The constants and metavariables of each statement are computed once.
+    """
+
+    statements: dict[str, FloatingStatement | AxiomaticStatement | Block] = field(default_factory=dict)
+    positions: dict[str, int] = field(default_factory=dict)
+    # The labels of the floating statements by their metavariable
+    floatings: dict[str, list[str]] = field(default_factory=dict)
+    # The pairs of disjoint metavariables with the number of statements declared before them
+    global_disjoints: dict[frozenset[str], int] = field(default_factory=dict)
+    _symbols: dict[str, tuple[set[str], set[str]]] = field(default_factory=dict, init=False, repr=False)
+
+    def add(self, label: str, statement: FloatingStatement | AxiomaticStatement | Block) -> None:
+        if label not in self.statements:
+            self.positions[label] = len(self.positions)
+            if isinstance(statement, FloatingStatement):
+                self.floatings.setdefault(statement.metavariable, []).append(label)
+        self.statements[label] = statement
+        self._symbols.pop(label, None)
+
+    def add_disjoint(self, statement: DisjointStatement) -> None:
+        for var1 in statement.metavariables:
+            for var2 in statement.metavariables:
+                if var1 != var2:
+                    self.global_disjoints.setdefault(frozenset({var1.name, var2.name}), len(self.positions))
+
+    def symbols(self, label: str) -> tuple[set[str], set[str]]:
+        """The constants and the metavariables of the statement."""
+        symbols = self._symbols.get(label)
+        if symbols is None:
+            statement = self.statements[label]
+            symbols = self._symbols[label] = (statements_get_constants((statement,)), statement.get_metavariables())
+        return symbols
+
+
 def supporting_database_for_provable(
-    cut_antecedents: dict[str, FloatingStatement | AxiomaticStatement | Block],
-    global_disjoints: set[frozenset[str]],
-    syntax_deps: dict[str, tuple[str, ...]],
+    cut_antecedents: CutAntecedents,
+    syntax_deps: LabelGraph,
     provable: ProvableStatement,
     essentials: tuple[DisjointStatement | EssentialStatement, ...],
+    declared: int | None = None,
 ) -> Database:
+    """The slice of the provable, using only the first `declared` antecedents, or all of them by default."""
+    positions = cut_antecedents.positions
+    if declared is None:
+        declared = len(positions)
+
     def corresponding_sugar_axiom(label: str) -> str | None:
         if not label.endswith('is-pattern'):
             return None
         sugar_label = label[0 : -len('is-pattern')] + 'is-sugar'
-        if sugar_label not in cut_antecedents.keys():
+        if positions.get(sugar_label, declared) >= declared:
             return None
         return sugar_label
 
     statements: list[Statement] = []
     needed_lemmas_tuple, _ = deconstruct_compressed_proof(provable)
-    needed_lemmas = frozenset(needed_lemmas_tuple)
-    needed_lemmas |= frozenset(filter(None, map(corresponding_sugar_axiom, needed_lemmas)))
-    for lemma in needed_lemmas:
-        needed_lemmas |= frozenset(syntax_deps.get(lemma, ()))
-
-    needed_constants = set()
-    needed_metavariables = set()
-    for needed in (provable, *essentials, *(cut_antecedents[lemma_name] for lemma_name in needed_lemmas)):
-        needed_constants.update(statements_get_constants((needed,)))
-        needed_metavariables.update(needed.get_metavariables())
+    needed_lemmas = set(needed_lemmas_tuple)
+    needed_lemmas.update(filter(None, map(corresponding_sugar_axiom, needed_lemmas_tuple)))
+    for lemma in tuple(needed_lemmas):
+        needed_lemmas.update(syntax_deps.closure(lemma))
+
+    needed_constants = statements_get_constants((provable, *essentials))
+    needed_metavariables = provable.get_metavariables()
+    for essential in essentials:
+        needed_metavariables.update(essential.get_metavariables())
+    for lemma_name in needed_lemmas:
+        constants, metavariables = cut_antecedents.symbols(lemma_name)
+        needed_constants.update(constants)
+        needed_metavariables.update(metavariables)
 
     statements.append(ConstantStatement(tuple(sorted(needed_constants))))
     if needed_metavariables:
         statements.append(VariableStatement(tuple(Metavariable(var) for var in sorted(needed_metavariables))))
-    for pair in global_disjoints:
-        if pair.issubset(needed_metavariables):
-            statements.append(DisjointStatement(tuple(Metavariable(var) for var in pair)))
-    for lemma_name, lemma_statement in cut_antecedents.items():
-        if lemma_name in needed_lemmas or (
-            isinstance(lemma_statement, FloatingStatement) and lemma_statement.metavariable in needed_metavariables
-        ):
-            statements.append(lemma_statement)
+    for pair, position in cut_antecedents.global_disjoints.items():
+        if position <= declared and pair.issubset(needed_metavariables):
+            statements.append(DisjointStatement(tuple(Metavariable(var) for var in sorted(pair))))
+    # The floating statements of the needed metavariables are needed as well, all in the order they are declared
+    needed_floatings = (
+        label
+        for var in needed_metavariables
+        for label in cut_antecedents.floatings.get(var, ())
+        if positions[label] < declared
+    )
+    for lemma_name in sorted({*needed_lemmas, *needed_floatings}, key=positions.__getitem__):
+        statements.append(cut_antecedents.statements[lemma_name])
     statements.append(Block((*essentials, provable)))
 
     return Database(tuple(statements))
@@ -108,9 +167,9 @@ def match_axiom(statement: Statement) -> AxiomaticStatement | None:
     if isinstance(statement, AxiomaticStatement):
         return statement
     if isinstance(statement, Block):
-        substatements = list(statement.statements)
+        substatements = deque(statement.statements)
         while substatements:
-            substatement, *substatements = substatements
+            substatement = substatements.popleft()
             if isinstance(substatement, Block):
                 substatements += substatement.statements
             elif not isinstance(substatement, (DisjointStatement, EssentialStatement, AxiomaticStatement)):
@@ -144,53 +203,66 @@ def construct_axiom(
     return Block((*antecedents, AxiomaticStatement(consequent.label, consequent.terms)))
 
 
-def slice_database(
-    input_database: Database, syntax_deps: dict[str, tuple[str, ...]], include: set[str], exclude: set[str]
-) -> Iterator[tuple[str, Database]]:
+@dataclass(frozen=True)
+class SliceTarget:
+    """A provable statement to slice, declared after the first `declared` cut antecedents."""
+
+    essentials: tuple[DisjointStatement | EssentialStatement, ...]
+    provable: ProvableStatement
+    declared: int
+
+
+def scan_database(
+    input_database: Database, include: set[str], exclude: set[str]
+) -> tuple[CutAntecedents, list[SliceTarget]]:
     """Of the top-level statements, only floating statements are mandatory hypothesis.
     They are thus order sensitive.
     """
-    cut_antecedents: dict[str, FloatingStatement | AxiomaticStatement | Block] = {}
-    global_disjoints: set[frozenset[str]] = set()
+    cut_antecedents = CutAntecedents()
+    targets: list[SliceTarget] = []
 
     for statement in input_database.statements:
         """Constants and variables can be ignored since we can deduce the set of constants from the parsed statement."""
         if isinstance(statement, (ConstantStatement, VariableStatement)):
             continue
         elif isinstance(statement, DisjointStatement):
-            for var1 in statement.metavariables:
-                for var2 in statement.metavariables:
-                    if var1 != var2:
-                        global_disjoints.add(frozenset({var1.name, var2.name}))
+            cut_antecedents.add_disjoint(statement)
         elif isinstance(statement, FloatingStatement):
-            cut_antecedents[statement.label] = statement
+            cut_antecedents.add(statement.label, statement)
         elif axiom_conclusion := match_axiom(statement):
-            cut_antecedents[axiom_conclusion.label] = cast('AxiomaticStatement | Block', statement)
+            cut_antecedents.add(axiom_conclusion.label, cast('AxiomaticStatement | Block', statement))
         elif isinstance(statement, (ProvableStatement, Block)):
             antecedents, consequent = deconstruct_provable(statement)
             if (consequent.label in include) and (consequent.label not in exclude):
-                yield (
-                    consequent.label,
-                    supporting_database_for_provable(
-                        cut_antecedents, global_disjoints, syntax_deps, consequent, antecedents
-                    ),
-                )
-            cut_antecedents[consequent.label] = construct_axiom(antecedents, consequent)
+                targets.append(SliceTarget(antecedents, consequent, len(cut_antecedents.positions)))
+            cut_antecedents.add(consequent.label, construct_axiom(antecedents, consequent))
         else:
             assert 'Unanticipated statement type', type(statement)
 
+    return cut_antecedents, targets
 
-def dependency_graph(database: Database) -> dict[str, tuple[str, ...]]:
-    ret = {}
 
-    def collect(stmt: Statement) -> Statement:
-        nonlocal ret
-        if isinstance(stmt, ProvableStatement):
-            lemmas, _ = deconstruct_compressed_proof(stmt)
-            ret[stmt.label] = lemmas
-        return stmt
+def slice_database(
+    input_database: Database, syntax_deps: LabelGraph, include: set[str], exclude: set[str]
+) -> Iterator[tuple[str, Database]]:
+    cut_antecedents, targets = scan_database(input_database, include, exclude)
+    for target in targets:
+        yield target.provable.label, supporting_database_for_provable(
+            cut_antecedents, syntax_deps, target.provable, target.essentials, target.declared
+        )
+
 
-    database.bottom_up(collect)
+def dependency_graph(database: Database) -> LabelGraph:
+    """The graph from the labels of the provable statements to the labels their compressed proofs use."""
+    ret = LabelGraph()
+    todo = list(database.statements)
+    while todo:
+        stmt = todo.pop()
+        if isinstance(stmt, Block):
+            todo.extend(stmt.statements)
+        elif isinstance(stmt, ProvableStatement):
+            lemmas, _ = deconstruct_compressed_proof(stmt)
+            ret.add_edges(stmt.label, lemmas)
     return ret
 
 
@@ -198,27 +270,24 @@ def is_structured_statement(stmt: Statement) -> TypeGuard[StructuredStatement]:
     return isinstance(stmt, StructuredStatement)
 
 
-def syntax_dependencies(database: Database) -> dict[str, tuple[str, ...]]:
-    """Returns a maps from labels of structured statements to the
-    notation and symbol axioms it depends on.
-    e.g. `foo-is-sugar` and `foo-is-pattern`, and `sigma-is-symbol`
-    axioms it depends on.
+def syntax_dependencies(database: Database) -> LabelGraph:
+    """Returns the graph from labels of structured statements to the
+    notation and symbol axioms they use directly.
+    e.g. `foo-is-sugar` and `foo-is-pattern`, and `sigma-is-symbol`.
+    The closure of a label is all the axioms it depends on.
     """
 
     syntax_defs: dict[str, str] = {}
-    ret: dict[str, tuple[str, ...]] = {}
-
-    def collect_needed_syntax(term: Term) -> tuple[str, ...]:
-        ret: list[str] = []
-
-        def _collect(term: Term) -> Term:
-            nonlocal ret
-            if isinstance(term, Application) and term.symbol in syntax_defs:
-                ret += (syntax_defs[term.symbol],)
-            return term
+    ret = LabelGraph()
 
-        term.bottom_up(_collect)
-        return tuple(ret)
+    def collect_needed_syntax(term: Term, used_notations: dict[str, None]) -> None:
+        todo = [term]
+        while todo:
+            term = todo.pop()
+            if isinstance(term, Application):
+                if term.symbol in syntax_defs:
+                    used_notations[syntax_defs[term.symbol]] = None
+                todo.extend(term.subterms)
 
     for stmt in database.statements:
         substmts: tuple[StructuredStatement, ...]
@@ -230,7 +299,8 @@ def syntax_dependencies(database: Database) -> dict[str, tuple[str, ...]]:
             continue
         conclusion = substmts[-1]
 
-        used_notations: tuple[str, ...] = ()
+        # Ordered and without duplicates
+        used_notations: dict[str, None] = {}
 
         if conclusion.label.endswith('is-symbol'):
             assert len(conclusion.terms) == 2, conclusion
@@ -244,51 +314,95 @@ def syntax_dependencies(database: Database) -> dict[str, tuple[str, ...]]:
             assert sharp == Application('#Notation')
             assert isinstance(lhs, Application)
             syntax_defs[lhs.symbol] = conclusion.label
-            notation_is_pattern = conclusion.label[0 : -len('sugar')] + 'pattern'
-            used_notations = used_notations + (notation_is_pattern, *collect_needed_syntax(conclusion.terms[2]))
+            used_notations[conclusion.label[0 : -len('sugar')] + 'pattern'] = None
+            collect_needed_syntax(conclusion.terms[2], used_notations)
 
         for substmt in substmts:
             match substmt.terms[0]:
                 case Application('#Substitution'):
-                    used_notations = (
-                        used_notations
-                        + collect_needed_syntax(substmt.terms[1])
-                        + collect_needed_syntax(substmt.terms[2])
-                    )
+                    collect_needed_syntax(substmt.terms[1], used_notations)
+                    collect_needed_syntax(substmt.terms[2], used_notations)
                 case Application('|-'):
-                    used_notations = used_notations + collect_needed_syntax(substmt.terms[1])
+                    collect_needed_syntax(substmt.terms[1], used_notations)
 
-        syntax_deps = []
-        for syntax_def in used_notations:
-            syntax_deps += [syntax_def, *ret[syntax_def]]
-        ret[conclusion.label] = tuple(syntax_deps)
+        ret.add_edges(conclusion.label, used_notations)
 
     return ret
 
 
-def transitive_closure(dependency_graph: dict[str, tuple[str, ...]], include: list[str]) -> set[str]:
-    unprocessed_lemmas: list[str] = include
-    ret: set[str] = set()
-    while unprocessed_lemmas:
-        lemma, *unprocessed_lemmas = unprocessed_lemmas
-        if lemma in dependency_graph and lemma not in ret:
-            unprocessed_lemmas += dependency_graph[lemma]
-        ret.add(lemma)
-    return ret
+def transitive_closure(dependency_graph: LabelGraph, include: Iterable[str]) -> set[str]:
+    return dependency_graph.reachable(include)
+
+
+@dataclass
+class Slicing:
+    cut_antecedents: CutAntecedents
+    syntax_deps: LabelGraph
+    targets: list[SliceTarget]
+    output_dir: Path
+    changed_only: bool = False
+
+
+# The slicing shared by the workers, set before forking them so that they inherit it
+_slicing: Slicing | None = None
+
+
+def _write_slice(index: int) -> bool:
+    """Write the slice of the target to its file, and return whether the file was written."""
+    assert _slicing is not None
+    target = _slicing.targets[index]
+    slice = supporting_database_for_provable(
+        _slicing.cut_antecedents, _slicing.syntax_deps, target.provable, target.essentials, target.declared
+    )
+    text = Encoder.encode_string(slice)
+    path = _slicing.output_dir / (target.provable.label + '.mm')
+    if _slicing.changed_only and path.exists():
+        digest = hashlib.sha256(text.encode()).digest()
+        if hashlib.sha256(path.read_bytes()).digest() == digest:
+            return False
+    with open(path, 'w') as output_file:
+        output_file.write(text)
+    return True
+
+
+def write_slices(slicing: Slicing, processes: int = 1) -> int:
+    """
+    Write the slices of the targets to the output directory and return the number of files written.
+    With more than one process the slices are built by forked workers, which share the scanned database.
+    """
+    global _slicing
+    _slicing = slicing
+    indices = range(len(slicing.targets))
+    try:
+        if processes > 1 and len(indices) > 1 and 'fork' in multiprocessing.get_all_start_methods():
+            with multiprocessing.get_context('fork').Pool(min(processes, len(indices))) as pool:
+                return sum(pool.imap_unordered(_write_slice, indices, chunksize=16))
+        return sum(map(_write_slice, indices))
+    finally:
+        _slicing = None
 
 
 def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument('input', help='Input Metamath database path')
     parser.add_argument('output', help='Output directory')
+    parser.add_argument('--database-cache', type=Path, help='Directory of the cached parsed databases')
+    parser.add_argument(
+        '-j', '--jobs', type=int, default=None, help='Number of worker processes, by default the number of CPUs'
+    )
+    parser.add_argument(
+        '--changed-only',
+        action='store_true',
+        help='Reuse an existing output directory and only rewrite the slices whose content changed',
+    )
     args = parser.parse_args()
 
     print('Parsing database...', end='', flush=True)
-    input_database = load_database(args.input, include_proof=True)
+    input_database = load_database(args.input, include_proof=True, cache_dir=args.database_cache)
     print(' Done.')
 
     output_dir = Path(args.output)
-    output_dir.mkdir()
+    output_dir.mkdir(exist_ok=args.changed_only)
 
     exclude: set[str] = set()
 
@@ -305,10 +419,10 @@ def main() -> None:
     print(' Done.')
 
     print('Writing slices...', end='', flush=True)
-    for label, slice in slice_database(input_database, syntax_deps, include=include, exclude=exclude):
-        with open(output_dir / (label + '.mm'), 'w') as output_file:
-            Encoder.encode(output_file, slice)
-    print(' Done.')
+    cut_antecedents, targets = scan_database(input_database, include=include, exclude=exclude)
+    slicing = Slicing(cut_antecedents, syntax_deps, targets, output_dir, args.changed_only)
+    written = write_slices(slicing, args.jobs if args.jobs else os.cpu_count() or 1)
+    print(f' Done. {written} written, {len(targets) - written} unchanged.')
 
 
 if __name__ == '__main__':
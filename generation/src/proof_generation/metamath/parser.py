@@ -4,12 +4,10 @@ import os
 import re
 from typing import TYPE_CHECKING
 
-from lark import Lark, Token, Transformer
-
+from proof_generation.metamath import database_cache
 from proof_generation.metamath.ast import (
     Application,
     AxiomaticStatement,
-    BaseAST,
     Block,
     ConstantStatement,
     Database,
@@ -22,160 +20,194 @@ from proof_generation.metamath.ast import (
 )
 
 if TYPE_CHECKING:
-    from collections.abc import Iterable
-
-    from proof_generation.metamath.ast import Statement, Term, Terms
-
-
-class ASTTransformer(Transformer[Token, BaseAST]):
-    def __init__(self, metavariables: Iterable[str] = ()) -> None:
-        super().__init__()
-        self.metavariables = list(metavariables)
+    from collections.abc import Callable, Iterable, Iterator
+    from pathlib import Path
 
-    def token(self, args: list[Token]) -> str:
-        assert isinstance(args[0].value, str)
-        return args[0].value
+    from proof_generation.metamath.ast import Statement, Term, Terms, TermTable
 
-    def constant_stmt(self, args: list[str]) -> ConstantStatement:
-        return ConstantStatement(tuple(args))
 
-    def variable_stmt(self, args: list[str]) -> VariableStatement:
-        self.metavariables += args
-        return VariableStatement(tuple(map(Metavariable, args)))
+# The keywords are the only tokens which contain a $, the tokens around them need no whitespace
+_TOKEN = re.compile(r'\$.|[^$]+')
+_WHITESPACE = ' \n\t\f\r'
 
-    def disjoint_stmt(self, args: list[str]) -> DisjointStatement:
-        for var in args:
-            assert var in self.metavariables, f'variable {var} used before declaration'
-        return DisjointStatement(tuple(map(Metavariable, args)))
-
-    def floating_stmt(self, args: list[str]) -> FloatingStatement:
-        label, typecode, variable = args
-        assert variable in self.metavariables, f'variable {variable} used before declaration'
-        return FloatingStatement(label, (Application(typecode), Metavariable(variable)))
-
-    def parse_term(self, tokens: list[str]) -> tuple[Term, list[str]]:
-        """
-        Parse a term from a list of tokens, returns the term and the rest of the unused tokens
-        """
-        assert len(tokens)
-
-        first = tokens[0]
-        if first == '(':
-            # separate out sublist of tokens with balanced parentheses
-            num_nested = 1
-            for i, token in enumerate(tokens[1:]):  # noqa: B007
-                if token == '(':
-                    num_nested += 1
-                elif token == ')':
-                    num_nested -= 1
-                if num_nested == 0:
-                    break
-
-            # offset to include the first token
-            i += 1
 
-            assert num_nested == 0, 'incorrectly nested term: {}'.format(' '.join(tokens))
-            assert i > 2, 'ill-formed s-expression: {}'.format(' '.join(tokens))
-
-            subterms = self.parse_terms(tokens[2:i])
-            constant = tokens[1]
-            return Application(constant, subterms), tokens[i + 1 :]
-
-        elif first in self.metavariables:
-            return Metavariable(first), tokens[1:]
+def _split_tokens(src: str) -> list[str]:
+    tokens = src.split()
+    if '$' not in src:
+        return tokens
+    split: list[str] = []
+    for token in tokens:
+        if len(token) == 2 and token[0] == '$' or '$' not in token:
+            split.append(token)
         else:
-            return Application(first), tokens[1:]
-
-    def parse_terms(self, tokens: list[str]) -> Terms:
-        terms = []
-        while len(tokens):
-            term, tokens = self.parse_term(tokens)
-            terms.append(term)
-        return tuple(terms)
-
-    def axiom_stmt(self, args: list[str]) -> AxiomaticStatement:
-        label, *tokens = args
-        terms = self.parse_terms(tokens)
-        return AxiomaticStatement(label, terms)
-
-    def essential_stmt(self, args: list[str]) -> EssentialStatement:
-        label, *tokens = args
-        terms = self.parse_terms(tokens)
-        return EssentialStatement(label, terms)
+            split += _TOKEN.findall(token)
+    return split
 
-    def proof(self, args: list[str]) -> list[str]:
-        return args
 
-    def provable_stmt(self, args: list[str]) -> ProvableStatement:
-        label, *args = args
-        script = list(args[-1])
-        tokens = args[:-1]
-        terms = self.parse_terms(tokens)
-        return ProvableStatement(label, terms, ' '.join(script))
-
-    def block(self, args: list[Statement]) -> Block:
-        return Block(tuple(args))
-
-    def database(self, args: list[Statement]) -> Database:
-        return Database(tuple(args))
-
-
-syntax = r"""
-// see http://us.metamath.org/downloads/metamath.pdf appendix E for more info
-// this syntax is more relaxed than the standard syntax
-
-COMMENT: /\$\(((.|\n)(?<!\$\)))*\$\)/
-
-%ignore COMMENT
-%ignore /[ \n\t\f\r]+/
+def tokenize(chunks: Iterable[str]) -> Iterator[str]:
+    """
+    Split the source, given in chunks of any size, into tokens, skipping comments.
+    Only the part of the source which may still belong to an incomplete token or comment is kept between chunks.
+    """
+    pending = ''
+    for chunk in chunks:
+        pending += chunk
+        while True:
+            comment = pending.find('$(')
+            if comment < 0:
+                # Whatever follows the last whitespace may continue in the next chunk
+                end = max(map(pending.rfind, _WHITESPACE)) + 1
+                break
+            comment_end = pending.find('$)', comment + 2)
+            if comment_end < 0:
+                end = comment
+                break
+            yield from _split_tokens(pending[:comment])
+            pending = pending[comment_end + 2 :]
+        if end > 0:
+            yield from _split_tokens(pending[:end])
+            pending = pending[end:]
 
-TOKEN: /[^ \n\t\f\r\$]+/
+    if '$(' in pending:
+        raise ValueError('Unterminated comment')
+    yield from _split_tokens(pending)
 
-token: TOKEN
 
-database: stmt*
+class MetamathParser:
+    """
+    Single pass parser producing the same AST as the former Lark grammar, with its relaxations of the standard syntax.
+    Terms are built with an explicit stack instead of re-tokenizing every s-expression.
+    Given a term table, equal terms are shared.
+    """
 
-stmt: "$c" token+ "$."                   -> constant_stmt
-    | "$v" token+ "$."                   -> variable_stmt
-    | "$d" token+ "$."                   -> disjoint_stmt
-    | token "$f" token token "$."        -> floating_stmt
-    | token "$e" token+ "$."             -> essential_stmt
-    | token "$a" token+ "$."             -> axiom_stmt
-    | token "$p" token+ "$=" proof "$."  -> provable_stmt
-    | "${" stmt* "$}"                    -> block
+    def __init__(self, metavariables: Iterable[str] = (), term_table: TermTable | None = None) -> None:
+        self.metavariables = set(metavariables)
+        self.application: Callable[[str, tuple[Term, ...]], Application] = Application
+        self.metavariable: Callable[[str], Metavariable] = Metavariable
+        if term_table is not None:
+            self.application = term_table.application
+            self.metavariable = term_table.metavariable
+
+    def parse_database(self, tokens: Iterable[str]) -> Database:
+        return Database(self.parse_statements(iter(tokens), in_block=False))
+
+    def parse_statements(self, tokens: Iterator[str], in_block: bool) -> tuple[Statement, ...]:
+        statements: list[Statement] = []
+        for token in tokens:
+            if token == '$}':
+                if not in_block:
+                    raise ValueError('Unexpected $} outside of a block')
+                return tuple(statements)
+            statements.append(self.parse_statement(token, tokens))
+        if in_block:
+            raise ValueError('Missing $} at the end of the source')
+        return tuple(statements)
+
+    @staticmethod
+    def read_until(tokens: Iterator[str], end: str) -> list[str]:
+        args: list[str] = []
+        for token in tokens:
+            if token[0] == '$':
+                if token == end:
+                    if not args:
+                        raise ValueError(f'Expected a token before {end}')
+                    return args
+                raise ValueError(f'Unexpected {token}, expected {end}')
+            args.append(token)
+        raise ValueError(f'Missing {end} at the end of the source')
+
+    def check_declared(self, variables: Iterable[str]) -> None:
+        for var in variables:
+            assert var in self.metavariables, f'variable {var} used before declaration'
 
-proof: token*
-"""
+    def parse_statement(self, token: str, tokens: Iterator[str]) -> Statement:
+        if token == '$c':
+            return ConstantStatement(tuple(self.read_until(tokens, '$.')))
+        if token == '$v':
+            args = self.read_until(tokens, '$.')
+            self.metavariables.update(args)
+            return VariableStatement(tuple(map(Metavariable, args)))
+        if token == '$d':
+            args = self.read_until(tokens, '$.')
+            self.check_declared(args)
+            return DisjointStatement(tuple(map(Metavariable, args)))
+        if token == '${':
+            return Block(self.parse_statements(tokens, in_block=True))
+        if token[0] == '$':
+            raise ValueError(f'Unexpected {token}')
+
+        label = token
+        keyword = next(tokens, '')
+        if keyword == '$f':
+            args = self.read_until(tokens, '$.')
+            if len(args) != 2:
+                raise ValueError(f'Expected a typecode and a variable in {label}')
+            typecode, variable = args
+            self.check_declared([variable])
+            return FloatingStatement(label, (self.application(typecode, ()), self.metavariable(variable)))
+        if keyword == '$e':
+            return EssentialStatement(label, self.parse_terms(self.read_until(tokens, '$.')))
+        if keyword == '$a':
+            return AxiomaticStatement(label, self.parse_terms(self.read_until(tokens, '$.')))
+        if keyword == '$p':
+            terms = self.parse_terms(self.read_until(tokens, '$='))
+            script: list[str] = []
+            for token in tokens:
+                if token == '$.':
+                    return ProvableStatement(label, terms, ' '.join(script))
+                if token[0] == '$':
+                    raise ValueError(f'Unexpected {token} in the proof of {label}')
+                script.append(token)
+            raise ValueError(f'Missing $. after the proof of {label}')
+        raise ValueError(f'Unexpected {keyword or "end of the source"} after {label}')
 
-database_parser = Lark(
-    syntax,
-    start='database',
-    parser='lalr',
-    lexer='basic',
-    propagate_positions=True,
-)
-
-statement_parser = Lark(
-    syntax,
-    start='stmt',
-    parser='lalr',
-    lexer='basic',
-    propagate_positions=True,
-)
+    def parse_terms(self, tokens: list[str]) -> Terms:
+        """Parse s-expressions, where a token is a metavariable if it has been declared and a constant otherwise."""
+        metavariables = self.metavariables
+        application = self.application
+        metavariable = self.metavariable
+        terms: list[Term] = []
+        # Symbols and subterms of the applications whose closing parenthesis is still to come
+        open_applications: list[tuple[str, list[Term]]] = []
+        siblings = terms
+        i = 0
+        while i < len(tokens):
+            token = tokens[i]
+            i += 1
+            if token == '(':
+                if i == len(tokens) or tokens[i] in ('(', ')'):
+                    raise ValueError('ill-formed s-expression: {}'.format(' '.join(tokens)))
+                siblings = []
+                open_applications.append((tokens[i], siblings))
+                i += 1
+                continue
+
+            term: Term
+            if token == ')':
+                if not open_applications:
+                    raise ValueError('incorrectly nested term: {}'.format(' '.join(tokens)))
+                symbol, subterms = open_applications.pop()
+                if not subterms:
+                    raise ValueError('ill-formed s-expression: {}'.format(' '.join(tokens)))
+                term = application(symbol, tuple(subterms))
+                siblings = open_applications[-1][1] if open_applications else terms
+            elif token in metavariables:
+                term = metavariable(token)
+            else:
+                term = application(token, ())
+            siblings.append(term)
+
+        if open_applications:
+            raise ValueError('incorrectly nested term: {}'.format(' '.join(tokens)))
+        return tuple(terms)
 
 
 def parse_database(src: str) -> Database:
-    tree = database_parser.parse(src)
-    ast = ASTTransformer().transform(tree)
-    assert isinstance(ast, Database)
-    return ast
+    return MetamathParser().parse_database(tokenize([src]))
 
 
 def parse_terms_with_metavariables(src: str, metavariables: frozenset[str] = frozenset()) -> Terms:
-    tree = statement_parser.parse(f'l $a {src} $.')
-    stmt = ASTTransformer(metavariables).transform(tree)
-    assert isinstance(stmt, AxiomaticStatement)
-    return stmt.terms
+    return MetamathParser(metavariables).parse_terms(list(tokenize([src])))
 
 
 def parse_term_with_metavariables(src: str, metavariables: frozenset[str] = frozenset()) -> Term:
@@ -184,48 +216,83 @@ def parse_term_with_metavariables(src: str, metavariables: frozenset[str] = froz
     return terms[0]
 
 
-def flatten_includes(path: str, loaded: set[str], trace: tuple[str, ...] = (), include_proof: bool = True) -> str:
+# Number of characters read at once from a source file
+SOURCE_CHUNK_SIZE = 1 << 16
+
+
+def read_chunks(path: str, chunk_size: int = SOURCE_CHUNK_SIZE) -> Iterator[str]:
+    with open(path) as mm_file:
+        while chunk := mm_file.read(chunk_size):
+            yield chunk
+
+
+def source_tokens(
+    path: str, loaded: set[str], trace: tuple[str, ...] = (), include_proof: bool = True
+) -> Iterator[str]:
     """
-    Load a file and resolve all includes
+    Tokens of a file with its includes resolved, in a single pass over the file read in chunks.
+    Comments are skipped and, unless include_proof is set, proofs are replaced by ?.
+    Files which have been loaded already are skipped.
     """
     path = os.path.realpath(path)
 
     if path in loaded:
-        return ''
+        return
 
     if path in trace:
         raise Exception(f'recursivly loading {path}')
 
-    with open(path) as mm_file:
-        source = mm_file.read()
-
-        if not include_proof:
-            source = remove_proof(source)
-
-        while True:
-            match = re.search(r'\$\[\s+([^\s]+)\s+\$\]', source)
-            if match is None:
-                break
-
-            include_path = match.group(1)
-
-            # if not os.path.isabs(include_path):
-            #     include_path = os.path.join(os.path.dirname(path), include_path)
-
-            included_source = flatten_includes(include_path, loaded, trace=trace + (path,), include_proof=include_proof)
-            source = source[: match.start()] + included_source + source[match.end() :]
+    tokens = tokenize(read_chunks(path))
+    for token in tokens:
+        if token == '$[':
+            include_path = next(tokens, '$]')
+            if include_path[0] == '$' or next(tokens, '') != '$]':
+                raise ValueError(f'Ill-formed include in {path}')
+            # Include paths are relative to the working directory
+            yield from source_tokens(include_path, loaded, trace=trace + (path,), include_proof=include_proof)
+        elif token == '$=' and not include_proof:
+            yield token
+            yield '?'
+            for token in tokens:
+                if token[0] == '$':
+                    yield token
+                    break
+        else:
+            yield token
 
     loaded.add(path)
 
-    return source
 
-
-def remove_proof(src: str) -> str:
-    # remove comments first
-    src = re.sub(r'\$\(((.|\n)(?<!\$\)))*\$\)', '', src)
-    return re.sub(r'\$=\s*[^\$]*\s*\$\.', '$= ? $.', src)
+def flatten_includes(path: str, loaded: set[str], trace: tuple[str, ...] = (), include_proof: bool = True) -> str:
+    """
+    Load a file and resolve all includes
+    """
+    return ' '.join(source_tokens(path, loaded, trace, include_proof))
 
 
-def load_database(path: str, include_proof: bool = True) -> Database:
-    src = flatten_includes(path, set(), include_proof=include_proof)
-    return parse_database(src)
+def load_database(
+    path: str, include_proof: bool = True, cache_dir: Path | None = None, term_table: TermTable | None = None
+) -> Database:
+    """
+    Parse the database and its includes, reusing the cached AST in cache_dir unless one of the files changed.
+    Terms are interned in the given table, if any.
+    """
+    if cache_dir is None:
+        return MetamathParser(term_table=term_table).parse_database(
+            source_tokens(path, set(), include_proof=include_proof)
+        )
+
+    cache_file = database_cache.database_cache_file(cache_dir, path, include_proof)
+    database = database_cache.load_database(cache_file, term_table)
+    if database is not None:
+        return database
+
+    loaded: set[str] = set()
+    database = MetamathParser(term_table=term_table).parse_database(
+        source_tokens(path, loaded, include_proof=include_proof)
+    )
+    try:
+        database_cache.save_database(cache_file, database, loaded - {os.path.realpath(path)})
+    except OSError as e:
+        print(f'Failed to cache the parsed database in {cache_file}: {e}')
+    return database
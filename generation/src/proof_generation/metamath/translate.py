@@ -1,196 +1,287 @@
 from __future__ import annotations
 
 import argparse
+import multiprocessing
 import os
+import shutil
+import sys
+from collections import Counter
+from dataclasses import dataclass
+from enum import Enum
+from hashlib import sha256
 from pathlib import Path
+from time import perf_counter
 from typing import TYPE_CHECKING
 
 from proof_generation.aml import Implies, MetaVar, Pattern
 from proof_generation.interpreter import ExecutionPhase, InterpreterTransformer, StatefulInterpreter
+from proof_generation.metamath.ast import Application, Block, ProvableStatement
 from proof_generation.metamath.converter.converter import MetamathConverter
 from proof_generation.metamath.converter.representation import AxiomWithAntecedents
 from proof_generation.metamath.parser import load_database
-from proof_generation.proof import ProofExp
+from proof_generation.proof import OutputFormat, ProofExp
 from proof_generation.proved import Proved
 
 if TYPE_CHECKING:
+    from collections.abc import Iterator
+
     from proof_generation.interpreter import Interpreter
+    from proof_generation.metamath.ast import Database
+    from proof_generation.proof import ProofThunk
 
 
-def exec_proof(converter: MetamathConverter, target: str, proofexp: ProofExp, interp: Interpreter) -> None:
-    core_interp = interp
-    if isinstance(interp, InterpreterTransformer):
-        core_interp = interp.core_interpreter
+class ProofOp(Enum):
+    Save = 0
+    Load = 1
+    App = 2
+    Implies = 3
+    PatternConstructor = 4
+    MetaVar = 5
+    Axiom = 6
+    Prop1 = 7
+    Prop2 = 8
+    ModusPonens = 9
 
-    assert isinstance(core_interp, StatefulInterpreter)
-    stack = lambda: core_interp.stack
 
-    interpreter = lambda: interp
+@dataclass(frozen=True)
+class ProofStep:
+    op: ProofOp
+    # The pattern built by a pattern constructor or a metavariable step, or the loaded axiom
+    pattern: Pattern | None = None
+    # Metavariables instantiated with the patterns below the top of the stack, None to not instantiate
+    metavars: tuple[int, ...] | None = None
+    # The Metamath memory index of a load, or the number of antecedents of an axiom
+    index: int = 0
 
-    def get_delta(metavars: tuple[str, ...]) -> dict[int, Pattern]:
-        delta: dict[int, Pattern] = {}
 
-        nargs = len(metavars)
-        i = 0
-        for metavar_label in metavars:
-            metavar = converter.resolve_metavar(metavar_label)
-            pat = stack()[-(nargs + 1) + i]
-            assert isinstance(pat, Pattern)
-            delta[metavar.name] = pat
-            i += 1
+@dataclass(frozen=True)
+class CompiledProof:
+    """A Metamath proof whose labels are resolved, so that it can be executed without querying the converter."""
 
-        return delta
+    target: str
+    conclusion: Pattern
+    steps: tuple[ProofStep, ...]
 
-    def do_mp() -> None:
-        left = stack()[-2]
-        right = stack()[-1]
-        assert isinstance(left, Proved)
-        assert isinstance(right, Proved)
-        interpreter().modus_ponens(left, right)
 
+def compile_proof(converter: MetamathConverter, target: str) -> CompiledProof:
     # We do not support ambiguities right now
-    exported_proof = converter.get_lemma_by_name(target).proof
-
-    # lemma |-> memory id in MM
-    mm_memory: list[Pattern | Proved] = []
+    lemma = converter.get_lemma_by_name(target)
+    exported_proof = lemma.proof
     # MM encoding offset
     memory_offset = len(exported_proof.labels)  # TODO: Add EH later
 
-    # Keep track of proof step number
-    for lemma in exported_proof.applied_lemmas:
-        if lemma not in exported_proof.labels:
-            if lemma == 0:
-                # Z save
-                pat = stack()[-1]
-                mm_memory.append(pat)
-                interpreter().save(str(pat), pat)
-            else:
-                # We play with memory, so we need to look for the original index in MM memory
-                interpreter().load(str(mm_memory[lemma - memory_offset - 1]), mm_memory[lemma - memory_offset - 1])
-            # We do not do anything else, as this was a load/save
-            continue
+    pattern_constructors = converter.pattern_constructors
+    exported_axioms = set(converter.exported_axioms)
+    proof_rules = converter.proof_rules
 
-        lemma_label = exported_proof.labels[lemma]
+    def metavars_in_order(label: str) -> tuple[int, ...]:
+        return tuple(converter.resolve_metavar(metavar).name for metavar in converter.get_metavars_in_order(label))
 
-        # Lemma is one of these pattern constructors/notations
-        if lemma_label in converter.pattern_constructors:
-            # Cannot call .pattern here, as I have what I need on stack
-            if lemma_label == 'app-is-pattern':
-                left = stack()[-2]
-                right = stack()[-1]
-                assert isinstance(left, Pattern)
-                assert isinstance(right, Pattern)
-                interpreter().app(left, right)
-                continue
-
-            if lemma_label == 'imp-is-pattern':
-                left = stack()[-2]
-                right = stack()[-1]
-                assert isinstance(left, Pattern)
-                assert isinstance(right, Pattern)
-                interpreter().implies(left, right)
-                continue
+    # Each label is resolved once, however often the proof applies it
+    label_steps: dict[str, ProofStep | None] = {}
 
-            # Construct the axiom on stack
-            pat_constructor_axiom = converter.get_axiom_by_name(lemma_label)
-            interpreter().pattern(pat_constructor_axiom.pattern)
+    def compile_label(label: str) -> ProofStep | None:
+        # Lemma is one of these pattern constructors/notations
+        if label in pattern_constructors:
+            if label == 'app-is-pattern':
+                return ProofStep(ProofOp.App)
+            if label == 'imp-is-pattern':
+                return ProofStep(ProofOp.Implies)
 
             # Instantiate it with instantiations given by MM (as MM does this implicitly)
-            if len(pat_constructor_axiom.metavars) > 0:
-                pat = stack()[-1]
-                assert isinstance(pat, Pattern)
-                interpreter().instantiate_pattern(pat, get_delta(converter.get_metavars_in_order(lemma_label)))
+            pat_constructor_axiom = converter.get_axiom_by_name(label)
+            metavars = metavars_in_order(label) if len(pat_constructor_axiom.metavars) > 0 else None
+            return ProofStep(ProofOp.PatternConstructor, pat_constructor_axiom.pattern, metavars)
 
         # Lemma is one of these `metavar-is-pattern` functions
-        elif lemma_label in converter._fp_label_to_pattern and isinstance(
-            converter.get_floating_pattern_by_name(lemma_label)[0], MetaVar
+        elif label in converter._fp_label_to_pattern and isinstance(
+            converter.get_floating_pattern_by_name(label)[0], MetaVar
         ):
             # TODO: phi0-is-pattern should be in pattern constructors
-            pat = converter.get_floating_pattern_by_name(lemma_label)[0]
-            assert isinstance(pat, MetaVar)
-            interpreter().metavar(pat.name)
+            return ProofStep(ProofOp.MetaVar, converter.get_floating_pattern_by_name(label)[0])
 
         # Lemma is in Gamma
-        elif lemma_label in converter.exported_axioms:
-            axiom = converter.get_axiom_by_name(lemma_label)
-            saved_antecedents = []
-
+        elif label in exported_axioms:
+            axiom = converter.get_axiom_by_name(label)
+            metavars = metavars_in_order(label) if len(axiom.metavars) > 0 else None
             # For now, we treat EH's as antecedents in the pattern
             if isinstance(axiom, AxiomWithAntecedents):
-                # This means the concrete antecedents are on stack given by MM stack
-                # AFTER the instantiations for our lemma (as floatings go first)
-                # We need to pop the antecedents to instantiate our axiom first
-                for _ in axiom.antecedents:
-                    saved_antecedents.append((str(stack()[-1]), stack()[-1]))
-                    interpreter().save(str(stack()[-1]), stack()[-1])
-                    interpreter().pop(stack()[-1])
-                proofexp.load_axiom(convert_to_implication(axiom.antecedents, axiom.pattern))(interpreter())
+                pattern = convert_to_implication(axiom.antecedents, axiom.pattern)
+                return ProofStep(ProofOp.Axiom, pattern, metavars, len(axiom.antecedents))
+            return ProofStep(ProofOp.Axiom, axiom.pattern, metavars)
+
+        # Lemma is one of the fixed proof rules in the ML proof system
+        elif label in proof_rules:
+            if label == 'proof-rule-prop-1':
+                return ProofStep(ProofOp.Prop1)
+            if label == 'proof-rule-prop-2':
+                return ProofStep(ProofOp.Prop2)
+            if label == 'proof-rule-mp':
+                return ProofStep(ProofOp.ModusPonens)
+            # The other proof rules are not translated yet
+            return None
+        else:
+            raise NotImplementedError(f'The proof label {label} is not recognized as an implemented instruction')
+
+    steps: list[ProofStep] = []
+    for lemma_index in exported_proof.applied_lemmas:
+        if lemma_index not in exported_proof.labels:
+            if lemma_index == 0:
+                # Z save
+                steps.append(ProofStep(ProofOp.Save))
             else:
-                proofexp.load_axiom(axiom.pattern)(interpreter())
+                # We play with memory, so we need to look for the original index in MM memory
+                steps.append(ProofStep(ProofOp.Load, index=lemma_index - memory_offset - 1))
+            continue
+
+        label = exported_proof.labels[lemma_index]
+        if label not in label_steps:
+            label_steps[label] = compile_label(label)
+        step = label_steps[label]
+        if step is not None:
+            steps.append(step)
+
+    return CompiledProof(target, lemma.pattern, tuple(steps))
+
+
+def run_proof(proof: CompiledProof, proofexp: ProofExp, interp: Interpreter) -> None:
+    """Execute the compiled proof of the target and publish it."""
+    core_interp = interp
+    if isinstance(interp, InterpreterTransformer):
+        core_interp = interp.core_interpreter
+
+    assert isinstance(core_interp, StatefulInterpreter)
+    # The interpreter may replace its stack, so it is never kept in a local variable
+
+    def get_delta(metavars: tuple[int, ...]) -> dict[int, Pattern]:
+        delta: dict[int, Pattern] = {}
+        offset = len(core_interp.stack) - len(metavars) - 1
+        for i, metavar in enumerate(metavars):
+            pat = core_interp.stack[offset + i]
+            assert isinstance(pat, Pattern)
+            delta[metavar] = pat
+        return delta
+
+    def do_mp() -> None:
+        left = core_interp.stack[-2]
+        right = core_interp.stack[-1]
+        assert isinstance(left, Proved)
+        assert isinstance(right, Proved)
+        interp.modus_ponens(left, right)
+
+    # MM memory id |-> (memory name, term)
+    mm_memory: list[tuple[str, Pattern | Proved]] = []
+    # Each axiom is checked against the published ones once
+    axiom_loaders: dict[int, ProofThunk] = {}
+
+    for step in proof.steps:
+        op = step.op
+        if op == ProofOp.Save:
+            pat = core_interp.stack[-1]
+            name = str(pat)
+            mm_memory.append((name, pat))
+            interp.save(name, pat)
+
+        elif op == ProofOp.Load:
+            interp.load(*mm_memory[step.index])
+
+        elif op == ProofOp.PatternConstructor:
+            assert step.pattern is not None
+            # Construct the axiom on stack
+            interp.pattern(step.pattern)
+            if step.metavars is not None:
+                pat = core_interp.stack[-1]
+                assert isinstance(pat, Pattern)
+                interp.instantiate_pattern(pat, get_delta(step.metavars))
+
+        elif op == ProofOp.App or op == ProofOp.Implies:
+            # Cannot call .pattern here, as I have what I need on stack
+            left = core_interp.stack[-2]
+            right = core_interp.stack[-1]
+            assert isinstance(left, Pattern)
+            assert isinstance(right, Pattern)
+            if op == ProofOp.App:
+                interp.app(left, right)
+            else:
+                interp.implies(left, right)
+
+        elif op == ProofOp.MetaVar:
+            assert isinstance(step.pattern, MetaVar)
+            interp.metavar(step.pattern.name)
+
+        elif op == ProofOp.Axiom:
+            assert step.pattern is not None
+            saved_antecedents = []
+            # This means the concrete antecedents are on stack given by MM stack
+            # AFTER the instantiations for our lemma (as floatings go first)
+            # We need to pop the antecedents to instantiate our axiom first
+            for _ in range(step.index):
+                saved_antecedents.append((str(core_interp.stack[-1]), core_interp.stack[-1]))
+                interp.save(str(core_interp.stack[-1]), core_interp.stack[-1])
+                interp.pop(core_interp.stack[-1])
+
+            loader = axiom_loaders.get(id(step))
+            if loader is None:
+                loader = axiom_loaders[id(step)] = proofexp.load_axiom(step.pattern)
+            loader(interp)
 
             # We need to instantiate the axiom depending on what we are given on stack
-            if len(axiom.metavars) > 0:
-                pat = stack()[-1]
+            if step.metavars is not None:
+                pat = core_interp.stack[-1]
                 assert isinstance(pat, Proved)
-                interpreter().instantiate(pat, get_delta(converter.get_metavars_in_order(lemma_label)))
+                interp.instantiate(pat, get_delta(step.metavars))
 
             # Now we need to get rid of the antecedents
-            if isinstance(axiom, AxiomWithAntecedents):
-                for eh, pat in reversed(saved_antecedents):
-                    interpreter().load(eh, pat)  # stack[-1]: eh1
-                    pass  # stack[-2]: eh1 -> (eh2 -> (...))
-                    do_mp()  # stack[-1]: eh2 -> (...)
+            for eh, pat in reversed(saved_antecedents):
+                interp.load(eh, pat)  # stack[-1]: eh1
+                pass  # stack[-2]: eh1 -> (eh2 -> (...))
+                do_mp()  # stack[-1]: eh2 -> (...)
+
+        elif op == ProofOp.Prop1:
+            prop1 = interp.prop1()
+            phi0 = core_interp.stack[-3]
+            phi1 = core_interp.stack[-2]
+            assert isinstance(phi0, Pattern)
+            assert isinstance(phi1, Pattern)
+            interp.instantiate(prop1, {0: phi0, 1: phi1})
+
+        elif op == ProofOp.Prop2:
+            prop2 = interp.prop2()
+            phi0 = core_interp.stack[-4]
+            phi1 = core_interp.stack[-3]
+            phi2 = core_interp.stack[-2]
+            assert isinstance(phi0, Pattern)
+            assert isinstance(phi1, Pattern)
+            assert isinstance(phi2, Pattern)
+            interp.instantiate(prop2, {0: phi0, 1: phi1, 2: phi2})
+
+        elif op == ProofOp.ModusPonens:
+            do_mp()
+
+            # We need to clean up redundant wellformedness checks
+            conclusion_name, conclusion = (str(core_interp.stack[-1]), core_interp.stack[-1])
+            interp.save(conclusion_name, conclusion)
+            interp.pop(core_interp.stack[-1])
+            interp.pop(core_interp.stack[-1])
+            interp.pop(core_interp.stack[-1])
+            interp.load(conclusion_name, conclusion)
 
-        # Lemma is one of the fixed proof rules in the ML proof system
-        elif lemma_label in converter.proof_rules:
-            if lemma_label == 'proof-rule-prop-1':
-                prop1 = interpreter().prop1()
-                phi0 = stack()[-3]
-                phi1 = stack()[-2]
-                assert isinstance(phi0, Pattern)
-                assert isinstance(phi1, Pattern)
-                interpreter().instantiate(
-                    prop1,
-                    {0: phi0, 1: phi1},
-                )
-            if lemma_label == 'proof-rule-prop-2':
-                prop2 = interpreter().prop2()
-                phi0 = stack()[-4]
-                phi1 = stack()[-3]
-                phi2 = stack()[-2]
-                assert isinstance(phi0, Pattern)
-                assert isinstance(phi1, Pattern)
-                assert isinstance(phi2, Pattern)
-                interpreter().instantiate(
-                    prop2,
-                    {
-                        0: phi0,
-                        1: phi1,
-                        2: phi2,
-                    },
-                )
-            if lemma_label == 'proof-rule-mp':
-                do_mp()
-
-                # We need to clean up redundant wellformedness checks
-                conclusion_name, conclusion = (str(stack()[-1]), stack()[-1])
-                interpreter().save(conclusion_name, conclusion)
-                interpreter().pop(stack()[-1])
-                interpreter().pop(stack()[-1])
-                interpreter().pop(stack()[-1])
-                interpreter().load(conclusion_name, conclusion)
         else:
-            raise NotImplementedError(f'The proof label {lemma_label} is not recognized as an implemented instruction')
+            raise NotImplementedError(f'Unknown proof step {op}')
 
-    pat = stack()[-1]
+    pat = core_interp.stack[-1]
     assert isinstance(pat, Proved)
-    assert pat == Proved(converter.get_lemma_by_name(target).pattern)
-    interpreter().publish_proof(pat)
+    assert pat == Proved(proof.conclusion)
+    interp.publish_proof(pat)
+
+
+def exec_proof(converter: MetamathConverter, target: str, proofexp: ProofExp, interp: Interpreter) -> None:
+    run_proof(compile_proof(converter, target), proofexp, interp)
 
 
 # TODO: This is unsound and should be replaced with a different handling
 def convert_to_implication(antecedents: tuple[Pattern, ...], conclusion: Pattern) -> Pattern:
-    (ant, *ants) = antecedents
+    ant, *ants = antecedents
 
     if ants:
         return Implies(ant, convert_to_implication(tuple(ants), conclusion))
@@ -198,16 +289,258 @@ def convert_to_implication(antecedents: tuple[Pattern, ...], conclusion: Pattern
     return Implies(ant, conclusion)
 
 
+def extract_axioms(converter: MetamathConverter) -> list[Pattern]:
+    extracted_axioms = []
+    for axiom_name in converter.exported_axioms:
+        axiom = converter.get_axiom_by_name(axiom_name)
+        if isinstance(axiom, AxiomWithAntecedents):
+            extracted_axioms.append(convert_to_implication(axiom.antecedents, axiom.pattern))
+            continue
+        extracted_axioms.append(axiom.pattern)
+    return extracted_axioms
+
+
+class TranslatedProofSkeleton(ProofExp):
+    def __init__(self, converter: MetamathConverter, target: str) -> None:
+        # A lazy converter only exports the axioms and lemmas the target depends on
+        converter.convert(target)
+        # Only the target is proved, so it is the only claim, whichever lemmas the converter holds
+        claims = [converter.get_lemma_by_name(target).pattern]
+        super().__init__(axioms=extract_axioms(converter), claims=claims)
+        self.converter = converter
+        self.target = target
+        self.proof = compile_proof(converter, target)
+
+    def execute_proofs_phase(self, interpreter: Interpreter) -> None:
+        assert interpreter.phase == ExecutionPhase.Proof
+        run_proof(self.proof, self, interpreter)
+
+
+# Bump whenever the translation changes its output, so that outputs cached by an older version are not reused
+TRANSLATION_CACHE_VERSION = 1
+TRANSLATION_SUFFIXES = ('.ml-gamma', '.ml-claim', '.ml-proof')
+
+
+@dataclass(frozen=True)
+class TranslationJob:
+    # The index of the converter of the target
+    database: int
+    target: str
+    output_dir: str
+    name: str
+    # The directory of the outputs by the digest of the dependency cone of their target, None to not cache the output
+    cache_dir: str | None = None
+    digest: str = ''
+
+
+@dataclass(frozen=True)
+class TranslationResult:
+    name: str
+    target: str
+    time: float
+    error: str | None = None
+    cached: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def translation_cache_file(cache_dir: Path, digest: str) -> Path:
+    """The cached outputs of a target, named after the digest of its dependency cone."""
+    return cache_dir / sha256(f'v{TRANSLATION_CACHE_VERSION}:{digest}'.encode()).hexdigest()
+
+
+def restore_translation(cache_file: Path, output: Path) -> bool:
+    """Copy the cached outputs to the output path, if all of them are cached."""
+    cached = [cache_file.with_suffix(suffix) for suffix in TRANSLATION_SUFFIXES]
+    if not all(path.exists() for path in cached):
+        return False
+    for path, suffix in zip(cached, TRANSLATION_SUFFIXES, strict=True):
+        shutil.copyfile(path, output.with_suffix(suffix))
+    return True
+
+
+def store_translation(output: Path, cache_file: Path) -> None:
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    for suffix in TRANSLATION_SUFFIXES:
+        # Copy to a temporary file first to never leave a truncated output behind, even with concurrent workers
+        tmp_file = cache_file.with_suffix(f'{suffix}.{os.getpid()}.tmp')
+        shutil.copyfile(output.with_suffix(suffix), tmp_file)
+        tmp_file.replace(cache_file.with_suffix(suffix))
+
+
+# The converted databases shared by the batch workers, set before forking them so that they inherit them
+_batch_converters: list[MetamathConverter] = []
+
+
+def _translate_batch_target(job: TranslationJob) -> TranslationResult:
+    start = perf_counter()
+    output = Path(job.output_dir) / job.name
+    try:
+        converter = _batch_converters[job.database]
+        if job.cache_dir is not None:
+            cache_file = translation_cache_file(Path(job.cache_dir), job.digest)
+            if restore_translation(cache_file, output):
+                return TranslationResult(job.name, job.target, perf_counter() - start, cached=True)
+            # A converter of its own exports only the dependency cone of the target, which the digest covers
+            converter = MetamathConverter(converter.parsed, lazy=True)
+
+        proof_skeleton = TranslatedProofSkeleton(converter, job.target)
+        proof_skeleton.serialize(output, OutputFormat.Binary, True)
+        if job.cache_dir is not None:
+            store_translation(output, cache_file)
+    except Exception as e:
+        return TranslationResult(job.name, job.target, perf_counter() - start, f'{type(e).__name__}: {e}')
+    return TranslationResult(job.name, job.target, perf_counter() - start)
+
+
+def run_batch(
+    converters: list[MetamathConverter], jobs: list[TranslationJob], processes: int = 1
+) -> list[TranslationResult]:
+    """
+    Translate the targets of the jobs and return the results in the order of the jobs.
+    With more than one process the jobs are handed out to forked workers, so each database is converted only once.
+    """
+    global _batch_converters
+    _batch_converters = converters
+
+    results: Iterator[TranslationResult]
+    try:
+        if processes > 1 and len(jobs) > 1 and 'fork' in multiprocessing.get_all_start_methods():
+            with multiprocessing.get_context('fork').Pool(min(processes, len(jobs))) as pool:
+                results = pool.imap(_translate_batch_target, jobs, chunksize=1)
+                return list(_report_batch_results(results))
+        results = map(_translate_batch_target, jobs)
+        return list(_report_batch_results(results))
+    finally:
+        _batch_converters = []
+
+
+def _report_batch_results(results: Iterator[TranslationResult]) -> Iterator[TranslationResult]:
+    for result in results:
+        status = 'cached' if result.cached else 'ok' if result.ok else f'FAILED ({result.error})'
+        print(f'{result.name}: {result.time:.3f}s {status}')
+        yield result
+
+
+def print_batch_summary(results: list[TranslationResult], total_time: float) -> None:
+    width = max((len(result.name) for result in results), default=0)
+    target_width = max((len(result.target) for result in results), default=0)
+    print(f'{"output":<{width}}  {"target":<{target_width}}  {"time (s)":>10}  status')
+    for result in results:
+        status = 'cached' if result.cached else 'ok' if result.ok else 'FAILED'
+        print(f'{result.name:<{width}}  {result.target:<{target_width}}  {result.time:>10.3f}  {status}')
+    failed = [result for result in results if not result.ok]
+    cached = sum(result.cached for result in results)
+    print(f'{len(results) - len(failed)} of {len(results)} targets translated in {total_time:.3f}s, {cached} cached')
+    for result in failed:
+        print(f'Failed {result.name}: {result.error}')
+
+
+def provable_labels(database: Database) -> list[str]:
+    """Labels of the top-level lemmas the converter translates, those proving a |- statement."""
+    labels = []
+    for statement in database.statements:
+        if isinstance(statement, Block):
+            statement = statement.statements[-1]
+        if isinstance(statement, ProvableStatement) and statement.terms[:1] == (Application('|-'),):
+            labels.append(statement.label)
+    return labels
+
+
+def batch_main(argv: list[str]) -> bool:
+    """Translate many targets, parsing and converting each database once. Returns whether all were translated."""
+    parser = argparse.ArgumentParser(prog='translate.py batch')
+    parser.add_argument('inputs', nargs='+', help='Input Metamath database paths, such as the extracted slices')
+    parser.add_argument('--output', required=True, help='Output directory')
+    parser.add_argument(
+        '--target',
+        action='append',
+        dest='targets',
+        help='Lemma whose proof is to be translated, by default every lemma of every database',
+    )
+    parser.add_argument(
+        '-j', '--jobs', type=int, default=None, help='Number of worker processes, by default the number of CPUs'
+    )
+    parser.add_argument('--database-cache', type=Path, help='Directory of the cached parsed databases')
+    parser.add_argument(
+        '--lazy', action='store_true', help='Only convert and export the statements the targets depend on'
+    )
+    parser.add_argument(
+        '--cache',
+        help='Directory of the outputs by the digest of the dependency cone of their target, '
+        'to only translate the targets whose cone changed. Implies --lazy',
+    )
+    args = parser.parse_args(argv)
+    if args.targets is not None:
+        args.targets = list(dict.fromkeys(args.targets))
+
+    start = perf_counter()
+    output_dir = Path(args.output)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    converters: list[MetamathConverter] = []
+    jobs: list[TranslationJob] = []
+    found: set[str] = set()
+    for path in args.inputs:
+        print(f'Converting {path}...', end='', flush=True)
+        database = load_database(path, include_proof=True, cache_dir=args.database_cache)
+        converter = MetamathConverter(database, args.lazy or args.cache is not None)
+        digests: dict[str, str] = {}
+        if args.cache is not None:
+            # Every target is translated with a converter of its own, this one is left unconverted to compute digests
+            labels = provable_labels(database)
+            targets = labels if args.targets is None else [target for target in args.targets if target in labels]
+            digests = {target: converter.dependency_digest(target) for target in targets}
+        # Converting every target upfront keeps a lazy converter in the same state whichever worker translates them
+        elif args.targets is None:
+            converter.convert(*provable_labels(converter.parsed))
+            targets = list(converter.lemmas)
+        else:
+            targets = [target for target in args.targets if converter.is_lemma(target)]
+            converter.convert(*targets)
+        print(f' Done, {len(targets)} targets.')
+        found.update(targets)
+
+        module = os.path.splitext(os.path.basename(path))[0]
+        for target in targets:
+            name = module if len(targets) == 1 else f'{module}-{target}'
+            jobs.append(
+                TranslationJob(len(converters), target, str(output_dir), name, args.cache, digests.get(target, ''))
+            )
+        converters.append(converter)
+
+    missing = [target for target in args.targets or () if target not in found]
+    if missing:
+        print(f'No input has the lemmas {", ".join(missing)}')
+        return False
+    # Inputs with the same basename would overwrite the outputs of each other
+    names = Counter(job.name for job in jobs)
+    clashes = [name for name, count in names.items() if count > 1]
+    if clashes:
+        print(f'Several targets would be written to {", ".join(clashes)}, rename the inputs with the same basename')
+        return False
+
+    results = run_batch(converters, jobs, args.jobs if args.jobs else os.cpu_count() or 1)
+    print_batch_summary(results, perf_counter() - start)
+    return all(result.ok for result in results)
+
+
 def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument('input', help='Input Metamath database path')
     parser.add_argument('output', help='Output directory')
     parser.add_argument('target', help='Lemma whose proof is to be translated')
     parser.add_argument('--clean', default=True, help='Clean up the output directory if it exists')
+    parser.add_argument('--database-cache', type=Path, help='Directory of the cached parsed databases')
+    parser.add_argument(
+        '--lazy', action='store_true', help='Only convert and export the statements the target depends on'
+    )
     args = parser.parse_args()
 
     print('Parsing database...', end='', flush=True)
-    input_database = load_database(args.input, include_proof=True)
+    input_database = load_database(args.input, include_proof=True, cache_dir=args.database_cache)
     print(' Done.')
 
     # Prepare output dir
@@ -224,35 +557,17 @@ def main() -> None:
         output_dir.mkdir()
 
     # Prepare the converter
-    converter = MetamathConverter(input_database)
+    converter = MetamathConverter(input_database, lazy=args.lazy)
     assert converter
 
-    extracted_axioms = []
-    for axiom_name in converter.exported_axioms:
-        axiom = converter.get_axiom_by_name(axiom_name)
-        if isinstance(axiom, AxiomWithAntecedents):
-            extracted_axioms.append(convert_to_implication(axiom.antecedents, axiom.pattern))
-            continue
-        extracted_axioms.append(axiom.pattern)
-
-    extracted_claims = [converter.get_lemma_by_name(lemma_name).pattern for lemma_name in converter.lemmas]
-
-    class TranslatedProofSkeleton(ProofExp):
-        def __init__(self) -> None:
-            super().__init__(axioms=extracted_axioms, claims=extracted_claims)
-
-        def execute_proofs_phase(self, interpreter: Interpreter) -> None:
-            assert interpreter.phase == ExecutionPhase.Proof
-            exec_proof(converter, args.target, self, interpreter)
-
     module = os.path.splitext(os.path.basename(args.input))[0]
 
-    proof_skeleton = TranslatedProofSkeleton()
+    proof_skeleton = TranslatedProofSkeleton(converter, args.target)
 
     proof_skeleton.main(['', '--optimize', 'binary', str(output_dir), module])
-    proof_skeleton.main(['', '--optimize', 'binary', str(output_dir), module])
-    proof_skeleton.main(['', '--optimize', 'binary', str(output_dir), module])
 
 
 if __name__ == '__main__':
+    if sys.argv[1:2] == ['batch']:
+        sys.exit(0 if batch_main(sys.argv[2:]) else 1)
     main()
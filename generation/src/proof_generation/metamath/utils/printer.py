@@ -34,10 +34,10 @@ class Printer:
         self.deindent()
 
     def flush(self) -> None:
-        for i, s in enumerate(self.line_buffer):
-            if i == len(self.line_buffer) - 1:
-                s = s.rstrip()
-            self.output.write(s)
+        if self.line_buffer:
+            *line, last = self.line_buffer
+            line.append(last.rstrip())
+            self.output.write(''.join(line))
         self.line_buffer = []
 
     def is_line_buffer_empty(self) -> bool:
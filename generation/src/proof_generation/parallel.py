@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import io
+import multiprocessing
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from proof_generation.instruction import Instruction
+from proof_generation.interpreter import ExecutionPhase, InterpreterTransformer, SerializingInterpreter
+
+if TYPE_CHECKING:
+    from collections.abc import Mapping
+
+    from proof_generation.interpreter import Interpreter
+    from proof_generation.proof import ProofExp
+
+# Memory locations and symbol identifiers are encoded in a single byte
+MAX_OPERAND = 0xFF
+
+_SINGLE_OPERAND = frozenset(
+    {
+        Instruction.EVar,
+        Instruction.SVar,
+        Instruction.Symbol,
+        Instruction.CleanMetaVar,
+        Instruction.Exists,
+        Instruction.Mu,
+        Instruction.ESubst,
+        Instruction.SSubst,
+        Instruction.Generalization,
+        Instruction.Substitution,
+        Instruction.Load,
+    }
+)
+
+
+@dataclass(frozen=True)
+class ProofShard:
+    """The serialized proofs of consecutive claims, produced on top of the state left by the claims phase."""
+
+    buffer: bytes
+    # Number of entries the shard appended to the memory
+    saved: int
+    # Symbols which got their identifier within the shard, in the order of their identifiers
+    symbols: tuple[str, ...]
+    warnings: tuple[str, ...]
+
+
+def relocate_proof(
+    buffer: bytes, memory_base: int, memory_offset: int, symbol_base: int, symbol_map: Mapping[int, int]
+) -> bytes:
+    """
+    Shift the memory locations at or above memory_base by memory_offset and rename the symbol identifiers
+    at or above symbol_base, leaving everything else in the serialized proof untouched.
+    """
+    out = bytearray(buffer)
+    i = 0
+    while i < len(out):
+        instruction = Instruction(out[i])
+        i += 1
+        if instruction == Instruction.Load:
+            if out[i] >= memory_base:
+                location = out[i] + memory_offset
+                if location > MAX_OPERAND:
+                    raise ValueError(f'Memory location {location} does not fit in a byte')
+                out[i] = location
+            i += 1
+        elif instruction == Instruction.Symbol:
+            if out[i] >= symbol_base:
+                symbol = symbol_map[out[i]]
+                if symbol > MAX_OPERAND:
+                    raise ValueError(f'Symbol identifier {symbol} does not fit in a byte')
+                out[i] = symbol
+            i += 1
+        elif instruction == Instruction.MetaVar:
+            # Identifier followed by five length-prefixed lists of variables
+            i += 1
+            for _ in range(5):
+                i += out[i] + 1
+        elif instruction == Instruction.Instantiate:
+            i += out[i] + 1
+        elif instruction in _SINGLE_OPERAND:
+            i += 1
+    return bytes(out)
+
+
+def _serializer(interpreter: Interpreter) -> SerializingInterpreter:
+    core = interpreter.core_interpreter if isinstance(interpreter, InterpreterTransformer) else interpreter
+    assert isinstance(core, SerializingInterpreter), 'Only binary proofs can be generated in parallel'
+    return core
+
+
+# The proof expression and the interpreter at the start of the proofs phase, inherited by the forked workers
+_shard_context: tuple[ProofExp, Interpreter] | None = None
+
+
+def _serialize_shard(bounds: tuple[int, int]) -> ProofShard:
+    assert _shard_context is not None
+    proofexp, interpreter = _shard_context
+    start, end = bounds
+    serializer = _serializer(interpreter)
+    memory_base = len(serializer.memory)
+    symbol_base = len(serializer._symbol_identifiers)
+
+    # The proofs of the previous shards have consumed their claims
+    serializer.claims = serializer.claims[start:]
+    serializer.out = io.BytesIO()
+    for proof_expr in proofexp.get_proof_expressions()[start:end]:
+        proofexp.publish_proof(proof_expr)(interpreter)
+
+    return ProofShard(
+        serializer.out.getvalue(),
+        len(serializer.memory) - memory_base,
+        tuple(serializer._symbol_identifiers)[symbol_base:],
+        tuple(interpreter.interpreting_warnings),
+    )
+
+
+def shard_bounds(claims: int, shards: int) -> list[tuple[int, int]]:
+    """Split the claims into at most the given number of consecutive ranges of almost equal size."""
+    shards = max(1, min(shards, claims))
+    size, rest = divmod(claims, shards)
+    bounds = []
+    start = 0
+    for i in range(shards):
+        end = start + size + (1 if i < rest else 0)
+        bounds.append((start, end))
+        start = end
+    return bounds
+
+
+def merge_shards(interpreter: Interpreter, shards: list[ProofShard]) -> bytes:
+    """
+    Concatenate the shards in claim order. Every shard was produced as if it were the first one,
+    so its memory locations are moved after the entries saved by the previous shards and its symbols are
+    renamed to the identifiers they get in the merged proof.
+    """
+    serializer = _serializer(interpreter)
+    memory_base = len(serializer.memory)
+    symbol_base = len(serializer._symbol_identifiers)
+    symbols = dict(serializer._symbol_identifiers)
+
+    merged = bytearray()
+    memory_offset = 0
+    for shard in shards:
+        symbol_map = {}
+        for local_id, name in enumerate(shard.symbols, start=symbol_base):
+            symbol_map[local_id] = symbols.setdefault(name, len(symbols))
+        merged += relocate_proof(shard.buffer, memory_base, memory_offset, symbol_base, symbol_map)
+        memory_offset += shard.saved
+
+    serializer._symbol_identifiers = symbols
+    return bytes(merged)
+
+
+def execute_proofs_phase_in_parallel(proofexp: ProofExp, interpreter: Interpreter, jobs: int) -> None:
+    """
+    Serialize the proofs of the claims on forked workers and write them in claim order.
+    The interpreter must be at the start of the proofs phase and wrap a SerializingInterpreter.
+    The proofs are generated serially when they do not fit the memory limits once merged.
+    """
+    global _shard_context
+    assert interpreter.phase == ExecutionPhase.Proof
+    serializer = _serializer(interpreter)
+    bounds = shard_bounds(len(proofexp.get_proof_expressions()), jobs)
+
+    _shard_context = (proofexp, interpreter)
+    try:
+        # Each worker must start from the state left by the claims phase, so it serializes a single shard
+        with multiprocessing.get_context('fork').Pool(len(bounds), maxtasksperchild=1) as pool:
+            shards = pool.map(_serialize_shard, bounds, chunksize=1)
+    finally:
+        _shard_context = None
+
+    try:
+        merged = merge_shards(interpreter, shards)
+    except ValueError as e:
+        # Every shard saves its own copies of the memoized patterns, which may exceed the memory limits
+        print(f'Falling back to serial proof generation: {e}')
+        proofexp.execute_proofs_phase(interpreter)
+        return
+
+    serializer.out.write(merged)
+    serializer.claims = []
+    interpreter.add_interpreting_warnings(warning for shard in shards for warning in shard.warnings)
+    proofexp.check_interpreting(interpreter)
@@ -1,13 +1,30 @@
 from __future__ import annotations
 
+import inspect
 from argparse import ArgumentParser
 from enum import Enum
+from functools import cache, wraps
+from io import BytesIO
 from pathlib import Path
 from typing import TYPE_CHECKING, TypeVar
 
-from proof_generation.aml import ESubst, EVar, Exists, Implies, PrettyOptions, bot, phi0, phi1, phi2, pretty_diff
+from proof_generation.aml import (
+    ESubst,
+    EVar,
+    Exists,
+    Implies,
+    MetaVar,
+    PrettyOptions,
+    bot,
+    phi0,
+    phi1,
+    phi2,
+    pretty_diff,
+)
 from proof_generation.claim import Claim
+from proof_generation.cost_model import DEFAULT_COST_MODEL, profile_proof
 from proof_generation.interpreter import (
+    AxiomUsageInterpreter,
     CountingInterpreter,
     ExecutionPhase,
     InstantiationOptimizer,
@@ -15,12 +32,15 @@ from proof_generation.interpreter import (
     PrettyPrintingInterpreter,
     SerializingInterpreter,
 )
+from proof_generation.lemma_library import LemmaLibrary, lemma_library, source_key, use_lemma_library
+from proof_generation.parallel import execute_proofs_phase_in_parallel
 from proof_generation.proved import Proved
 
 if TYPE_CHECKING:
     from collections.abc import Callable
 
     from proof_generation.aml import Notation, Pattern
+    from proof_generation.cost_model import CostModel, CostProfile
     from proof_generation.interpreter import Interpreter, IOInterpreter
 
 
@@ -30,6 +50,12 @@ class OutputFormat(str, Enum):
     PrettyNoStack = 'pretty-no-stack'
 
 
+class _KeptBuffer(BytesIO):
+    def close(self) -> None:
+        # Serializers close the output of every finished phase, but its content is still needed
+        pass
+
+
 # Proof Expressions
 # =================
 
@@ -49,6 +75,43 @@ class ProofThunk:
         return proved
 
 
+LemmaMethod = TypeVar('LemmaMethod', bound='Callable[..., ProofThunk]')
+
+
+def precompiled_lemma(method: LemmaMethod) -> LemmaMethod:
+    """
+    Mark a proof expression method whose parameters are all patterns as a schematic lemma.
+    While a lemma library is in use, the proof for fresh metavariables is compiled once and instantiated on every use.
+    """
+    signature = inspect.signature(method)
+    name = method.__qualname__
+
+    def precompiled(library: LemmaLibrary, proofexp: ProofExp, args: tuple, kwargs: dict) -> ProofThunk:
+        bound = signature.bind(proofexp, *args, **kwargs)
+        bound.apply_defaults()
+        patterns: list[Pattern] = list(bound.arguments.values())[1:]
+        schematic = [MetaVar(i) for i in range(len(patterns))]
+        key = source_key(type(proofexp), name, len(patterns))
+        lemma = library.get(name, key, lambda: method(proofexp, *schematic))
+        proof = ProofThunk(lambda interpreter: library.emit(name, lemma, interpreter), lemma.conclusion)
+        return proofexp.dynamic_inst(proof, {i: p for i, p in enumerate(patterns) if p != schematic[i]})
+
+    @wraps(method)
+    def wrapper(self: ProofExp, *args: Pattern, **kwargs: Pattern) -> ProofThunk:
+        proof = method(self, *args, **kwargs)
+
+        def proved_exp(interpreter: Interpreter) -> Proved:
+            # Decided when the proof runs, as the library may be put in use after it was built, e.g. by main
+            library = lemma_library()
+            if library is None:
+                return proof(interpreter)
+            return precompiled(library, self, args, kwargs)(interpreter)
+
+        return ProofThunk(proved_exp, proof.conc)
+
+    return wrapper  # type: ignore
+
+
 class ProofExp:
     _axioms: list[Pattern]
     _notations: list[Notation]
@@ -122,6 +185,13 @@ class ProofExp:
 
     ProofExpTypeVar = TypeVar('ProofExpTypeVar', bound='ProofExp')
 
+    @classmethod
+    @cache
+    def shared(cls: type[ProofExpTypeVar]) -> ProofExpTypeVar:
+        """Returns an instance shared by all importers, only for modules constructed without arguments.
+        The shared instance must never be modified."""
+        return cls()
+
     def import_module(self, module: ProofExpTypeVar) -> ProofExpTypeVar:
         self._submodules.append(module)
         self.add_notations(module.get_notations())
@@ -202,11 +272,42 @@ class ProofExp:
 
         return ProofThunk(proved_exp, proved.conc)
 
-    def execute_gamma_phase(self, interpreter: Interpreter, move_into_claim: bool = True) -> None:
+    def get_module_dag(self) -> list[ProofExp]:
+        """Returns the imported modules and this module, dependencies first and each module only once."""
+        visited: set[int] = set()
+        ordered: list[ProofExp] = []
+
+        def visit(module: ProofExp) -> None:
+            if id(module) in visited:
+                return
+            visited.add(id(module))
+            for submodule in module._submodules:
+                visit(submodule)
+            ordered.append(module)
+
+        visit(self)
+        return ordered
+
+    def get_published_axioms(self) -> list[Pattern]:
+        """Returns the axioms of the module DAG in publication order, every axiom only once."""
+        published: dict[Pattern, None] = {}
+        for module in self.get_module_dag():
+            published.update(dict.fromkeys(module._axioms))
+        return list(published)
+
+    def get_used_axioms(self) -> list[Pattern]:
+        """Returns the published axioms loaded by the proofs, in publication order."""
+        recorder = AxiomUsageInterpreter(ExecutionPhase.Gamma, [Claim(claim) for claim in self._claims])
+        self.execute_full(recorder)
+        return [axiom for axiom in self.get_published_axioms() if axiom in recorder.loaded]
+
+    def execute_gamma_phase(
+        self, interpreter: Interpreter, move_into_claim: bool = True, axioms: list[Pattern] | None = None
+    ) -> None:
+        """Publishes the given axioms, all axioms of the module DAG by default."""
         assert interpreter.phase == ExecutionPhase.Gamma
-        for submodule in self._submodules:
-            submodule.execute_gamma_phase(interpreter, False)
-        for axiom in self._axioms:
+        # Diamond imports would publish the same axioms several times otherwise
+        for axiom in self.get_published_axioms() if axioms is None else axioms:
             interpreter.publish_axiom(interpreter.pattern(axiom))
         self.check_interpreting(interpreter)
         if move_into_claim:
@@ -226,9 +327,9 @@ class ProofExp:
             self.publish_proof(proof_expr)(interpreter)
         self.check_interpreting(interpreter)
 
-    def execute_full(self, interpreter: Interpreter) -> None:
+    def execute_full(self, interpreter: Interpreter, axioms: list[Pattern] | None = None) -> None:
         assert interpreter.phase == ExecutionPhase.Gamma, f'Unexpected interpreter phase: {interpreter.phase}'
-        self.execute_gamma_phase(interpreter)
+        self.execute_gamma_phase(interpreter, axioms=axioms)
         self.execute_claims_phase(interpreter)
         self.execute_proofs_phase(interpreter)
 
@@ -277,15 +378,78 @@ class ProofExp:
 
     # TODO: Implement the optimization pipeline specified in Issue #374
     # TODO: add InstantiationOptimizer
-    def serialize(self, file_path: Path, output_format: OutputFormat, optimize: bool) -> None:
+    def serialize(
+        self, file_path: Path, output_format: OutputFormat, optimize: bool, jobs: int = 1, prune_axioms: bool = False
+    ) -> None:
+        # Load instructions refer to memory locations, so dropping axioms from gamma renumbers them
+        axioms = self.get_used_axioms() if prune_axioms else None
         claims = [Claim(claim) for claim in self._claims]
         serializer = self.get_serializing_interpreter(output_format, ExecutionPhase.Gamma, claims, file_path)
+        interpreter: Interpreter = serializer
         if optimize:
             analyzer = CountingInterpreter(ExecutionPhase.Gamma, claims)
-            self.execute_full(analyzer)
-            self.execute_full(MemoizingInterpreter(InstantiationOptimizer(serializer), analyzer.finalize()))
+            self.execute_full(analyzer, axioms)
+            interpreter = MemoizingInterpreter(InstantiationOptimizer(serializer), analyzer.finalize())
+
+        # Subclasses overriding the proofs phase do not publish the proof expressions one by one
+        if (
+            jobs > 1
+            and output_format == OutputFormat.Binary
+            and type(self).execute_proofs_phase is ProofExp.execute_proofs_phase
+        ):
+            self.execute_gamma_phase(interpreter, axioms=axioms)
+            self.execute_claims_phase(interpreter)
+            execute_proofs_phase_in_parallel(self, interpreter, jobs)
         else:
-            self.execute_full(serializer)
+            self.execute_full(interpreter, axioms)
+
+    def cost_profile(self) -> CostProfile:
+        """Serialize the proof expression without optimizations and measure what the checker does for every item."""
+        claims = [Claim(claim) for claim in self._claims]
+        gamma, claim, proof = _KeptBuffer(), _KeptBuffer(), _KeptBuffer()
+        self.execute_full(SerializingInterpreter(ExecutionPhase.Gamma, gamma, claims, claim, proof))
+        return profile_proof(gamma.getvalue(), claim.getvalue(), proof.getvalue())
+
+    def partition_claims(self, budget: float, model: CostModel = DEFAULT_COST_MODEL) -> list[ProofExp]:
+        """
+        Split the claims into consecutive groups whose proofs are estimated to take at most budget checker cycles.
+        Every group only keeps the axioms its proofs load. A claim too expensive on its own gets a group of its own.
+        """
+        assert (
+            type(self).execute_proofs_phase is ProofExp.execute_proofs_phase
+        ), 'Only proof expressions publishing one proof per claim can be partitioned'
+        assert len(self._claims) == len(self._proof_expressions)
+        profile = self.cost_profile()
+        axioms = self.get_published_axioms()
+        axiom_costs = [model.estimate(features, with_base=False) for features in profile.axioms]
+        claim_costs = [
+            model.estimate(claim, with_base=False) + model.estimate(proof, with_base=False)
+            for claim, proof in zip(profile.claims, profile.proofs, strict=True)
+        ]
+
+        groups: list[tuple[list[int], set[int]]] = []
+        cost = budget
+        for i, needed in enumerate(profile.loaded_axioms):
+            if groups:
+                claims, loaded = groups[-1]
+                extra = claim_costs[i] + sum(axiom_costs[axiom] for axiom in needed - loaded)
+                if cost + extra <= budget:
+                    claims.append(i)
+                    loaded |= needed
+                    cost += extra
+                    continue
+            groups.append(([i], set(needed)))
+            cost = model.base + claim_costs[i] + sum(axiom_costs[axiom] for axiom in needed)
+
+        return [
+            ProofExp(
+                axioms=[axioms[axiom] for axiom in sorted(loaded)],
+                notations=self.get_notations(),
+                claims=[self._claims[i] for i in claims],
+                proof_expressions=[self._proof_expressions[i] for i in claims],
+            )
+            for claims, loaded in groups
+        ]
 
     def main(self, argv: list[str]) -> None:
         argparser = ArgumentParser(
@@ -307,6 +471,27 @@ class ProofExp:
         argparser.add_argument(
             '--optimize', action='store_true', default=False, help='Optimize the proof before serializing it to output'
         )
+        argparser.add_argument(
+            '--jobs', type=int, default=1, help='Number of processes serializing the proofs of the claims in parallel'
+        )
+        argparser.add_argument(
+            '--lemma-library',
+            type=str,
+            default=None,
+            help='Directory of the precompiled schematic lemmas, which are compiled there when missing',
+        )
+        argparser.add_argument(
+            '--prune-axioms',
+            action='store_true',
+            default=False,
+            help='Only publish the axioms loaded by the proofs',
+        )
+        argparser.add_argument(
+            '--cycle-budget',
+            type=float,
+            default=None,
+            help='Split the claims into several proofs, each estimated to take at most this many checker cycles',
+        )
         args = argparser.parse_args(argv)
 
         output_dir = Path(args.output_dir)
@@ -314,4 +499,14 @@ class ProofExp:
             print('Creating output directory...')
             output_dir.mkdir()
 
-        self.serialize(output_dir / args.slice_name, args.output_format, args.optimize)
+        library = LemmaLibrary(Path(args.lemma_library)) if args.lemma_library is not None else None
+        with use_lemma_library(library):
+            file_path = output_dir / args.slice_name
+            if args.cycle_budget is None:
+                self.serialize(file_path, args.output_format, args.optimize, args.jobs, args.prune_axioms)
+                return
+
+            for i, part in enumerate(self.partition_claims(args.cycle_budget)):
+                part_path = file_path.with_name(f'{file_path.stem}-part{i}{file_path.suffix}')
+                print(f'Writing {len(part.get_claims())} claims to {part_path.with_suffix("")}.*')
+                part.serialize(part_path, args.output_format, args.optimize, args.jobs, args.prune_axioms)
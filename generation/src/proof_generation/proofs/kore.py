@@ -1,7 +1,6 @@
 from __future__ import annotations
 
 import sys
-from functools import cache
 from typing import TYPE_CHECKING
 
 from proof_generation.aml import (
@@ -23,6 +22,7 @@ from proof_generation.aml import (
     phi3,
     phi4,
 )
+from proof_generation.caches import registered_cache
 from proof_generation.proof import ProofExp
 from proof_generation.proofs.definedness import Definedness, ceil, subset
 from proof_generation.proofs.substitution import HOLE
@@ -41,7 +41,7 @@ kore_kseq_symbol = Symbol('kore_kseq')
 in_sort = Notation('in-sort', 2, subset(phi0, App(inhabitant_symbol, phi1)), '{0}:{1}')
 
 
-@cache
+@registered_cache(pinned=True)
 def sorted_exists(var: int) -> Notation:
     """sorted_exists(inner_sort, pattern)"""
     # TODO: It is not included in any KORE.notations
@@ -102,7 +102,7 @@ kore_equational_as = Notation(
 )
 
 
-@cache
+@registered_cache(pinned=True)
 def kore_exists(var: int) -> Notation:
     """kore_exists(inner_sort, outer_sort, pattern)"""
     return Notation(
@@ -114,8 +114,8 @@ def kore_exists(var: int) -> Notation:
 
 
 # We can do that without worrying about the memory leaking because all notations are saved in the ProofExp object anyway.
-# Note that @cache is required here as we have to return the same objects for the same arguments for notation comparisons
-@cache
+# Note that the cache is pinned as we have to return the same objects for the same arguments for notation comparisons
+@registered_cache(pinned=True)
 def nary_app(symbol: Symbol, n: int, cell: bool = False) -> Notation:
     """Constructs an nary application."""
     p: Pattern = symbol
@@ -133,7 +133,7 @@ def nary_app(symbol: Symbol, n: int, cell: bool = False) -> Notation:
     return Notation(symbol.name, n, p, fmt)
 
 
-@cache
+@registered_cache()
 def deconstruct_nary_application(p: Pattern) -> tuple[Pattern, tuple[Pattern, ...]]:
     match p:
         case Instantiate(_, _):
@@ -146,7 +146,7 @@ def deconstruct_nary_application(p: Pattern) -> tuple[Pattern, tuple[Pattern, ..
             return p, ()
 
 
-@cache
+@registered_cache(maxsize=1 << 12)
 def deconstruct_equality_rule(pattern: Pattern) -> tuple[Pattern, Pattern, Pattern, Pattern, Pattern]:
     _, requires, imp_right = kore_implies.assert_matches(pattern)
     _, _, eq_left, eq_right_and_ensures = kore_equals.assert_matches(imp_right)
@@ -156,7 +156,7 @@ def deconstruct_equality_rule(pattern: Pattern) -> tuple[Pattern, Pattern, Patte
     return requires, eq_left, eq_right_and_ensures, eq_right, ensures
 
 
-@cache
+@registered_cache(maxsize=1 << 12)
 def matching_requires_substitution(pattern: Pattern) -> dict[int, Pattern]:
     collected_substitutions: dict[int, Pattern] = {}
 
@@ -290,7 +290,7 @@ class KoreLemmas(ProofExp):
             ],
             notations=list(KORE_NOTATIONS),
         )
-        self.definedness = self.import_module(Definedness())
+        self.definedness = self.import_module(Definedness.shared())
 
     def equality_with_subst(self, phi: Pattern, equality: ProofThunk):
         """
@@ -4,11 +4,13 @@ import sys
 from typing import TYPE_CHECKING
 
 from proof_generation.aml import Implies, MetaVar, _and, _or, bot, equiv, match_single, neg, phi0, phi1, phi2, top
-from proof_generation.proof import ProofExp
+from proof_generation.lemma_library import lemma_library
+from proof_generation.proof import ProofExp, ProofThunk, precompiled_lemma
 
 if TYPE_CHECKING:
     from proof_generation.aml import Pattern
-    from proof_generation.proof import ProofThunk
+    from proof_generation.interpreter import Interpreter
+    from proof_generation.proved import Proved
 
 
 PROPOSITIONAL_NOTATIONS = (bot, neg, top, _and, _or, equiv)
@@ -63,6 +65,7 @@ class Propositional(ProofExp):
     def dneg_elim(self, p: Pattern = phi0) -> ProofThunk:
         return self.dynamic_inst(self.prop3(), _build_subst([p]))
 
+    @precompiled_lemma
     def imp_refl(self, p: Pattern = phi0) -> ProofThunk:
         """p -> p"""
         pp = Implies(p, p)
@@ -92,7 +95,7 @@ class Propositional(ProofExp):
         q2, r = Implies.extract(qr_pf.conc)
         assert q == q2
 
-        return self.modus_ponens(
+        proof = self.modus_ponens(
             # (p -> q) -> (p -> r)
             self.modus_ponens(
                 # (p -> (q -> r)) -> ((p -> q) -> (p -> r))
@@ -104,10 +107,21 @@ class Propositional(ProofExp):
             pq_pf,
         )
 
+        def proved_exp(interpreter: Interpreter) -> Proved:
+            # Decided when the proof runs, like the precompiled lemmas themselves
+            if lemma_library() is not None:
+                # Two modus ponens on the precompiled lemma instead of proving the instance of imp_trans again
+                return self.modus_ponens(self.modus_ponens(self.imp_trans(p, q, r), pq_pf), qr_pf)(interpreter)
+            return proof(interpreter)
+
+        return ProofThunk(proved_exp, proof.conc)
+
+    @precompiled_lemma
     def top_intro(self) -> ProofThunk:
         """top"""
         return self.imp_refl(bot())
 
+    @precompiled_lemma
     def bot_elim(self, p: Pattern = phi0) -> ProofThunk:
         """bot -> p"""
         return self.modus_ponens(
@@ -144,10 +158,12 @@ class Propositional(ProofExp):
         q, r = Implies.extract(qr)
         return self.imp_transitivity(self.prop1_inst(q, p), self.modus_ponens(self.prop2_inst(p, q, r), pf))
 
+    @precompiled_lemma
     def dneg_intro(self, p: Pattern = phi0) -> ProofThunk:
         """p -> ~~p"""
         return self.ant_commutativity(self.imp_refl(neg(p)))
 
+    @precompiled_lemma
     def absurd(self, p: Pattern = phi0, q: Pattern = phi1) -> ProofThunk:
         """~p -> (p -> q)"""
         return self.modus_ponens(
@@ -156,12 +172,14 @@ class Propositional(ProofExp):
             self.imp_provable(p, self.bot_elim(q)),
         )
 
+    @precompiled_lemma
     def peirce_bot(self, p: Pattern = phi0) -> ProofThunk:
         """(~p -> p) -> p   or, alternatively   p \\/ p -> p"""
         return self.imp_transitivity(
             self.modus_ponens(self.prop2_inst(neg(p), p, bot()), self.imp_refl(neg(p))), self.dneg_elim(p)
         )
 
+    @precompiled_lemma
     def imp_trans(self, p: Pattern = phi0, q: Pattern = phi1, r: Pattern = phi2) -> ProofThunk:
         """(p -> q) -> (q -> r) -> (p -> r)"""
         return self.ant_commutativity(
@@ -180,6 +198,7 @@ class Propositional(ProofExp):
             self.modus_ponens(self.prop2_inst(pq, p, q), self.imp_refl(pq)), self.imp_provable(pq, p_pf)
         )
 
+    @precompiled_lemma
     def dni_l(self, p: Pattern, q: Pattern) -> ProofThunk:
         """(p -> q) -> (~~p -> q)"""
         return self.modus_ponens(self.imp_trans(neg(neg(p)), p, q), self.dneg_elim(p))
@@ -193,6 +212,7 @@ class Propositional(ProofExp):
         p, q = Implies.extract(pq_pf.conc)
         return self.modus_ponens(self.dni_l(p, q), pq_pf)
 
+    @precompiled_lemma
     def dni_r(self, p: Pattern, q: Pattern) -> ProofThunk:
         """(p -> q) -> (p -> ~~q)"""
         return self.modus_ponens(self.prop2_inst(p, q, neg(neg(q))), self.imp_provable(p, self.dneg_intro(q)))
@@ -206,6 +226,7 @@ class Propositional(ProofExp):
         p, q = Implies.extract(pq_pf.conc)
         return self.modus_ponens(self.dni_r(p, q), pq_pf)
 
+    @precompiled_lemma
     def dne_l(self, p: Pattern, q: Pattern) -> ProofThunk:
         """(~~p -> q) -> (p -> q)"""
         return self.modus_ponens(self.imp_trans(p, neg(neg(p)), q), self.dneg_intro(p))
@@ -219,6 +240,7 @@ class Propositional(ProofExp):
         p, q = Implies.extract(pq_pf.conc)
         return self.modus_ponens(self.dne_l(p, q), pq_pf)
 
+    @precompiled_lemma
     def dne_r(self, p: Pattern, q: Pattern) -> ProofThunk:
         """(p -> ~~q) -> (p -> q)"""
         return self.modus_ponens(self.prop2_inst(p, neg(neg(q)), q), self.imp_provable(p, self.dneg_elim(q)))
@@ -250,6 +272,7 @@ class Propositional(ProofExp):
         _, q = Implies.extract(pq_pf.conc)
         return self.imp_transitivity(pq_pf, self.prop1_inst(q, r))
 
+    @precompiled_lemma
     def con3(self, p: Pattern, q: Pattern) -> ProofThunk:
         """(p -> q) -> (~q -> ~p)"""
         return self.imp_trans(p, q, bot())
@@ -367,6 +390,7 @@ class Propositional(ProofExp):
         a, b = Implies.extract(h.conc)
         return self.imim(self.imp_refl(c), h)
 
+    @precompiled_lemma
     def con2(self, p: Pattern = phi0, q: Pattern = phi1) -> ProofThunk:
         """(p -> ~q) -> (q -> ~p)"""
         return self.imp_transitivity(self.prop2_inst(p, q, bot()), self.imim_l(neg(p), self.prop1_inst(q, p)))
@@ -452,6 +476,7 @@ class Propositional(ProofExp):
         q = q_pf.conc
         return self.imp_transitivity(self.mpcom(p_pf, neg(q)), self.modus_ponens(self.dneg_intro(q), q_pf))
 
+    @precompiled_lemma
     def and_l_imp(self, p: Pattern = phi0, q: Pattern = phi1) -> ProofThunk:
         """p /\\ q -> p"""
         return self.con1(self.absurd(p, neg(q)))
@@ -465,6 +490,7 @@ class Propositional(ProofExp):
         p, q = _and.assert_matches(pq_pf.conc)
         return self.modus_ponens(self.and_l_imp(p, q), pq_pf)
 
+    @precompiled_lemma
     def and_r_imp(self, p: Pattern = phi0, q: Pattern = phi1) -> ProofThunk:
         """p /\\ q -> q"""
         return self.con1(self.prop1_inst(neg(q), p))
@@ -502,6 +528,7 @@ class Propositional(ProofExp):
         nrpnq_pf = self.ant_commutativity(pnrnq_pf)
         return self.con1(nrpnq_pf)
 
+    @precompiled_lemma
     def ian(self, p: Pattern, q: Pattern) -> ProofThunk:
         """p -> (q -> p /\\ q)"""
         pnq = Implies(p, neg(q))
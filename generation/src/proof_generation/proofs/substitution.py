@@ -31,7 +31,7 @@ class Substitution(ProofExp):
             notations=[forall(0)],
             claims=[forall(0)(top())],
         )
-        self.prop = self.import_module(Propositional())
+        self.prop = self.import_module(Propositional.shared())
         self.add_proof_expression(self.top_univgen())
 
     def universal_gen(self, phi: ProofThunk, var: EVar) -> ProofThunk:
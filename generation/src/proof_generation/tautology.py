@@ -22,6 +22,7 @@ from proof_generation.aml import (
     phi2,
     top,
 )
+from proof_generation.proof import precompiled_lemma
 from proof_generation.proofs.propositional import Propositional, _build_subst
 
 if TYPE_CHECKING:
@@ -181,6 +182,7 @@ class Tautology(Propositional):
         actual_subst: dict[int, Pattern] = subst
         return self.imp_transitivity(h1, self.dynamic_inst(h2, actual_subst))
 
+    @precompiled_lemma
     def and_assoc_r(self, pat1: Pattern = phi0, pat2: Pattern = phi1, pat3: Pattern = phi2) -> ProofThunk:
         """(a /\\ b) /\\ c -> a /\\ (b /\\ c)"""
         return self.iand(
@@ -188,6 +190,7 @@ class Tautology(Propositional):
             self.imim_and_l(pat3, self.and_r_imp(pat1, pat2)),
         )
 
+    @precompiled_lemma
     def and_assoc_l(self, pat1: Pattern = phi0, pat2: Pattern = phi1, pat3: Pattern = phi2) -> ProofThunk:
         """a /\\ (b /\\ c) -> (a /\\ b) /\\ c"""
         return self.iand(
@@ -227,22 +230,27 @@ class Tautology(Propositional):
         """a \\/ (b \\/ c) <-> (a \\/ b) \\/ c"""
         return self.and_intro(self.or_assoc_l(pat1, pat2, pat3), self.or_assoc_r(pat1, pat2, pat3))
 
+    @precompiled_lemma
     def and_comm_imp(self, p: Pattern = phi0, q: Pattern = phi1) -> ProofThunk:
         """p /\\ q -> q /\\ p"""
         return self.con3_i(self.con2(q, p))
 
+    @precompiled_lemma
     def and_comm(self, p: Pattern = phi0, q: Pattern = phi1) -> ProofThunk:
         """p /\\ q <-> q /\\ p"""
         return self.and_intro(self.and_comm_imp(p, q), self.and_comm_imp(q, p))
 
+    @precompiled_lemma
     def or_comm_imp(self, p: Pattern = phi0, q: Pattern = phi1) -> ProofThunk:
         """p \\/ q -> q \\/ p"""
         return self.imp_transitivity(self.imp_trans(neg(p), q, bot()), self.dne_r(neg(q), p))
 
+    @precompiled_lemma
     def or_comm(self, p: Pattern = phi0, q: Pattern = phi1) -> ProofThunk:
         """p \\/ q <-> q \\/ p"""
         return self.and_intro(self.or_comm_imp(p, q), self.or_comm_imp(q, p))
 
+    @precompiled_lemma
     def or_l_imp(self, p: Pattern, q: Pattern) -> ProofThunk:
         """p -> p \\/ q"""
         return self.ant_commutativity(self.absurd(p, q))
@@ -267,6 +275,7 @@ class Tautology(Propositional):
         """
         return self.modus_ponens(self.or_r_imp(p, q_pf.conc), q_pf)
 
+    @precompiled_lemma
     def equiv_refl(self, p: Pattern = phi0) -> ProofThunk:
         """p <-> p"""
         pf = self.imp_refl(p)
@@ -338,14 +347,17 @@ class Tautology(Propositional):
             self.imim_or(self.and_r(pf1), self.and_r(pf2)),
         )
 
+    @precompiled_lemma
     def resolution(self, p: Pattern = phi0, a: Pattern = phi1, b: Pattern = phi2) -> ProofThunk:
         """~p \\/ a -> p \\/ b -> a \\/ b"""
         return self.imp_transitivity(self.or_comm_imp(neg(p), a), self.imp_trans(neg(a), neg(p), b))
 
+    @precompiled_lemma
     def resolution_r(self, p: Pattern = phi0, b: Pattern = phi1) -> ProofThunk:
         """~p -> p \\/ b -> b"""
         return self.ant_commutativity(self.imp_refl(_or(p, b)))
 
+    @precompiled_lemma
     def resolution_l(self, p: Pattern = phi0, a: Pattern = phi1) -> ProofThunk:
         """~p \\/ a -> p -> a"""
         return self.imim_l(a, self.dneg_intro(p))
@@ -702,6 +714,7 @@ class Tautology(Propositional):
             pos, terms, self.and_assoc, self.and_comm, self.and_cong, _and, _and.assert_matches
         )
 
+    @precompiled_lemma
     def or_idem(self, p: Pattern = phi0) -> ProofThunk:
         """p \\/ p <-> p"""
         return self.and_intro(self.peirce_bot(p), self.prop1_inst(p, neg(p)))
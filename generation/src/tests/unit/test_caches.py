@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import pytest
+
+from proof_generation import caches
+from proof_generation.aml import Symbol
+from proof_generation.caches import cache_stats, registered_cache, reset_caches
+from proof_generation.proofs.kore import nary_app
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+
+@pytest.fixture
+def unregister_caches() -> Iterator[None]:
+    """Unregister the caches registered by the test."""
+    registered = set(caches._registry)
+    yield
+    for name in set(caches._registry) - registered:
+        del caches._registry[name]
+
+
+@pytest.mark.usefixtures('unregister_caches')
+def test_registered_cache() -> None:
+    calls = []
+
+    @registered_cache(maxsize=2)
+    def square(x: int) -> int:
+        calls.append(x)
+        return x * x
+
+    assert [square(1), square(2), square(1), square(3), square(2)] == [1, 4, 1, 9, 4]
+    # 2 has been evicted by 3 as 1 was used more recently
+    assert calls == [1, 2, 3, 2]
+
+    stats = next(s for s in cache_stats() if s.name.endswith('test_registered_cache.<locals>.square'))
+    assert (stats.hits, stats.misses, stats.size, stats.maxsize, stats.pinned) == (1, 4, 2, 2, False)
+
+    reset_caches()
+    square(1)
+    assert calls == [1, 2, 3, 2, 1]
+
+
+@pytest.mark.usefixtures('unregister_caches')
+def test_register_again() -> None:
+    squares = []
+    # As when a module is reloaded
+    for _ in range(2):
+
+        @registered_cache()
+        def square(x: int) -> int:
+            return x * x
+
+        squares.append(square)
+
+    squares[1](2)
+    (stats,) = (s for s in cache_stats() if s.name.endswith('test_register_again.<locals>.square'))
+    assert (stats.hits, stats.misses) == (0, 1)
+
+
+def test_pinned_cache() -> None:
+    notation = nary_app(Symbol('pinned'), 2)
+    reset_caches()
+    # Notations are compared by identity and must survive resetting
+    assert nary_app(Symbol('pinned'), 2) is notation
+    stats = next(s for s in cache_stats() if s.name.endswith('kore.nary_app'))
+    assert stats.pinned
+    assert stats.maxsize is None
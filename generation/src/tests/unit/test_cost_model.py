@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import os
+from collections import Counter
+
+import pytest
+
+from proof_generation.cost_model import (
+    DEFAULT_COST_MODEL,
+    PUBLISHED_CYCLES,
+    CostFeatures,
+    calibrate,
+    leave_one_out_errors,
+    profile_proof,
+)
+from proof_generation.instruction import Instruction
+
+TRANSLATED_LOCATION = 'proofs/translated'
+
+
+def read_profile(name: str) -> CostFeatures:
+    def read(suffix: str) -> bytes:
+        with open(os.path.join(TRANSLATED_LOCATION, name + suffix), 'rb') as f:
+            return f.read()
+
+    return profile_proof(read('.ml-gamma'), read('.ml-claim'), read('.ml-proof')).total()
+
+
+@pytest.mark.parametrize('name', PUBLISHED_CYCLES.keys())
+def test_estimate_published_cycles(name: str) -> None:
+    estimate = DEFAULT_COST_MODEL.estimate(read_profile(name))
+    assert abs(estimate - PUBLISHED_CYCLES[name]) <= 0.2 * PUBLISHED_CYCLES[name]
+
+
+def test_published_cycles_held_out() -> None:
+    samples = [(read_profile(name), cycles) for name, cycles in PUBLISHED_CYCLES.items()]
+    model = calibrate(samples)
+    assert model.base == pytest.approx(DEFAULT_COST_MODEL.base, rel=1e-4)
+    assert model.compared_node == pytest.approx(DEFAULT_COST_MODEL.compared_node, rel=1e-4)
+    assert model.instantiated_node == pytest.approx(DEFAULT_COST_MODEL.instantiated_node, rel=1e-4)
+
+    # Every measurement is estimated within 20% by the model calibrated on the other proofs
+    errors = leave_one_out_errors(samples)
+    assert max(map(abs, errors)) <= 0.2
+    # A cost per instruction does not generalize to the proof dominated by instantiations
+    assert max(map(abs, leave_one_out_errors(samples, instruction_cost=True))) > 1
+
+
+def test_calibrate() -> None:
+    samples = [
+        CostFeatures(Counter({Instruction.Prop1: instructions}), compared, instantiated)
+        for instructions, compared, instantiated in [(10, 0, 0), (0, 10, 0), (0, 0, 10), (5, 5, 5), (100, 20, 3)]
+    ]
+    measured = [
+        (
+            features,
+            int(1000 + 3 * features.instructions + 7 * features.compared_nodes + 11 * features.instantiated_nodes),
+        )
+        for features in samples
+    ]
+    model = calibrate(measured, instruction_cost=True)
+    assert model.base == pytest.approx(1000)
+    assert model.instruction_costs[Instruction.ModusPonens] == pytest.approx(3)
+    assert model.compared_node == pytest.approx(7)
+    assert model.instantiated_node == pytest.approx(11)
+    for features, cycles in measured:
+        assert model.estimate(features) == pytest.approx(cycles)
+
+
+def test_calibrate_without_instruction_cost() -> None:
+    samples = [
+        CostFeatures(Counter({Instruction.Prop1: instructions}), compared, instantiated)
+        for instructions, compared, instantiated in [(10, 0, 0), (0, 10, 0), (0, 0, 10), (100, 20, 3)]
+    ]
+    measured = [
+        (features, 1000 + 7 * features.compared_nodes + 11 * features.instantiated_nodes) for features in samples
+    ]
+    model = calibrate(measured)
+    assert model.instruction_costs[Instruction.Prop1] == 0
+    assert (model.base, model.compared_node, model.instantiated_node) == pytest.approx((1000, 7, 11))
+    assert leave_one_out_errors(measured) == pytest.approx([0, 0, 0, 0], abs=1e-9)
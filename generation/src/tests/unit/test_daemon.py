@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import asyncio
+import base64
+import os
+from io import StringIO
+from typing import TYPE_CHECKING
+
+from proof_generation.daemon import ProofGenerationDaemon, WarmState, handle_request, send_request
+from proof_generation.deserialize import deserialize_instructions
+from proof_generation.interpreter import ExecutionPhase, PrettyPrintingInterpreter
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from pytest import MonkeyPatch
+
+IMPREFLEX = os.path.abspath(os.path.join('generation/mm-benchmarks', 'impreflex.mm'))
+
+
+def test_handle_request(tmp_path: Path) -> None:
+    request = {'command': 'translate', 'database': IMPREFLEX, 'target': 'imp-reflexivity'}
+
+    inline = handle_request(request)
+    assert inline['ok'], inline['error']
+    assert set(inline['files']) == {'impreflex.ml-gamma', 'impreflex.ml-claim', 'impreflex.ml-proof'}
+
+    written = handle_request(request | {'output_dir': str(tmp_path), 'module': 'reflexivity'})
+    assert written['ok'], written['error']
+    assert written['outputs'] == [
+        str(tmp_path / f'reflexivity.{suffix}') for suffix in ('ml-gamma', 'ml-claim', 'ml-proof')
+    ]
+    # The database is translated from the warm state with the same result
+    assert base64.b64decode(inline['files']['impreflex.ml-proof']) == (tmp_path / 'reflexivity.ml-proof').read_bytes()
+
+    missing = handle_request(request | {'target': 'no-such-lemma'})
+    assert not missing['ok']
+    assert not handle_request({'command': 'unknown'})['ok']
+
+
+def test_translate_claims(tmp_path: Path, monkeypatch: MonkeyPatch) -> None:
+    # The database is not left in the state the daemon of the other tests inherits
+    monkeypatch.setattr('proof_generation.daemon._state', WarmState())
+    with open(IMPREFLEX) as mm_file:
+        src = mm_file.read()
+    proof = src[src.index('$= (') :]
+    database = tmp_path / 'lemmas.mm'
+    database.write_text(f'{src}\nimp-reflexivity-2 $p |- ( \\imp ph0 ph0 ) {proof}')
+
+    # Each response claims only its target, as the checker rejects the claims left unproved
+    for target in ('imp-reflexivity', 'imp-reflexivity-2'):
+        response = handle_request({'command': 'translate', 'database': str(database), 'target': target})
+        assert response['ok'], response['error']
+        out = StringIO()
+        interpreter = PrettyPrintingInterpreter(ExecutionPhase.Claim, out=out)
+        deserialize_instructions(base64.b64decode(response['files']['lemmas.ml-claim']), interpreter)
+        assert out.getvalue().count('Publish') == 1
+
+
+def test_daemon(tmp_path: Path) -> None:
+    socket_path = tmp_path / 'daemon.sock'
+    daemon = ProofGenerationDaemon(socket_path, workers=2)
+    daemon.preload(databases=[IMPREFLEX])
+
+    async def run() -> None:
+        serving = asyncio.create_task(daemon.serve())
+        while not socket_path.exists():
+            await asyncio.sleep(0.01)
+
+        request = {'command': 'translate', 'database': IMPREFLEX, 'target': 'imp-reflexivity'}
+        responses = await asyncio.gather(
+            send_request(request, socket_path),
+            send_request(request | {'target': 'no-such-lemma'}, socket_path),
+            send_request(request, socket_path),
+        )
+        assert [response['ok'] for response in responses] == [True, False, True]
+        assert responses[0]['files'] == responses[2]['files']
+
+        stats = await send_request({'command': 'stats'}, socket_path)
+        assert (stats['served'], stats['failed']) == (3, 1)
+        assert stats['preloaded']['databases'] == [os.path.realpath(IMPREFLEX)]
+
+        assert (await send_request({'command': 'shutdown'}, socket_path))['ok']
+        await serving
+
+    asyncio.run(run())
+    assert not socket_path.exists()
@@ -12,12 +12,14 @@ from proof_generation.k.execution_proof_generation import (
     SimplificationInfo,
     SimplificationPerformer,
     SimplificationProver,
+    is_same_configuration,
 )
 from proof_generation.k.kore_convertion.language_semantics import KEquationalRule, KRewritingRule
 from proof_generation.k.kore_convertion.rewrite_steps import RewriteStepExpression
 from proof_generation.proof import ProofThunk
-from proof_generation.proofs.kore import kore_and, kore_equals, kore_implies, kore_rewrites, kore_top
-from proof_generation.proofs.substitution import HOLE
+from proof_generation.proofs.kore import KoreLemmas, kore_and, kore_equals, kore_implies, kore_rewrites, kore_top
+from proof_generation.proofs.propositional import Propositional
+from proof_generation.proofs.substitution import HOLE, Substitution
 from tests.unit.test_kore_language_semantics import (
     double_rewrite,
     node_tree,
@@ -375,6 +377,38 @@ def test_performer_update_subterm():
     assert performer.update_subterm(location, pattern, plug) == result
 
 
+def test_performer_zipper():
+    semantics = node_tree()
+    reverse_symbol = semantics.get_symbol('reverse')
+    node_symbol = semantics.get_symbol('node')
+    a_symbol = semantics.get_symbol('a')
+    b_symbol = semantics.get_symbol('b')
+
+    subterm = node_symbol.app(reverse_symbol.app(a_symbol.app()), reverse_symbol.app(b_symbol.app()))
+    config = tree_semantics_config_pattern(semantics, 'SortTree', subterm)
+    performer = SimplificationPerformer(semantics, DummyProver(semantics), config)
+
+    # generated_top (ignored) -> k -> inj -> ksym_node -> ksym_reverse
+    zipper = performer.zipper((0, 0, 0, 1), config)
+    assert zipper.focus == reverse_symbol.app(b_symbol.app())
+    assert zipper.ctx == tree_semantics_config_pattern(
+        semantics, 'SortTree', node_symbol.app(reverse_symbol.app(a_symbol.app()), HOLE)
+    )
+    assert zipper.plug(b_symbol.app()) == tree_semantics_config_pattern(
+        semantics, 'SortTree', node_symbol.app(reverse_symbol.app(a_symbol.app()), b_symbol.app())
+    )
+    # Plugging the focus back gives the original pattern
+    assert zipper.plug(zipper.focus) == config
+    # The unchanged arguments are shared with the original pattern
+    assert zipper.frame is not None
+    assert zipper.frame.args[0] is performer.get_subterm((0, 0, 0, 0), config)
+
+    # Empty location focuses on the whole pattern
+    assert performer.zipper((), config).plug(a_symbol.app()) == a_symbol.app()
+    with pytest.raises(AssertionError):
+        performer.zipper((0, 0, 0, 2), config)
+
+
 def test_performer_apply_substitution():
     semantics = node_tree()
     reverse_symbol = semantics.get_symbol('reverse')
@@ -445,6 +479,69 @@ def test_performer_update_config():
     assert performer.simplified_configuration == intermidiate_config1
 
 
+def test_performer_reset():
+    semantics = node_tree()
+    reverse_symbol = semantics.get_symbol('reverse')
+    a_symbol = semantics.get_symbol('a')
+
+    config_before = tree_semantics_config_pattern(semantics, 'SortTree', reverse_symbol.app(a_symbol.app()))
+    config_after = tree_semantics_config_pattern(semantics, 'SortTree', a_symbol.app())
+    prover = SimplificationProver(semantics)
+    performer = SimplificationPerformer(semantics, prover, config_before)
+
+    # Cannot be reset in the middle of a batch
+    performer.enter_context((0, 0, 0))
+    with pytest.raises(AssertionError):
+        performer.reset(config_before)
+    performer.apply_simplification(2, {})  # reverse(a) -> a
+    performer.exit_context()
+    assert performer.proof is not None
+    assert performer.simplified_configuration == config_after
+
+    # The same performer and prover are reused for the next batch
+    performer.reset(config_before)
+    assert performer.proof is None
+    assert performer.prover is prover
+    assert performer.simplified_configuration == config_before
+    performer.enter_context((0, 0, 0))
+    performer.apply_simplification(2, {})
+    performer.exit_context()
+    assert performer.simplified_configuration == config_after
+
+
+def test_shared_modules() -> None:
+    semantics = node_tree()
+    assert Substitution.shared() is Substitution.shared()
+    assert KoreLemmas.shared() is not Substitution.shared()
+    # Provers share the immutable lemma modules
+    first, second = SimplificationProver(semantics), SimplificationProver(semantics)
+    assert first.kore_lemmas is second.kore_lemmas
+    assert first.subst_proofexp is second.subst_proofexp
+    assert first.subst_proofexp.prop is Propositional.shared()
+
+
+def test_is_same_configuration() -> None:
+    semantics = node_tree()
+    reverse_symbol = semantics.get_symbol('reverse')
+    node_symbol = semantics.get_symbol('node')
+    a_symbol = semantics.get_symbol('a')
+    b_symbol = semantics.get_symbol('b')
+
+    shared = node_symbol.app(a_symbol.app(), b_symbol.app())
+    config = tree_semantics_config_pattern(semantics, 'SortTree', reverse_symbol.app(shared))
+    assert is_same_configuration(config, config)
+    assert is_same_configuration(
+        config, tree_semantics_config_pattern(semantics, 'SortTree', reverse_symbol.app(shared))
+    )
+    # Equal patterns without shared subpatterns
+    copy = reverse_symbol.app(node_symbol.app(a_symbol.app(), b_symbol.app()))
+    assert is_same_configuration(config, tree_semantics_config_pattern(semantics, 'SortTree', copy))
+    # Equal patterns in different forms
+    assert isinstance(config, Instantiate)
+    assert is_same_configuration(config, config.simplify())
+    assert not is_same_configuration(config, tree_semantics_config_pattern(semantics, 'SortTree', shared))
+
+
 def test_trivial_proof() -> None:
     semantics = node_tree()
     cfg_sort = semantics.get_sort('SortGeneratedTopCell').aml_symbol
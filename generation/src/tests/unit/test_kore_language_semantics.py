@@ -1,13 +1,16 @@
 from __future__ import annotations
 
 from itertools import count
+from typing import TYPE_CHECKING
 
+import pyk.kore.syntax as kore
 from pytest import mark, raises
 
 from proof_generation.aml import App, EVar, MetaVar, Pattern, Symbol, phi0, phi1
 from proof_generation.k.execution_proof_generation import ExecutionProofExp
 from proof_generation.k.kore_convertion.language_semantics import (
     AxiomType,
+    ConvertionScope,
     KEquationalRule,
     KModule,
     KSort,
@@ -15,6 +18,7 @@ from proof_generation.k.kore_convertion.language_semantics import (
     KSymbol,
     LanguageSemantics,
 )
+from proof_generation.k.kore_convertion.semantics_cache import definition_key, load_semantics, save_semantics
 from proof_generation.proofs.definedness import equals, floor, functional, subset
 from proof_generation.proofs.kore import (
     KoreLemmas,
@@ -29,6 +33,9 @@ from proof_generation.proofs.kore import (
     nary_app,
 )
 
+if TYPE_CHECKING:
+    from pathlib import Path
+
 
 def double_rewrite() -> LanguageSemantics:
     # Constructs a language semantics for the double rewrite module.
@@ -637,6 +644,11 @@ def test_collect_functional_axioms() -> None:
             assert axioms[0].pattern == functional(a(b))
             assert axioms[1].pattern == functional(b)
 
+            # Repeated terms give a single axiom, the same object for every step
+            axioms = ExecutionProofExp.collect_functional_axioms(sem, {0: b, 1: a(b), 2: b})
+            assert [axiom.pattern for axiom in axioms] == [functional(b), functional(a(b))]
+            assert ExecutionProofExp.collect_functional_axioms(sem, {3: b})[0] is axioms[0]
+
 
 @mark.parametrize(
     'pat, pretty_pat',
@@ -715,3 +727,104 @@ def test_locate_simplifications() -> None:
     assert semantics.count_simplifications(intermediate_config2) == 1
     # Explicit configuration with an unknown symbol
     assert semantics.count_simplifications(unknown_symbol_conf) == 0
+
+
+def test_semantics_cache(tmp_path: Path) -> None:
+    semantics = node_tree()
+    cache_file = tmp_path / 'semantics.cache'
+
+    kore_file = tmp_path / 'definition.kore'
+    kore_file.write_text('[]\nmodule NODE-TREE endmodule []')
+    key = definition_key(kore_file)
+
+    # Nothing has been cached yet
+    assert load_semantics(cache_file, key) is None
+
+    save_semantics(cache_file, key, semantics)
+    cached = load_semantics(cache_file, key)
+    assert cached is not None
+    assert cached.sorts == semantics.sorts
+    assert cached.symbols == semantics.symbols
+    assert cached.notations == semantics.notations
+    for ordinal in range(5):
+        assert cached.get_axiom(ordinal) == semantics.get_axiom(ordinal)
+
+    # The cached semantics is immutable as well
+    with raises(ValueError):
+        cached.main_module.sort('new_sort')
+
+    # Changing the definition invalidates the cache
+    kore_file.write_text('[]\nmodule NODE-TREE-2 endmodule []')
+    assert definition_key(kore_file) != key
+    assert load_semantics(cache_file, definition_key(kore_file)) is None
+
+
+def test_convert_pattern_memo() -> None:
+    semantics = node_tree()
+    node_symbol = semantics.get_symbol('node')
+    a_symbol = semantics.get_symbol('a')
+
+    def kore_node(left: kore.Pattern, right: kore.Pattern) -> kore.Pattern:
+        return kore.App('node', (), (left, right))
+
+    ground = kore_node(kore.App('a'), kore.App('a'))
+    converted = semantics.convert_pattern(ground)
+    assert converted == node_symbol.app(a_symbol.app(), a_symbol.app())
+    # Both arguments are converted only once
+    assert semantics.conversion_stats.allocations == 2
+    assert semantics.conversion_stats.memo_hits == 1
+
+    # Equal ground patterns are converted to the very same object
+    assert semantics.convert_pattern(kore_node(kore.App('a'), kore.App('a'))) is converted
+    assert semantics.conversion_stats.allocations == 2
+
+    # Patterns with variables depend on the scope and are not shared between scopes
+    var = kore.EVar('X', kore.SortApp('SortTree'))
+    with_var = kore_node(var, ground)
+    expected = node_symbol.app(MetaVar(0), converted)
+    assert semantics.convert_pattern(with_var) == expected
+    assert semantics.convert_pattern(with_var) == expected
+    assert semantics.conversion_stats.allocations == 6
+
+
+def test_conversion_memo_bounded() -> None:
+    semantics = node_tree()
+    semantics.CONVERSION_MEMO_LIMIT = 2
+    scope = ConvertionScope()
+    semantics._cached_axiom_scopes[0] = scope
+    var = kore.EVar('X', kore.SortApp('SortTree'))
+
+    tree: kore.Pattern = kore.App('a')
+    for _ in range(5):
+        tree = kore.App('node', (), (tree, var))
+        semantics._convert_pattern(scope, tree)
+        semantics.convert_pattern(kore.App('node', (), (tree, tree)))
+    # A full table is cleared instead of growing with every converted configuration
+    assert 0 < len(semantics._ground_patterns) <= 2
+    assert 0 < len(scope._memo) <= 2
+
+    # The memoized conversions of a proof are dropped when it is done
+    semantics.clear_conversion_memo()
+    assert not semantics._ground_patterns
+    assert not scope._memo
+    converted = semantics.convert_pattern(kore.App('node', (), (kore.App('a'), kore.App('a'))))
+    assert converted == semantics.get_symbol('node').app(
+        semantics.get_symbol('a').app(), semantics.get_symbol('a').app()
+    )
+
+
+def test_count_simplifications_shared_subpatterns() -> None:
+    semantics = node_tree()
+    reverse_symbol = semantics.get_symbol('reverse')
+    node_symbol = semantics.get_symbol('node')
+    a_symbol = semantics.get_symbol('a')
+
+    shared = reverse_symbol.app(node_symbol.app(a_symbol.app(), reverse_symbol.app(a_symbol.app())))
+    assert semantics.count_simplifications(shared) == 2
+    # The same object occurring several times is counted every time
+    assert semantics.count_simplifications(node_symbol.app(shared, shared)) == 4
+    assert semantics.count_simplifications(reverse_symbol.app(node_symbol.app(shared, a_symbol.app()))) == 3
+    # Equal but not identical patterns give the same result
+    copy = reverse_symbol.app(node_symbol.app(a_symbol.app(), reverse_symbol.app(a_symbol.app())))
+    assert copy is not shared
+    assert semantics.count_simplifications(copy) == 2
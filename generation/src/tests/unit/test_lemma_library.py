@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import proof_generation
+from proof_generation import lemma_library as library_module
+from proof_generation.aml import Implies, Symbol, phi0
+from proof_generation.cost_model import profile_proof
+from proof_generation.interpreter import ExecutionPhase, StatefulInterpreter
+from proof_generation.lemma_library import (
+    LEMMA_FILE_SUFFIX,
+    LemmaLibrary,
+    compile_lemma,
+    lemma_library,
+    replay_lemma,
+    source_key,
+    use_lemma_library,
+)
+from proof_generation.proof import OutputFormat
+from proof_generation.proofs.propositional import Propositional
+from proof_generation.proved import Proved
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    import pytest
+
+
+def test_replay_lemma() -> None:
+    prop = Propositional()
+    lemma = compile_lemma(Propositional.imp_refl.__wrapped__(prop, phi0))  # type: ignore
+    assert lemma.conclusion == Implies(phi0, phi0)
+
+    # The lemma does not depend on the state of the interpreter it is replayed on
+    interpreter = StatefulInterpreter(ExecutionPhase.Proof)
+    interpreter.pattern(Symbol('s0'))
+    assert replay_lemma(lemma, interpreter) == Proved(Implies(phi0, phi0))
+    assert interpreter.stack == [Symbol('s0'), Proved(Implies(phi0, phi0))]
+
+
+def serialize_propositional(library: LemmaLibrary, output: Path) -> bytes:
+    # The proofs are built before the library is put in use, as by ProofExp.main
+    prop = Propositional()
+    with use_lemma_library(library):
+        prop.serialize(output, OutputFormat.Binary, False)
+    assert lemma_library() is None
+    gamma, claims, proof = (
+        output.with_suffix(suffix).read_bytes() for suffix in ('.ml-gamma', '.ml-claim', '.ml-proof')
+    )
+    # Replaying the proofs checks them against their claims
+    profile_proof(gamma, claims, proof)
+    return proof
+
+
+def test_lemma_library(tmp_path: Path) -> None:
+    directory = tmp_path / 'lemmas'
+
+    cold = LemmaLibrary(directory)
+    cold_proof = serialize_propositional(cold, tmp_path / 'cold')
+    assert cold.compiled > 0 and cold.loaded == 0
+    assert len(list(directory.glob(f'*{LEMMA_FILE_SUFFIX}'))) == cold.compiled
+
+    warm = LemmaLibrary(directory)
+    assert serialize_propositional(warm, tmp_path / 'warm') == cold_proof
+    assert (warm.compiled, warm.loaded) == (0, cold.compiled)
+
+
+def test_stale_lemma(tmp_path: Path) -> None:
+    cold = LemmaLibrary(tmp_path)
+    serialize_propositional(cold, tmp_path / 'cold')
+    for lemma_file in tmp_path.glob(f'*{LEMMA_FILE_SUFFIX}'):
+        lemma_file.write_bytes(b'stale')
+
+    recompiled = LemmaLibrary(tmp_path)
+    serialize_propositional(recompiled, tmp_path / 'recompiled')
+    assert (recompiled.compiled, recompiled.loaded) == (cold.compiled, 0)
+
+
+def test_main_restores_library(tmp_path: Path) -> None:
+    lemmas = tmp_path / 'lemmas'
+    Propositional().main(['propositional', 'binary', str(tmp_path), 'propositional', '--lemma-library', str(lemmas)])
+    assert lemma_library() is None
+    assert any(lemmas.glob(f'*{LEMMA_FILE_SUFFIX}'))
+
+
+def test_source_key(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    package = tmp_path / 'proof_generation'
+    (package / 'proofs').mkdir(parents=True)
+    (package / '__init__.py').write_text('')
+    helper = package / 'proofs' / 'helper.py'
+    helper.write_text('HELPER = 0\n')
+    monkeypatch.setattr(proof_generation, '__file__', str(package / '__init__.py'))
+
+    def key() -> str:
+        monkeypatch.setattr(library_module, '_package_digest', None)
+        monkeypatch.setattr(library_module, '_source_digests', {})
+        return source_key(Propositional, 'imp_refl', 1)
+
+    before = key()
+    assert key() == before
+    # Lemmas may call helpers of any module of the package, not only of the class and its bases
+    helper.write_text('HELPER = 1\n')
+    assert key() != before
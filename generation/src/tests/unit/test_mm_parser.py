@@ -1,16 +1,188 @@
+from __future__ import annotations
+
+import marshal
 import os
+from functools import cache
+from typing import TYPE_CHECKING
+
+import pytest
+from lark import Lark, Token, Transformer
 
 from proof_generation.metamath.ast import (
+    Application,
     AxiomaticStatement,
+    BaseAST,
     Block,
     ConstantStatement,
+    Database,
+    DisjointStatement,
+    EssentialStatement,
     FloatingStatement,
+    Metavariable,
     ProvableStatement,
+    StructuredStatement,
+    TermTable,
     VariableStatement,
 )
-from proof_generation.metamath.parser import load_database
+from proof_generation.metamath.database_cache import (
+    CACHE_FORMAT_VERSION,
+    CACHE_MAGIC,
+    CACHE_SUFFIX,
+    decode_database,
+    encode_database,
+)
+from proof_generation.metamath.parser import (
+    MetamathParser,
+    flatten_includes,
+    load_database,
+    parse_database,
+    parse_term_with_metavariables,
+    tokenize,
+)
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+    from pathlib import Path
+
+    from proof_generation.metamath.ast import Statement, Term, Terms
 
 BENCHMARK_LOCATION = 'generation/mm-benchmarks'
+BENCHMARK_FILES = sorted(name for name in os.listdir(BENCHMARK_LOCATION) if name.endswith('.mm'))
+
+
+class ASTTransformer(Transformer[Token, BaseAST]):
+    def __init__(self, metavariables: Iterable[str] = ()) -> None:
+        super().__init__()
+        self.metavariables = list(metavariables)
+
+    def token(self, args: list[Token]) -> str:
+        assert isinstance(args[0].value, str)
+        return args[0].value
+
+    def constant_stmt(self, args: list[str]) -> ConstantStatement:
+        return ConstantStatement(tuple(args))
+
+    def variable_stmt(self, args: list[str]) -> VariableStatement:
+        self.metavariables += args
+        return VariableStatement(tuple(map(Metavariable, args)))
+
+    def disjoint_stmt(self, args: list[str]) -> DisjointStatement:
+        for var in args:
+            assert var in self.metavariables, f'variable {var} used before declaration'
+        return DisjointStatement(tuple(map(Metavariable, args)))
+
+    def floating_stmt(self, args: list[str]) -> FloatingStatement:
+        label, typecode, variable = args
+        assert variable in self.metavariables, f'variable {variable} used before declaration'
+        return FloatingStatement(label, (Application(typecode), Metavariable(variable)))
+
+    def parse_term(self, tokens: list[str]) -> tuple[Term, list[str]]:
+        """
+        Parse a term from a list of tokens, returns the term and the rest of the unused tokens
+        """
+        assert len(tokens)
+
+        first = tokens[0]
+        if first == '(':
+            # separate out sublist of tokens with balanced parentheses
+            num_nested = 1
+            for i, token in enumerate(tokens[1:]):  # noqa: B007
+                if token == '(':
+                    num_nested += 1
+                elif token == ')':
+                    num_nested -= 1
+                if num_nested == 0:
+                    break
+
+            # offset to include the first token
+            i += 1
+
+            assert num_nested == 0, 'incorrectly nested term: {}'.format(' '.join(tokens))
+            assert i > 2, 'ill-formed s-expression: {}'.format(' '.join(tokens))
+
+            subterms = self.parse_terms(tokens[2:i])
+            constant = tokens[1]
+            return Application(constant, subterms), tokens[i + 1 :]
+
+        elif first in self.metavariables:
+            return Metavariable(first), tokens[1:]
+        else:
+            return Application(first), tokens[1:]
+
+    def parse_terms(self, tokens: list[str]) -> Terms:
+        terms = []
+        while len(tokens):
+            term, tokens = self.parse_term(tokens)
+            terms.append(term)
+        return tuple(terms)
+
+    def axiom_stmt(self, args: list[str]) -> AxiomaticStatement:
+        label, *tokens = args
+        terms = self.parse_terms(tokens)
+        return AxiomaticStatement(label, terms)
+
+    def essential_stmt(self, args: list[str]) -> EssentialStatement:
+        label, *tokens = args
+        terms = self.parse_terms(tokens)
+        return EssentialStatement(label, terms)
+
+    def proof(self, args: list[str]) -> list[str]:
+        return args
+
+    def provable_stmt(self, args: list[str]) -> ProvableStatement:
+        label, *args = args
+        script = list(args[-1])
+        tokens = args[:-1]
+        terms = self.parse_terms(tokens)
+        return ProvableStatement(label, terms, ' '.join(script))
+
+    def block(self, args: list[Statement]) -> Block:
+        return Block(tuple(args))
+
+    def database(self, args: list[Statement]) -> Database:
+        return Database(tuple(args))
+
+
+# The Lark grammar the single pass parser replaced, kept as the reference it is compared against
+syntax = r"""
+// see http://us.metamath.org/downloads/metamath.pdf appendix E for more info
+// this syntax is more relaxed than the standard syntax
+
+COMMENT: /\$\(((.|\n)(?<!\$\)))*\$\)/
+
+%ignore COMMENT
+%ignore /[ \n\t\f\r]+/
+
+TOKEN: /[^ \n\t\f\r\$]+/
+
+token: TOKEN
+
+database: stmt*
+
+stmt: "$c" token+ "$."                   -> constant_stmt
+    | "$v" token+ "$."                   -> variable_stmt
+    | "$d" token+ "$."                   -> disjoint_stmt
+    | token "$f" token token "$."        -> floating_stmt
+    | token "$e" token+ "$."             -> essential_stmt
+    | token "$a" token+ "$."             -> axiom_stmt
+    | token "$p" token+ "$=" proof "$."  -> provable_stmt
+    | "${" stmt* "$}"                    -> block
+
+proof: token*
+"""
+
+
+@cache
+def lark_parser() -> Lark:
+    return Lark(syntax, start='database', parser='lalr', lexer='basic', propagate_positions=True)
+
+
+def parse_database_with_lark(src: str) -> Database:
+    """Reference implementation of parse_database on top of the Lark grammar."""
+    tree = lark_parser().parse(src)
+    ast = ASTTransformer().transform(tree)
+    assert isinstance(ast, Database)
+    return ast
 
 
 def test_parse_impreflex() -> None:
@@ -122,3 +294,140 @@ def test_parse_disjointness_alt_lemma_slice() -> None:
     assert isinstance(input_database.statements[-1], Block)
     assert isinstance(input_database.statements[-1].statements[-1], ProvableStatement)
     assert input_database.statements[-1].statements[-1].label == 'disjointness-alt-lemma'
+
+
+@pytest.mark.parametrize('name', BENCHMARK_FILES)
+@pytest.mark.parametrize('include_proof', [True, False])
+def test_parser_matches_lark(name: str, include_proof: bool) -> None:
+    path = os.path.join(BENCHMARK_LOCATION, name)
+    with open(path) as mm_file:
+        src = mm_file.read()
+    expected = parse_database_with_lark(src)
+    assert parse_database(src) == expected
+    # Tokens and comments may be split across chunks
+    chunks = (src[i : i + 7] for i in range(0, len(src), 7))
+    assert MetamathParser().parse_database(tokenize(chunks)) == expected
+
+    if not include_proof:
+        expected = expected.top_down(
+            lambda stmt: ProvableStatement(stmt.label, stmt.terms, '?') if isinstance(stmt, ProvableStatement) else stmt
+        )
+    assert load_database(path, include_proof=include_proof) == expected
+    assert parse_database_with_lark(flatten_includes(path, set(), include_proof=include_proof)) == expected
+
+
+def test_flatten_includes(tmp_path: Path) -> None:
+    leaf = tmp_path / 'leaf.mm'
+    leaf.write_text('$c leaf $. $( $[ ignored.mm $] $)\n')
+    middle = tmp_path / 'middle.mm'
+    middle.write_text(f'$[ {leaf} $] $c middle $.\n')
+    main = tmp_path / 'main.mm'
+    main.write_text(f'$c ( ) $. $[ {middle} $]\n$[ {leaf} $]\n${{ l $p ( middle leaf ) $= $( proof $) a b $. $}}\n')
+
+    loaded: set[str] = set()
+    assert (
+        flatten_includes(str(main), loaded) == '$c ( ) $. $c leaf $. $c middle $. ${ l $p ( middle leaf ) $= a b $. $}'
+    )
+    assert loaded == {os.path.realpath(path) for path in (leaf, middle, main)}
+    assert flatten_includes(str(main), set(), include_proof=False).endswith('$= ? $. $}')
+
+    leaf.write_text(f'$[ {main} $]\n')
+    with pytest.raises(Exception, match='recursivly loading'):
+        load_database(str(main))
+
+
+def test_tokenize() -> None:
+    src = '$( a $( b $)$c ( ) $.\nx$f #Pattern y$.$(\nmulti\nline $)${ l $p ( f a ) $= x  $. $}'
+    expected = ['$c', '(', ')', '$.', 'x', '$f', '#Pattern', 'y', '$.', '${', 'l', '$p', '(', 'f', 'a', ')', '$=', 'x']
+    expected += ['$.', '$}']
+    assert list(tokenize([src])) == expected
+    assert list(tokenize(src)) == expected
+    with pytest.raises(ValueError):
+        list(tokenize(['$c a $. $( unterminated']))
+
+
+@pytest.mark.parametrize('src', ['$c a', '$c $.', 'l $a ( f ) $.', 'l $a ( f a $.', 'l $a f ) $.', '${ $c a $.', '$}'])
+def test_parse_errors(src: str) -> None:
+    with pytest.raises(ValueError):
+        parse_database(src)
+
+
+@pytest.mark.parametrize('name', ['impreflex.mm', 'transfer-goal.mm', 'disjointness-alt-lemma.mm'])
+def test_encode_database(name: str) -> None:
+    input_database = load_database(os.path.join(BENCHMARK_LOCATION, name), include_proof=True)
+    assert decode_database(*encode_database(input_database)) == input_database
+
+
+def test_database_cache(tmp_path: Path) -> None:
+    included = tmp_path / 'included.mm'
+    included.write_text('$c #Pattern \\imp $.\n$v ph0 $.\nph0-is-pattern $f #Pattern ph0 $.\n')
+    main = tmp_path / 'main.mm'
+    main.write_text(f'$[ {included} $]\nimp-is-pattern $a #Pattern ( \\imp ph0 ph0 ) $.\n')
+    cache_dir = tmp_path / 'cache'
+
+    cold = load_database(str(main), cache_dir=cache_dir)
+    assert cold == load_database(str(main))
+    (cache_file,) = cache_dir.glob(f'*{CACHE_SUFFIX}')
+    mtime = cache_file.stat().st_mtime_ns
+    assert load_database(str(main), cache_dir=cache_dir) == cold
+    assert cache_file.stat().st_mtime_ns == mtime
+
+    # Changing an included file invalidates the cache of the main file
+    included.write_text('$c #Pattern \\imp $.\n$v ph0 ph1 $.\nph0-is-pattern $f #Pattern ph0 $.\n')
+    changed = load_database(str(main), cache_dir=cache_dir)
+    assert changed == load_database(str(main)) != cold
+    assert cache_file.stat().st_mtime_ns != mtime
+
+    # Unreadable caches are ignored and overwritten
+    cache_file.write_bytes(b'MMDB garbage')
+    assert load_database(str(main), cache_dir=cache_dir) == changed
+    cache_file.write_bytes(CACHE_MAGIC + marshal.dumps((CACHE_FORMAT_VERSION, b'')))
+    assert load_database(str(main), cache_dir=cache_dir) == changed
+
+
+def test_term_hash_collisions() -> None:
+    term_table = TermTable()
+    load_database(os.path.join(BENCHMARK_LOCATION, 'transfer5000.mm'), term_table=term_table)
+    # Xor-ing the hashes of the subterms gave the 269 distinct terms only 262 distinct hashes
+    assert len({hash(term) for term in term_table}) == len(term_table) == 269
+
+    x, y = Metavariable('x'), Metavariable('y')
+    assert hash(Application('f', (x, x))) != hash(Application('f', (y, y)))
+    assert hash(Application('f', (x, y))) != hash(Application('f', (y, x)))
+
+
+@pytest.mark.parametrize('cached', [False, True])
+def test_term_table(cached: bool, tmp_path: Path) -> None:
+    path = os.path.join(BENCHMARK_LOCATION, 'impreflex.mm')
+    cache_dir = tmp_path if cached else None
+    load_database(path, cache_dir=cache_dir)
+    term_table = TermTable()
+    database = load_database(path, cache_dir=cache_dir, term_table=term_table)
+    assert database == load_database(path)
+
+    terms: dict[str, Term] = {}
+    for statement in database.statements:
+        for substatement in statement.statements if isinstance(statement, Block) else (statement,):
+            if isinstance(substatement, StructuredStatement):
+                for term in substatement.terms:
+                    assert terms.setdefault(str(term), term) is term
+    ph0 = term_table.metavariable('ph0')
+    assert terms['ph0'] is ph0
+    implication = Application('\\imp', (Metavariable('ph0'), Metavariable('ph0')))
+    assert term_table.intern(implication).subterms[0] is ph0
+    assert term_table.application('\\imp', (ph0, ph0)) is term_table.intern(implication)
+
+
+def test_substitute_preserves_identity() -> None:
+    term = parse_term_with_metavariables('( \\imp ph0 ( \\imp ph1 ph0 ) )', frozenset({'ph0', 'ph1'}))
+    assert isinstance(term, Application)
+    assert term.substitute({'ph2': Application('x')}) is term
+    assert term.map_inner(lambda subterm: subterm) is term
+    assert term.bottom_up(lambda subterm: subterm) is term
+
+    substituted = term.substitute({'ph1': Application('x')})
+    assert str(substituted) == '( \\imp ph0 ( \\imp x ph0 ) )'
+    assert substituted.subterms[0] is term.subterms[0]
+
+    database = load_database(os.path.join(BENCHMARK_LOCATION, 'impreflex.mm'))
+    assert database.bottom_up(lambda statement: statement) is database
@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import os
+from io import StringIO
+from typing import TYPE_CHECKING
+
+from proof_generation.metamath.ast import ENCODER_CHUNK_SIZE, Block, Encoder, ProvableStatement, StructuredStatement
+from proof_generation.metamath.graph import LabelGraph
+from proof_generation.metamath.metamath_extract_slice import (
+    Slicing,
+    dependency_graph,
+    scan_database,
+    slice_database,
+    syntax_dependencies,
+    transitive_closure,
+    write_slices,
+)
+from proof_generation.metamath.parser import load_database, parse_database
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+BENCHMARK_LOCATION = 'generation/mm-benchmarks'
+
+
+def test_label_graph() -> None:
+    graph = LabelGraph()
+    graph.add_edges('a', ['b', 'c'])
+    graph.add_edges('b', ['d'])
+    graph.add_edges('c', ['d', 'b'])
+    graph.add_edges('e', ['a'])
+
+    assert graph.reachable(['a']) == {'a', 'b', 'c', 'd'}
+    assert graph.reachable(['d', 'missing']) == {'d', 'missing'}
+    assert graph.closure('a') == {'b', 'c', 'd'}
+    assert graph.closure('d') == frozenset()
+    assert graph.closure('missing') == frozenset()
+
+    order = graph.topological_order()
+    assert sorted(order) == ['a', 'b', 'c', 'd', 'e']
+    for label in order:
+        assert all(order.index(successor) < order.index(label) for successor in graph.get_successors(label))
+    assert graph.topological_order(['c']) == ['d', 'b', 'c']
+
+    # Closures are recomputed when edges are added, also through cycles
+    graph.add_edges('d', ['a'])
+    assert graph.closure('b') == {'a', 'b', 'c', 'd'}
+
+
+def test_syntax_dependencies() -> None:
+    # Every notation uses the previous one twice
+    notations = ['$c #Pattern #Notation #Symbol |- ( ) \\imp sig n0 n1 n2 n3 $.', '$v ph0 $.']
+    notations += ['ph0-is-pattern $f #Pattern ph0 $.', 'sig-is-symbol $a #Symbol sig $.']
+    notations += ['n0-is-pattern $a #Pattern ( n0 ph0 ) $.', 'n0-is-sugar $a #Notation ( n0 ph0 ) ( \\imp ph0 sig ) $.']
+    for i in range(1, 4):
+        notations.append(f'n{i}-is-pattern $a #Pattern ( n{i} ph0 ) $.')
+        notations.append(f'n{i}-is-sugar $a #Notation ( n{i} ph0 ) ( \\imp ( n{i - 1} ph0 ) ( n{i - 1} ph0 ) ) $.')
+    notations.append('lemma $p |- ( n3 ph0 ) $= ( n3-is-pattern ) A $.')
+    notations.append('goal $p |- ( n1 ph0 ) $= ( lemma ) A $.')
+    database = parse_database('\n'.join(notations))
+
+    syntax_deps = syntax_dependencies(database)
+    assert syntax_deps.get_successors('n2-is-sugar') == ['n2-is-pattern', 'n1-is-sugar']
+    assert syntax_deps.closure('lemma') == {'sig-is-symbol'} | {
+        f'n{i}-is-{kind}' for i in range(4) for kind in ('pattern', 'sugar')
+    }
+
+    include = transitive_closure(dependency_graph(database), ['goal'])
+    assert include == {'goal', 'lemma', 'n3-is-pattern'}
+    ((label, lemma_slice),) = slice_database(database, syntax_deps, include, exclude={'goal'})
+    assert label == 'lemma'
+    assert [statement.label for statement in lemma_slice.statements if isinstance(statement, StructuredStatement)] == [
+        'ph0-is-pattern',
+        'sig-is-symbol',
+        *(f'n{i}-is-{kind}' for i in range(4) for kind in ('pattern', 'sugar')),
+    ]
+
+
+def test_slice_transfer() -> None:
+    database = load_database(os.path.join(BENCHMARK_LOCATION, 'transfer-goal.mm'))
+    include = transitive_closure(dependency_graph(database), ['goal'])
+    ((label, goal_slice),) = slice_database(database, syntax_dependencies(database), include, set())
+    assert label == 'goal'
+
+    # The slice is a well-formed database with the same goal, and only statements of the input
+    assert parse_database(Encoder.encode_string(goal_slice)) == goal_slice
+    block = goal_slice.statements[-1]
+    assert isinstance(block, Block)
+    assert block == database.statements[-1]
+    assert isinstance(block.statements[-1], ProvableStatement)
+    labels = {statement.label for statement in database.statements if isinstance(statement, StructuredStatement)}
+    assert {
+        statement.label for statement in goal_slice.statements if isinstance(statement, StructuredStatement)
+    } <= labels
+
+
+def test_encode_chunks() -> None:
+    # Encoded in more than one chunk, with the shared subterms rendered once
+    database = load_database(os.path.join(BENCHMARK_LOCATION, 'transfer-largest-slice.mm'), include_proof=True)
+    output = StringIO()
+    Encoder.encode(output, database)
+    text = output.getvalue()
+    assert len(text) > ENCODER_CHUNK_SIZE
+    assert text == Encoder.encode_string(database)
+    assert parse_database(text) == database
+
+
+def test_write_slices(tmp_path: Path) -> None:
+    # A chain of lemmas, each using the previous one
+    lines = ['$c #Pattern |- ( ) \\imp $.', '$v ph0 ph1 $.', 'ph0-is-pattern $f #Pattern ph0 $.']
+    lines += ['ph1-is-pattern $f #Pattern ph1 $.', 'lemma0 $a |- ph0 $.']
+    for i in range(1, 20):
+        if i == 10:
+            lines.append('$d ph0 ph1 $.')
+        lines.append(f'lemma{i} $p |- ( \\imp ph{i % 2} ph0 ) $= ( lemma{i - 1} ) A $.')
+    lines.append('goal $p |- ph0 $= ( lemma19 ) A $.')
+    database = parse_database('\n'.join(lines))
+    include = transitive_closure(dependency_graph(database), ['goal'])
+    syntax_deps = syntax_dependencies(database)
+    cut_antecedents, targets = scan_database(database, include, set())
+    assert len(targets) == 20
+
+    sequential_dir, parallel_dir = tmp_path / 'sequential', tmp_path / 'parallel'
+    sequential_dir.mkdir()
+    parallel_dir.mkdir()
+    assert write_slices(Slicing(cut_antecedents, syntax_deps, targets, sequential_dir)) == len(targets)
+    assert write_slices(Slicing(cut_antecedents, syntax_deps, targets, parallel_dir), processes=2) == len(targets)
+
+    # The slices are the same as the ones of the generator, whichever the number of processes
+    slices = dict(slice_database(database, syntax_deps, include, set()))
+    assert sorted(path.name for path in parallel_dir.iterdir()) == sorted(label + '.mm' for label in slices)
+    for label, expected in slices.items():
+        text = (sequential_dir / (label + '.mm')).read_text()
+        assert text == (parallel_dir / (label + '.mm')).read_text()
+        assert text == Encoder.encode_string(expected)
+        assert parse_database(text) == expected
+    # Only the disjoints declared before the lemma are in its slice
+    assert '$d' not in (sequential_dir / 'lemma9.mm').read_text()
+    assert '$d ph0 ph1 $.' in (sequential_dir / 'lemma11.mm').read_text()
+
+    # Only the slices whose content changed are rewritten
+    changed = sequential_dir / 'lemma3.mm'
+    changed.write_text('')
+    mtimes = {path.name: path.stat().st_mtime_ns for path in sequential_dir.iterdir()}
+    slicing = Slicing(cut_antecedents, syntax_deps, targets, sequential_dir, changed_only=True)
+    assert write_slices(slicing, processes=2) == 1
+    assert changed.read_text() == Encoder.encode_string(slices['lemma3'])
+    for path in sequential_dir.iterdir():
+        if path != changed:
+            assert path.stat().st_mtime_ns == mtimes[path.name]
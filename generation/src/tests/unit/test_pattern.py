@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import pickle
 from typing import TYPE_CHECKING
 
 import pytest
@@ -258,3 +259,26 @@ def test_instantiate_subst(pattern: Pattern, plugs: dict[int, Pattern], expected
 )
 def test_occurring_vars(pattern: Pattern, expected: set[EVar | SVar]) -> None:
     assert pattern.occurring_vars() == expected
+
+
+def test_instantiate_shares_unchanged_subpatterns() -> None:
+    ground = App(Symbol('f'), Symbol('a'))
+    pattern = Implies(Exists(0, ground), Mu(0, App(MetaVar(0), ground)))
+    instantiated = pattern.instantiate({0: Symbol('b')})
+    assert instantiated == Implies(Exists(0, ground), Mu(0, App(Symbol('b'), ground)))
+    assert isinstance(instantiated, Implies)
+    assert instantiated.left is pattern.left
+    assert pattern.instantiate({1: Symbol('b')}) is pattern
+
+    notation = Instantiate(App(MetaVar(0), MetaVar(1)), frozendict({0: ground, 1: MetaVar(2)}))
+    assert notation.instantiate({3: Symbol('b')}) is notation
+    assert notation.instantiate({2: Symbol('b')}) == App(ground, Symbol('b'))
+
+
+def test_cached_hash() -> None:
+    pattern = Implies(App(Symbol('f'), EVar(0)), MetaVar(0))
+    assert hash(pattern) == hash(Implies(App(Symbol('f'), EVar(0)), MetaVar(0)))
+    assert hash(pattern) == hash(pattern)
+    # The cached hash is neither a field nor pickled
+    assert pattern == Implies(App(Symbol('f'), EVar(0)), MetaVar(0))
+    assert '_hash' not in pickle.loads(pickle.dumps(pattern)).__dict__
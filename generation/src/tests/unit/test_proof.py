@@ -7,6 +7,7 @@ import pytest
 
 from proof_generation.aml import App, ESubst, EVar, Exists, Implies, MetaVar, Mu, PrettyOptions, SVar, Symbol, phi0
 from proof_generation.claim import Claim
+from proof_generation.cost_model import DEFAULT_COST_MODEL
 from proof_generation.deserialize import deserialize_instructions
 from proof_generation.instruction import Instruction
 from proof_generation.interpreter import (
@@ -15,10 +16,13 @@ from proof_generation.interpreter import (
     SerializingInterpreter,
     StatefulInterpreter,
 )
-from proof_generation.proof import ProofExp, ProofThunk, Proved
+from proof_generation.parallel import relocate_proof
+from proof_generation.proof import OutputFormat, ProofExp, ProofThunk, Proved
 from proof_generation.proofs.propositional import Propositional
 
 if TYPE_CHECKING:
+    from pathlib import Path
+
     from proof_generation.proof import Pattern
 
 
@@ -199,3 +203,135 @@ def test_interpreter_proof_state(pats: list[Pattern]) -> None:
     assert [proved.conclusion for proved in interpreter_ser.memory if isinstance(proved, Proved)] == pats
     assert interpreter_ser.claims == []
     assert [proved.conclusion for proved in interpreter_ser.stack if isinstance(proved, Proved)] == pats
+
+
+def test_gamma_phase_diamond_imports() -> None:
+    a, b, c = Symbol('a'), Symbol('b'), Symbol('c')
+    base = ProofExp(axioms=[a])
+    left = ProofExp(axioms=[b])
+    right = ProofExp(axioms=[a, c])
+    left.import_module(base)
+    right.import_module(base)
+    top = ProofExp(axioms=[c])
+    top.import_module(left)
+    top.import_module(right)
+
+    assert top.get_module_dag() == [base, left, right, top]
+    assert top.get_published_axioms() == [a, b, c]
+
+    interpreter = StatefulInterpreter(phase=ExecutionPhase.Gamma)
+    top.execute_gamma_phase(interpreter, False)
+    assert [proved.conclusion for proved in interpreter.memory if isinstance(proved, Proved)] == [a, b, c]
+
+    # Loading an axiom of a shared module refers to its unique slot
+    interpreter.into_claim_phase()
+    interpreter.into_proof_phase()
+    assert right.load_axiom(a)(interpreter).conclusion == a
+    assert interpreter.stack[-1] == Proved(a)
+
+
+def test_relocate_proof() -> None:
+    buffer = bytes(
+        [
+            *(Instruction.Load, 1),  # an axiom
+            *(Instruction.Load, 3),  # saved by the shard
+            *(Instruction.Symbol, 0),
+            *(Instruction.Symbol, 2),
+            *(Instruction.MetaVar, 3, 1, 2, 0, 0, 0, 1, 3),
+            *(Instruction.Instantiate, 2, 3, 2),
+            *(Instruction.Exists, 3),
+            Instruction.Save,
+        ]
+    )
+    relocated = relocate_proof(buffer, memory_base=2, memory_offset=5, symbol_base=1, symbol_map={2: 7})
+    assert relocated[:8] == bytes(
+        [Instruction.Load, 1, Instruction.Load, 8, Instruction.Symbol, 0, Instruction.Symbol, 7]
+    )
+    # Operands of other instructions are never mistaken for memory locations or symbols
+    assert relocated[8:] == buffer[8:]
+
+    with pytest.raises(ValueError):
+        relocate_proof(bytes([Instruction.Load, 3]), memory_base=2, memory_offset=253, symbol_base=0, symbol_map={})
+
+
+class ManyClaims(Propositional):
+    def __init__(self, n: int) -> None:
+        super().__init__()
+        axiom = Symbol('ax')
+        self.add_axiom(axiom)
+        for i in range(n):
+            a, c = Implies(Symbol(f'a{i}'), Symbol(f'a{i}')), Implies(Symbol(f'c{i}'), Symbol(f'c{i}'))
+            # The symbols c{i} only occur in the proofs
+            self.add_claim(a)
+            self.add_proof_expression(
+                self.modus_ponens(
+                    self.modus_ponens(self.prop1_inst(a, c), self.imp_refl(Symbol(f'a{i}'))),
+                    self.imp_refl(Symbol(f'c{i}')),
+                )
+            )
+            self.add_claim(Implies(a, axiom))
+            self.add_proof_expression(self.imp_provable(a, self.load_axiom(axiom)))
+
+
+@pytest.mark.parametrize('optimize', [False, True])
+@pytest.mark.parametrize('jobs', [3, 64])
+def test_serialize_in_parallel(tmp_path: Path, optimize: bool, jobs: int) -> None:
+    proofexp = ManyClaims(5)
+    proofexp.serialize(tmp_path / 'serial', OutputFormat.Binary, optimize)
+    proofexp.serialize(tmp_path / 'parallel', OutputFormat.Binary, optimize, jobs=jobs)
+
+    def read(name: str, suffix: str) -> bytes:
+        return (tmp_path / name).with_suffix(suffix).read_bytes()
+
+    assert read('parallel', '.ml-gamma') == read('serial', '.ml-gamma')
+    assert read('parallel', '.ml-claim') == read('serial', '.ml-claim')
+    if not optimize:
+        # Symbols first used in a later shard get the same identifiers as in the serial proof
+        assert read('parallel', '.ml-proof') == read('serial', '.ml-proof')
+    else:
+        # Every shard saves its own copies of the memoized patterns
+        assert len(read('parallel', '.ml-proof')) >= len(read('serial', '.ml-proof'))
+
+
+@pytest.mark.parametrize('claims_per_part', [1, 3, 10])
+def test_partition_claims(tmp_path: Path, claims_per_part: int) -> None:
+    proofexp = ManyClaims(5)
+    profile = proofexp.cost_profile()
+    costs = [
+        DEFAULT_COST_MODEL.estimate(claim, with_base=False) + DEFAULT_COST_MODEL.estimate(proof, with_base=False)
+        for claim, proof in zip(profile.claims, profile.proofs, strict=True)
+    ]
+    budget = DEFAULT_COST_MODEL.base + sum(sorted(costs)[-claims_per_part:]) + 1
+    parts = proofexp.partition_claims(budget)
+    axiom_claims = [Implies(Implies(Symbol(f'a{i}'), Symbol(f'a{i}')), Symbol('ax')) for i in range(5)]
+
+    assert [claim for part in parts for claim in part.get_claims()] == proofexp.get_claims()
+    assert all(len(part.get_claims()) >= claims_per_part for part in parts[:-1])
+    for i, part in enumerate(parts):
+        assert DEFAULT_COST_MODEL.estimate(part.cost_profile().total()) <= budget
+        # Only the parts proving claims about the axiom keep it
+        uses_axiom = any(claim in axiom_claims for claim in part.get_claims())
+        assert part.get_axioms() == ([Symbol('ax')] if uses_axiom else [])
+        part.serialize(tmp_path / f'part{i}', OutputFormat.Binary, False)
+
+
+def test_partition_claims_over_budget() -> None:
+    # Claims which do not fit the budget on their own are proved separately
+    proofexp = ManyClaims(2)
+    parts = proofexp.partition_claims(0)
+    assert [part.get_claims() for part in parts] == [[claim] for claim in proofexp.get_claims()]
+
+
+@pytest.mark.parametrize('prune_axioms', [False, True])
+def test_prune_axioms(tmp_path: Path, prune_axioms: bool) -> None:
+    used = Implies(Symbol('used'), Symbol('used'))
+    proofexp = ProofExp(axioms=[Symbol('unused'), used, Symbol('also-unused')], claims=[used])
+    proofexp.add_proof_expression(proofexp.load_axiom(used))
+    assert proofexp.get_used_axioms() == [used]
+
+    proofexp.serialize(tmp_path / 'proof', OutputFormat.Binary, False, prune_axioms=prune_axioms)
+    gamma = (tmp_path / 'proof.ml-gamma').read_bytes()
+    proof = (tmp_path / 'proof.ml-proof').read_bytes()
+    # The loaded axiom moves to the first memory location once the others are dropped
+    assert proof == bytes([Instruction.Load, 0 if prune_axioms else 1, Instruction.Publish])
+    assert gamma.count(Instruction.Publish) == (1 if prune_axioms else 3)
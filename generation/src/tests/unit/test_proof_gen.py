@@ -0,0 +1,27 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import pytest
+
+from proof_generation.k.kore_convertion.language_semantics import LanguageSemantics
+from proof_generation.k.proof_gen import run_batch
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_batch_reports_failures(tmp_path: Path, jobs: int) -> None:
+    garbage = tmp_path / 'garbage.hints'
+    garbage.write_bytes(b'not a hints file')
+    missing = tmp_path / 'missing.hints'
+    hints_files = [str(garbage), str(missing), str(garbage)]
+
+    results = run_batch(LanguageSemantics(), 'test', hints_files, str(tmp_path / 'proofs'), jobs=jobs)
+
+    # A failing file neither aborts the batch nor reorders the results
+    assert [result.hints_file for result in results] == hints_files
+    assert not any(result.ok for result in results)
+    assert results[1].error is not None and results[1].error.startswith('FileNotFoundError')
+    assert all(result.time >= 0 for result in results)
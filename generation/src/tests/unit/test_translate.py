@@ -1,25 +1,36 @@
 from __future__ import annotations
 
 import os
+from io import StringIO
 from typing import TYPE_CHECKING
 
 import pytest
 
 from proof_generation.aml import Implies, MetaVar
 from proof_generation.claim import Claim
-from proof_generation.interpreter import ExecutionPhase, StatefulInterpreter
+from proof_generation.deserialize import deserialize_instructions
+from proof_generation.interpreter import ExecutionPhase, PrettyPrintingInterpreter, StatefulInterpreter
+from proof_generation.metamath.ast import AxiomaticStatement, Database
 from proof_generation.metamath.converter.converter import MetamathConverter
 from proof_generation.metamath.converter.representation import AxiomWithAntecedents
 from proof_generation.metamath.parser import load_database
-from proof_generation.metamath.translate import convert_to_implication, exec_proof
-from proof_generation.proof import ProofExp
+from proof_generation.metamath.translate import (
+    ProofOp,
+    TranslatedProofSkeleton,
+    batch_main,
+    compile_proof,
+    convert_to_implication,
+    exec_proof,
+)
+from proof_generation.proof import OutputFormat, ProofExp
 from proof_generation.proved import Proved
 
 if TYPE_CHECKING:
+    from pathlib import Path
+
     from pytest import FixtureRequest
 
     from proof_generation.interpreter import Interpreter
-    from proof_generation.metamath.parser import Database
 
 BENCHMARK_LOCATION = 'generation/mm-benchmarks'
 
@@ -72,6 +83,27 @@ def test_exec_proof_impreflex(db: str, request: FixtureRequest) -> None:
     assert interpreter.stack == [Proved(Implies(MetaVar(0), MetaVar(0)))]
 
 
+@pytest.mark.parametrize('db', ['parsed_impreflex_database', 'parsed_impreflex_compressed_database'])
+def test_compile_proof_impreflex(db: str, request: FixtureRequest) -> None:
+    converter = MetamathConverter(request.getfixturevalue(db))
+    proof = compile_proof(converter, 'imp-reflexivity')
+    assert proof.conclusion == Implies(MetaVar(0), MetaVar(0))
+
+    labels = converter.get_lemma_by_name('imp-reflexivity').proof.labels
+    ops = {
+        'ph0-is-pattern': ProofOp.MetaVar,
+        'imp-is-pattern': ProofOp.Implies,
+        'proof-rule-prop-1': ProofOp.Prop1,
+        'proof-rule-prop-2': ProofOp.Prop2,
+        'proof-rule-mp': ProofOp.ModusPonens,
+    }
+    applied = converter.get_lemma_by_name('imp-reflexivity').proof.applied_lemmas
+    expected = [ProofOp.Save if i == 0 else ops[labels[i]] if i in labels else ProofOp.Load for i in applied]
+    assert [step.op for step in proof.steps] == expected
+    # Labels are resolved once and shared by all of their applications
+    assert len({id(step) for step in proof.steps if step.op == ProofOp.Implies}) == 1
+
+
 @pytest.mark.parametrize('db', ['parsed_transfer_database', 'parsed_transfer_compressed_database'])
 def test_exec_transfer_proof(db: str, request: FixtureRequest) -> None:
     converter = MetamathConverter(request.getfixturevalue(db))
@@ -104,3 +136,122 @@ def test_exec_transfer_proof(db: str, request: FixtureRequest) -> None:
     proofexp.execute_full(interpreter)
 
     assert interpreter.stack == [Proved(converter.get_lemma_by_name('goal').pattern)]
+
+
+def test_lazy_converter(parsed_transfer_compressed_database: Database, tmp_path: Path) -> None:
+    # An axiom the goal does not depend on
+    axioms = [stmt for stmt in parsed_transfer_compressed_database.statements if isinstance(stmt, AxiomaticStatement)]
+    unused = AxiomaticStatement('unused-axiom', axioms[-1].terms)
+    statements = parsed_transfer_compressed_database.statements
+    database = Database((*statements[:-1], unused, statements[-1]))
+
+    eager = MetamathConverter(database)
+    lazy = MetamathConverter(database, lazy=True)
+    assert lazy.lemmas == ()
+
+    outputs = []
+    for converter, name in ((eager, 'eager'), (lazy, 'lazy')):
+        TranslatedProofSkeleton(converter, 'goal').serialize(tmp_path / name, OutputFormat.Binary, False)
+        outputs.append([(tmp_path / name).with_suffix(suffix).read_bytes() for suffix in ('.ml-claim', '.ml-proof')])
+    assert outputs[0] == outputs[1]
+
+    assert 'unused-axiom' in eager.exported_axioms
+    assert 'unused-axiom' not in lazy.axioms
+    assert set(lazy.axioms) < set(eager.axioms)
+    assert lazy.get_lemma_by_name('goal').pattern == eager.get_lemma_by_name('goal').pattern
+
+    # Statements are converted when they are first looked up
+    assert lazy.is_axiom('unused-axiom')
+    assert lazy.get_axiom_by_name('unused-axiom').pattern == eager.get_axiom_by_name('unused-axiom').pattern
+
+
+def test_batch_translate(tmp_path: Path) -> None:
+    inputs = [
+        os.path.join(BENCHMARK_LOCATION, f'{name}.mm') for name in ('impreflex-compressed', 'transfer-task-specific')
+    ]
+    assert batch_main([*inputs, '--output', str(tmp_path / 'batch'), '-j', '2'])
+
+    for path in inputs:
+        database = load_database(path, include_proof=True)
+        converter = MetamathConverter(database)
+        module = os.path.splitext(os.path.basename(path))[0]
+        for target in converter.lemmas:
+            name = module if len(converter.lemmas) == 1 else f'{module}-{target}'
+            TranslatedProofSkeleton(converter, target).serialize(tmp_path / name, OutputFormat.Binary, True)
+            for suffix in ('.ml-gamma', '.ml-claim', '.ml-proof'):
+                batch_output = (tmp_path / 'batch' / name).with_suffix(suffix)
+                assert batch_output.read_bytes() == (tmp_path / name).with_suffix(suffix).read_bytes()
+
+
+@pytest.mark.parametrize('mode', [[], ['--lazy'], ['--cache', 'cache']])
+def test_batch_translate_claims(mode: list[str], tmp_path: Path) -> None:
+    with open(os.path.join(BENCHMARK_LOCATION, 'impreflex.mm')) as mm_file:
+        src = mm_file.read()
+    proof = src[src.index('$= (') :]
+    database = tmp_path / 'lemmas.mm'
+    database.write_text(f'{src}\nimp-reflexivity-2 $p |- ( \\imp ph0 ph0 ) {proof}')
+    mode = [str(tmp_path / arg) if arg == 'cache' else arg for arg in mode]
+    assert batch_main([str(database), '--output', str(tmp_path / 'output'), '-j', '1', *mode])
+
+    # Each output claims only its target, as the checker rejects the claims left unproved
+    for target in ('imp-reflexivity', 'imp-reflexivity-2'):
+        out = StringIO()
+        interpreter = PrettyPrintingInterpreter(ExecutionPhase.Claim, out=out)
+        deserialize_instructions((tmp_path / 'output' / f'lemmas-{target}.ml-claim').read_bytes(), interpreter)
+        assert out.getvalue().count('Publish') == 1
+
+
+def test_batch_translate_missing_target(tmp_path: Path, capsys: pytest.CaptureFixture[str]) -> None:
+    database = os.path.join(BENCHMARK_LOCATION, 'impreflex.mm')
+    argv = [database, '--output', str(tmp_path / 'output'), '--target', 'imp-reflexivity']
+    for mode in ([], ['--cache', str(tmp_path / 'cache')]):
+        assert not batch_main([*argv, '--target', 'imp-reflexivty', *mode])
+        assert 'No input has the lemmas imp-reflexivty' in capsys.readouterr().out
+    assert not any((tmp_path / 'output').iterdir())
+
+
+def test_batch_translate_name_clash(tmp_path: Path, capsys: pytest.CaptureFixture[str]) -> None:
+    with open(os.path.join(BENCHMARK_LOCATION, 'impreflex.mm')) as mm_file:
+        src = mm_file.read()
+    inputs = []
+    for directory in ('a', 'b'):
+        (tmp_path / directory).mkdir()
+        inputs.append(tmp_path / directory / 'impreflex.mm')
+        inputs[-1].write_text(src)
+    assert not batch_main([*map(str, inputs), '--output', str(tmp_path / 'output')])
+    assert 'Several targets would be written to impreflex' in capsys.readouterr().out
+    assert not any((tmp_path / 'output').iterdir())
+
+
+def test_incremental_translate(tmp_path: Path) -> None:
+    with open(os.path.join(BENCHMARK_LOCATION, 'impreflex.mm')) as mm_file:
+        src = mm_file.read()
+    proof = src[src.index('$= (') :]
+    database = tmp_path / 'lemmas.mm'
+    database.write_text(f'{src}\nimp-reflexivity-copy $p |- ( \\imp ph0 ph0 ) {proof}')
+    cache_dir = tmp_path / 'cache'
+    argv = [str(database), '--output', str(tmp_path / 'output'), '--cache', str(cache_dir), '-j', '1']
+
+    def cached() -> dict[str, int]:
+        return {path.name: path.stat().st_mtime_ns for path in cache_dir.iterdir()}
+
+    assert batch_main(argv)
+    first = cached()
+    assert len(first) == 6
+    assert batch_main(argv)
+    assert cached() == first
+
+    # Only the edited lemma is translated again
+    database.write_text(f'{src}\nimp-reflexivity-copy $p |- ( \\imp ph1 ph1 ) {proof}')
+    assert batch_main(argv)
+    second = cached()
+    assert len(second) == 9
+    assert first.items() < second.items()
+
+    # The outputs are those of a lazy translation of the target alone
+    for target in ('imp-reflexivity', 'imp-reflexivity-copy'):
+        converter = MetamathConverter(load_database(str(database), include_proof=True), lazy=True)
+        TranslatedProofSkeleton(converter, target).serialize(tmp_path / target, OutputFormat.Binary, True)
+        for suffix in ('.ml-gamma', '.ml-claim', '.ml-proof'):
+            output = (tmp_path / 'output' / f'lemmas-{target}').with_suffix(suffix)
+            assert output.read_bytes() == (tmp_path / target).with_suffix(suffix).read_bytes()